@@ -1,4 +1,5 @@
 import abc
+import copy
 import logging
 import os
 
@@ -16,6 +17,8 @@ class Module(object, metaclass=abc.ABCMeta):
 
         # Flag specifying whether module is able to resume without clearing output
         # after a preemption ( preemptible instances )
+        # Modules whose define_command() returns an OrderedDict of idempotent stages (stage name -> command)
+        # are always resumable as each stage is only run if it hasn't already completed on the processor
         self.is_resumable = is_resumable
 
         # Initialize the input arguments
@@ -44,7 +47,7 @@ class Module(object, metaclass=abc.ABCMeta):
     def define_command(self):
         pass
 
-    def add_argument(self, key, is_required=False, is_resource=False, default_value=None):
+    def add_argument(self, key, is_required=False, is_resource=False, default_value=None, is_streamable=False):
 
         # Check if the argument key is present or not
         if key in self.arguments:
@@ -58,7 +61,8 @@ class Module(object, metaclass=abc.ABCMeta):
             self.arguments[key] = Argument(key,
                                            is_required=is_required,
                                            is_resource=is_resource,
-                                           default_value=default_value)
+                                           default_value=default_value,
+                                           is_streamable=is_streamable)
 
             # Set the old value to the new argument
             self.arguments[key].set(old_value)
@@ -68,7 +72,8 @@ class Module(object, metaclass=abc.ABCMeta):
             self.arguments[key] = Argument(key,
                                            is_required=is_required,
                                            is_resource=is_resource,
-                                           default_value=default_value)
+                                           default_value=default_value,
+                                           is_streamable=is_streamable)
 
     def add_output(self, key, value, is_path=True, **kwargs):
         if key in self.output:
@@ -118,6 +123,10 @@ class Module(object, metaclass=abc.ABCMeta):
         self.output.clear()
         return self.get_command()
 
+    def is_staged(self, cmd):
+        # Determine whether a command generated by the module is split into stages
+        return isinstance(cmd, dict)
+
     def process_cmd_output(self, out, err):
         # Function to be overriden by inheriting classes that process output from their command to set one of their outputs
         # Example: Module that determines how many lines are in a file
@@ -141,6 +150,16 @@ class Module(object, metaclass=abc.ABCMeta):
 
         return path
 
+    def clone(self, new_id):
+        # Create a lightweight copy of the module with a new id
+        # Static module definition (input/output keys, flags) is shared with the original module
+        # Only per-task state (arguments and output) is copied so the clone can be set independently
+        module_clone = copy.copy(self)
+        module_clone.module_id = new_id
+        module_clone.arguments = {key: copy.copy(arg) for key, arg in self.arguments.items()}
+        module_clone.output = copy.copy(self.output)
+        return module_clone
+
     ############### Getters and setters
     def get_ID(self):
         return self.module_id
@@ -216,13 +235,16 @@ class Module(object, metaclass=abc.ABCMeta):
 
 class Argument(object):
     # Class for holding data and metadata for module input arguments
-    def __init__(self, name, is_required=False, is_resource=False, default_value=None):
+    def __init__(self, name, is_required=False, is_resource=False, default_value=None, is_streamable=False):
 
         self.__name = name
 
         self.__is_required = is_required
         self.__is_resource = is_resource
 
+        # Whether module reads the input file in a way that allows it to be streamed from remote storage
+        self.__is_streamable = is_streamable
+
         self.__default_value = default_value
 
         self.__value = None
@@ -247,3 +269,6 @@ class Argument(object):
 
     def is_resource(self):
         return self.__is_resource
+
+    def is_streamable(self):
+        return self.__is_streamable
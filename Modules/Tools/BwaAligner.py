@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 from Modules import Module
 
 class BwaAligner(Module):
@@ -6,8 +8,8 @@ class BwaAligner(Module):
         self.output_keys = ["bam", "bam_sorted"]
 
     def define_input(self):
-        self.add_argument("R1",             is_required=True)
-        self.add_argument("R2")
+        self.add_argument("R1",             is_required=True, is_streamable=True)
+        self.add_argument("R2",             is_streamable=True)
         self.add_argument("bwa",            is_required=True, is_resource=True)
         self.add_argument("samtools",       is_required=True, is_resource=True)
         self.add_argument("ref",            is_required=True, is_resource=True)
@@ -42,11 +44,18 @@ class BwaAligner(Module):
             align_cmd = '{0} mem -M -R "{1}" -t {2} {3} {4} !LOG2!'.format(
                 bwa, rg_header, nr_cpus, ref, R1)
 
-        # Generating command for converting SAM to BAM
-        sam_to_bam_cmd = "{0} view -uS -@ {1} - !LOG2!".format(samtools, nr_cpus)
+        # Alignment and sorting are run as separate stages so a preempted task doesn't have to re-align the reads
+        # Each stage writes to a temporary file that's only renamed once complete so stages can be safely re-run
+        unsorted_bam = str(bam_out).replace(".sorted.bam", ".unsorted.bam")
+
+        # Generating command for converting SAM to (fast compressed) BAM
+        sam_to_bam_cmd = "{0} view -b -1 -@ {1} -o {2}.tmp - !LOG2!".format(samtools, nr_cpus, unsorted_bam)
 
         # Generating command for sorting BAM
-        bam_sort_cmd = "{0} sort -@ {1} - -o {2} !LOG3!".format(samtools, nr_cpus, bam_out)
+        bam_sort_cmd = "{0} sort -@ {1} {2} -o {3}.tmp.bam !LOG3!".format(samtools, nr_cpus, unsorted_bam, bam_out)
 
-        cmd = "{0} | {1} | {2}".format(align_cmd, sam_to_bam_cmd, bam_sort_cmd)
-        return cmd
+        stages = OrderedDict()
+        stages["align"]     = "{0} | {1} && mv {2}.tmp {2}".format(align_cmd, sam_to_bam_cmd, unsorted_bam)
+        stages["sort"]      = "{0} && mv {1}.tmp.bam {1}".format(bam_sort_cmd, bam_out)
+        stages["cleanup"]   = "rm -f {0}".format(unsorted_bam)
+        return stages
@@ -1,5 +1,6 @@
 from Modules import Module
 import logging
+import os
 
 class Index(Module):
     def __init__(self, module_id, is_docker = False):
@@ -105,8 +106,8 @@ class View(Module):
         self.output_keys = ["bam", "bam_idx", "read_count_file"]
 
     def define_input(self):
-        self.add_argument("bam",            is_required=True)
-        self.add_argument("bam_idx",        is_required=True)
+        self.add_argument("bam",            is_required=True, is_streamable=True)
+        self.add_argument("bam_idx",        is_required=True, is_streamable=True)
         self.add_argument("samtools",       is_required=True, is_resource=True)
         self.add_argument("nr_cpus",        is_required=True, default_value=4)
         self.add_argument("mem",            is_required=True, default_value=6)
@@ -131,6 +132,7 @@ class View(Module):
     def define_command(self):
         # Define command for running samtools view from a platform
         bam             = self.get_argument("bam")
+        bam_idx         = self.get_argument("bam_idx")
         location        = self.get_argument("location")
         samtools        = self.get_argument("samtools")
         nr_cpus         = self.get_argument("nr_cpus")
@@ -145,7 +147,11 @@ class View(Module):
             logging.error("BED file and location can not be provided at the same time. Advise to use either of them.")
 
         # Create base samtools view command
-        cmd = "%s view -@ %d -%s %s" % (samtools, nr_cpus, outfmt, bam)
+        # Pass index explicitly if it isn't next to the bam (e.g. only one of them is streamed)
+        if os.path.dirname(bam) != os.path.dirname(bam_idx):
+            cmd = "%s view -@ %d -%s -X %s %s" % (samtools, nr_cpus, outfmt, bam, bam_idx)
+        else:
+            cmd = "%s view -@ %d -%s %s" % (samtools, nr_cpus, outfmt, bam)
 
         # Add include/exclude flags
         if exclude_flag is not None:
@@ -29,7 +29,8 @@ class Datastore(object):
             logging.error("Cannot set arguments for task '%s' before upstream tasks have completed!" % task_id)
             raise PrematureTaskInputSetError("Cannot set task arguments before a task dependencies have completed!")
 
-        task_module = self.graph.get_tasks(task_id).module
+        task = self.graph.get_tasks(task_id)
+        task_module = task.module
         for input_type, input_arg in task_module.get_arguments().items():
             logging.debug("(%s) Setting arg: %s" % (task_id, input_type))
             val = self.__get_task_arg(task_id, input_type, is_resource=input_arg.is_resource())
@@ -38,6 +39,10 @@ class Datastore(object):
             task_module.set_argument(input_type, val)
             logging.debug("(%s) Arg type: %s, val: %s" % (task_id, input_type, val))
 
+            # Flag remote files the task has asked to stream instead of transferring
+            if input_type in task.get_stream_input_keys():
+                self.__flag_stream_input(task_id, val)
+
         # Re-format nr_cpus, mem
         nr_cpus     = self.__reformat_nr_cpus(task_module.get_argument("nr_cpus"))
         mem         = self.__reformat_mem(task_module.get_argument("mem"), nr_cpus)
@@ -126,6 +131,17 @@ class Datastore(object):
         # Return actual copies so that module paths get updated as they are transferred
         return output_files
 
+    @staticmethod
+    def __flag_stream_input(task_id, val):
+        # Flag files that can be read directly from remote storage
+        # Directories and sets of files sharing a prefix are always transferred
+        for input_file in flatten([val]):
+            if not isinstance(input_file, GAPFile) or input_file.is_flagged("docker"):
+                continue
+            if input_file.is_remote() and input_file.get_containing_dir() is None and not input_file.is_prefix():
+                logging.debug("(%s) Input file will be streamed: %s" % (task_id, input_file.get_path()))
+                input_file.flag("stream")
+
     def __get_task_arg(self, task_id, arg_type, is_resource=False):
         # Return the object that best satisfies the arg_type for a task
 
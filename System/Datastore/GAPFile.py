@@ -1,5 +1,6 @@
 import os
 import logging
+from collections import OrderedDict
 
 class GAPFileMetadataError(Exception):
     # Base class for exception related to trying to access unavailable file metadata
@@ -34,6 +35,10 @@ class GAPFile(object):
         # Sample information
         self.sample_name = kwargs.pop("sample_name", None)
 
+        # Location of the storage holding the file (e.g. bucket region 'US-EAST1' or multi-region 'US')
+        # None if the location is unknown or the file is on local storage
+        self.location = kwargs.pop("location", None)
+
         # Standardize aspects of the resource path provided
         self.__standardize()
 
@@ -108,6 +113,12 @@ class GAPFile(object):
         # Set file size (GB)
         self.size = file_size
 
+    def get_location(self):
+        return self.location
+
+    def set_location(self, location):
+        self.location = location
+
     def flag(self, flag_type):
         if flag_type not in self.flags:
             self.flags.append(flag_type)
@@ -146,6 +157,28 @@ class GAPFile(object):
             self.path = os.path.join(new_dir, self.filename)
         self.__standardize()
 
+    def to_dict(self):
+        # Return json-serializable representation of the file that can be turned back into a GAPFile
+        file_data = OrderedDict()
+        file_data["file_id"]        = self.file_id
+        file_data["type"]           = self.type
+        file_data["path"]           = self.path + "*" if self.__is_prefix else self.path
+        file_data["containing_dir"] = self.containing_dir
+        file_data["size"]           = self.size
+        file_data["sample_name"]    = self.sample_name
+        file_data["location"]       = self.location
+        return file_data
+
+    @staticmethod
+    def from_dict(file_data, file_id=None):
+        # Create GAPFile from its dictionary representation (optionally under a new file id)
+        file_id = file_data["file_id"] if file_id is None else file_id
+        return GAPFile(file_id, file_data["type"], file_data["path"],
+                       containing_dir=file_data["containing_dir"],
+                       file_size=file_data["size"],
+                       sample_name=file_data["sample_name"],
+                       location=file_data.get("location", None))
+
     def __update_containing_dir(self, dest_dir):
         # Updates path assuming entire containing directory has been moved to a new directory
         new_path = os.path.join(dest_dir, self.containing_dir_name)
@@ -178,6 +211,7 @@ class GAPFile(object):
         to_return += "is_remote:\t%s\n" % self.is_remote()
         to_return += "is_prefix:\t%s\n" % self.__is_prefix
         to_return += "size:\t%s\n" % self.size
+        to_return += "location:\t%s\n" % self.location
         to_return += "flags:\t%s\n" % ",".join(self.flags)
         to_return += "=============\n"
         return to_return
@@ -0,0 +1,173 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from System.Datastore import GAPFile
+from System.Datastore.Datastore import flatten
+
+class RunJournal(object):
+    # Durable record of the progress of a pipeline run
+    # Records each task as it completes along with its output and the tasks created when splitter tasks split the graph
+    # so a failed run can be resumed without re-running the tasks that already completed
+
+    DEFAULT_JOURNAL_DIR = "~/.cloudconductor/journals/"
+
+    def __init__(self, pipeline_id, final_output_dir, journal_dir=None):
+
+        # Local file where journal records are appended (one json record per line)
+        journal_dir = self.DEFAULT_JOURNAL_DIR if journal_dir is None else journal_dir
+        self.journal_file = os.path.join(os.path.expanduser(journal_dir), "%s.journal" % pipeline_id)
+
+        # Final output dir of the run (run can only be resumed with the same output dir)
+        self.final_output_dir = final_output_dir
+
+        # Lock for writing records from multiple threads
+        self.journal_lock = threading.Lock()
+
+        # Open journal file (None until journal is started)
+        self.journal = None
+
+        # Ids of tasks already recorded in the journal
+        self.recorded_task_ids = set()
+
+        # Tasks restored from the journal of a previous run
+        self.resumed_tasks = []
+
+    def start(self, resume=False):
+        # Open journal for writing
+        # A new run starts a new journal while a resumed run keeps appending to the previous journal
+        journal_dir = os.path.dirname(self.journal_file)
+        if not os.path.exists(journal_dir):
+            os.makedirs(journal_dir)
+
+        self.journal = open(self.journal_file, "a" if resume else "w")
+        if not resume:
+            self.__write_record(OrderedDict([("event", "start"), ("final_output_dir", self.final_output_dir)]))
+
+    def replay(self, graph):
+        # Restore task completion, task output and graph splits recorded in the journal of a previous run
+        if not os.path.exists(self.journal_file):
+            logging.error("Unable to resume run! No run journal found at '%s'." % self.journal_file)
+            raise IOError("Cannot resume run without a run journal!")
+
+        with open(self.journal_file, "r") as fh:
+            records = [json.loads(line, object_pairs_hook=OrderedDict) for line in fh if line.strip() != ""]
+
+        # Make sure journal belongs to a run writing to the same output directory
+        if len(records) == 0 or records[0]["event"] != "start" \
+                or records[0]["final_output_dir"] != self.final_output_dir:
+            logging.error("Unable to resume run! Run journal '%s' was not created by a run with output dir '%s'."
+                          % (self.journal_file, self.final_output_dir))
+            raise IOError("Cannot resume run from a journal of a different run!")
+
+        for record in records[1:]:
+            task_id = record["task_id"]
+            if task_id not in graph.get_tasks():
+                logging.error("Unable to resume run! Task '%s' in run journal is not in the pipeline graph." % task_id)
+                raise RuntimeError("Run journal does not match pipeline graph!")
+            task = graph.get_tasks(task_id)
+
+            # Restore task output
+            self.__restore_output(task, record["outputs"])
+
+            # Re-create tasks produced by splitting the graph and check they match the tasks created in the previous run
+            if task.is_splitter_task():
+                split_task_ids = graph.split_graph(task_id)
+                if sorted(split_task_ids) != sorted(record["split_task_ids"]):
+                    logging.error("Unable to resume run! Splitting task '%s' created different tasks than in the "
+                                  "previous run." % task_id)
+                    raise RuntimeError("Run journal does not match pipeline graph!")
+
+            graph.set_complete(task_id)
+            self.recorded_task_ids.add(task_id)
+            self.resumed_tasks.append(task)
+
+        logging.info("Resumed %d completed tasks from run journal '%s'." % (len(self.resumed_tasks), self.journal_file))
+
+    def record_task(self, task, split_task_ids=None):
+        # Record that a task completed along with its output and any tasks created by splitting the graph
+        if self.journal is None or task.get_ID() in self.recorded_task_ids:
+            return
+
+        # Output kept on a processor for a child task hasn't been uploaded so task has to be re-run on resume
+        module = task.get_module()
+        for output_file in flatten(module.get_output_values()):
+            if isinstance(output_file, GAPFile) and output_file.is_flagged("handoff"):
+                logging.debug("Task '%s' output not uploaded yet. Task won't be recorded in run journal." % task.get_ID())
+                return
+
+        record = OrderedDict()
+        record["event"]     = "complete"
+        record["task_id"]   = task.get_ID()
+        record["outputs"]   = OrderedDict()
+        if task.is_splitter_task():
+            for split_id, split in module.get_output().items():
+                record["outputs"][split_id] = self.__encode_output(split)["dict"]
+            record["split_task_ids"] = sorted(split_task_ids) if split_task_ids is not None else []
+        else:
+            record["outputs"] = self.__encode_output(module.get_output())["dict"]
+
+        try:
+            self.__write_record(record)
+            self.recorded_task_ids.add(task.get_ID())
+        except BaseException as e:
+            # Pipeline can continue but the task will be re-run if the run is resumed
+            logging.warning("Unable to record task '%s' in run journal!" % task.get_ID())
+            if str(e) != "":
+                logging.warning("Received the following message:\n%s" % e)
+
+    def is_recorded(self, task_id):
+        return task_id in self.recorded_task_ids
+
+    def get_resumed_tasks(self):
+        return self.resumed_tasks
+
+    def get_journal_file(self):
+        return self.journal_file
+
+    def close(self):
+        with self.journal_lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+    def __write_record(self, record):
+        # Append record and force it to disk so it survives the pipeline being killed
+        with self.journal_lock:
+            self.journal.write("%s\n" % json.dumps(record))
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+    def __restore_output(self, task, outputs):
+        module = task.get_module()
+        if task.is_splitter_task():
+            for split_id, split in outputs.items():
+                split = self.__decode_output({"dict": split})
+                module.make_split(split_id, visible_samples=split.pop("visible_samples"))
+                for output_key, output_val in split.items():
+                    module.add_output(split_id, output_key, output_val, is_path=False)
+        else:
+            for output_key, output_val in self.__decode_output({"dict": outputs}).items():
+                module.add_output(output_key, output_val, is_path=False)
+
+    def __encode_output(self, val):
+        # Return json-serializable representation of (nested) module output
+        if isinstance(val, dict):
+            return {"dict": OrderedDict([(key, self.__encode_output(item)) for key, item in val.items()])}
+        if isinstance(val, list):
+            return [self.__encode_output(item) for item in val]
+        if isinstance(val, GAPFile):
+            return {"file": val.to_dict()}
+        return {"value": val}
+
+    def __decode_output(self, val):
+        # Return module output from its json representation
+        if isinstance(val, list):
+            return [self.__decode_output(item) for item in val]
+        if "dict" in val:
+            return OrderedDict([(key, self.__decode_output(item)) for key, item in val["dict"].items()])
+        if "file" in val:
+            return GAPFile.from_dict(val["file"])
+        return val["value"]
@@ -0,0 +1,87 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+class RuntimeHistory(object):
+    # Record of how long each type of module has taken to run in previous pipeline runs
+    # Used by the scheduler to estimate task runtimes when prioritizing tasks
+
+    DEFAULT_HISTORY_FILE = "~/.cloudconductor/runtime_history.json"
+
+    def __init__(self, history_file=None, default_runtime=1.0):
+
+        # Local file where runtime history is persisted between runs
+        history_file = self.DEFAULT_HISTORY_FILE if history_file is None else history_file
+        self.history_file = os.path.expanduser(history_file)
+
+        # Runtime (sec) assumed for modules that have never been run before
+        self.default_runtime = default_runtime
+
+        # Lock for updating history from multiple threads
+        self.history_lock = threading.Lock()
+
+        # Mapping of module name -> {"count": nr of recorded runs, "mean": mean runtime in sec,
+        #                            "families": {machine family -> {"count": ..., "mean": ...}}}
+        self.history = self.__load()
+
+    def get_runtime(self, module_name, machine_family=None):
+        # Return estimated runtime for a module
+        # Runtime on a specific machine family is None if the module has never been run on that family
+        with self.history_lock:
+            if machine_family is not None:
+                record = self.history.get(module_name, {}).get("families", {}).get(machine_family, None)
+                return None if record is None else record["mean"]
+            if module_name not in self.history:
+                return self.default_runtime
+            return self.history[module_name]["mean"]
+
+    def has_runtime(self, module_name):
+        with self.history_lock:
+            return module_name in self.history
+
+    def add_runtime(self, module_name, runtime, machine_family=None):
+        # Update running mean runtime of a module (and of the module on the machine family it ran on, if known)
+        if runtime is None or runtime <= 0:
+            return
+
+        with self.history_lock:
+            if module_name not in self.history:
+                self.history[module_name] = {"count": 0, "mean": 0.0}
+            records = [self.history[module_name]]
+            if machine_family is not None:
+                families = self.history[module_name].setdefault("families", {})
+                records.append(families.setdefault(machine_family, {"count": 0, "mean": 0.0}))
+            for record in records:
+                record["count"] += 1
+                record["mean"] += (runtime - record["mean"]) / record["count"]
+
+    def save(self):
+        # Write runtime history to disk
+        try:
+            history_dir = os.path.dirname(self.history_file)
+            if history_dir != "" and not os.path.exists(history_dir):
+                os.makedirs(history_dir)
+            with self.history_lock:
+                with open(self.history_file, "w") as fh:
+                    json.dump(self.history, fh, indent=4)
+        except BaseException as e:
+            # Losing history shouldn't cause the pipeline to fail
+            logging.warning("Unable to save runtime history to '%s'!" % self.history_file)
+            if str(e) != "":
+                logging.warning("Received the following message:\n%s" % e)
+
+    def __load(self):
+        # Read runtime history from disk if it exists
+        if not os.path.exists(self.history_file):
+            return OrderedDict()
+
+        try:
+            with open(self.history_file, "r") as fh:
+                return json.load(fh, object_pairs_hook=OrderedDict)
+        except BaseException as e:
+            logging.warning("Unable to read runtime history from '%s'! Runtimes will be estimated." % self.history_file)
+            if str(e) != "":
+                logging.warning("Received the following message:\n%s" % e)
+            return OrderedDict()
@@ -0,0 +1,210 @@
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from System.Datastore import GAPFile
+
+class TaskCache(object):
+    # Record of the output produced by tasks in previous pipeline runs
+    # Tasks are identified by a hash of their module, input arguments, input file contents and docker image
+    # so a task can be skipped whenever an identical task has already produced output that still exists
+    # Cache entries are json files stored in any directory the storage helper can access (local dir, bucket, etc.)
+
+    # Arguments that change how fast a task runs but not the output it produces
+    RESOURCE_ARGS = ["nr_cpus", "mem"]
+
+    def __init__(self, cache_dir, storage_helper):
+
+        # Directory where cache entries are stored
+        self.cache_dir = cache_dir.rstrip("/") + "/"
+
+        # Helper for reading/writing cache entries and computing checksums of input files
+        self.storage_helper = storage_helper
+
+        # Lock for updating checksums/statistics from multiple threads
+        self.cache_lock = threading.Lock()
+
+        # Checksums of input files already computed during this run (path -> checksum)
+        self.checksums = {}
+
+        # Cache statistics
+        self.nr_hits            = 0
+        self.nr_misses          = 0
+        self.nr_stored          = 0
+        self.runtime_saved      = 0.0
+        self.cpu_hours_saved    = 0.0
+
+    def create(self):
+        # Create cache directory if it doesn't already exist
+        self.storage_helper.mkdir(dir_path=self.cache_dir, job_name="mkdir_task_cache", wait=True)
+
+    def get_task_key(self, task, docker_image=None):
+        # Return key identifying the output produced by a task (None if task output can't be cached)
+        module = task.get_module()
+
+        # Module class determines the command that's run
+        key_data = OrderedDict()
+        key_data["module"] = "%s.%s" % (module.__class__.__module__, module.__class__.__name__)
+
+        # Argument values and the contents of input files
+        key_data["args"] = OrderedDict()
+        for arg_key, arg in sorted(module.get_arguments().items()):
+            if arg_key in self.RESOURCE_ARGS:
+                continue
+            arg_val = self.__encode_input(arg.get_value())
+            if arg_val is None:
+                return None
+            key_data["args"][arg_key] = arg_val
+
+        # Content of docker image (image name can be re-tagged so use the image id when it's known)
+        if docker_image is not None:
+            digest = docker_image.get_digest()
+            key_data["docker"] = digest if digest is not None else docker_image.get_image_name()
+
+        return hashlib.sha256(json.dumps(key_data).encode("utf8")).hexdigest()
+
+    def load(self, key, task):
+        # Set task output to output recorded for key in a previous run
+        # Return True if output was found and still exists, False otherwise
+        entry = self.__read_entry(key)
+        outputs = None if entry is None else self.__decode_outputs(task, entry["outputs"])
+
+        # Output must still exist as it may have been deleted since it was cached
+        if outputs is not None:
+            for output_file in self.__get_output_files(list(outputs.values())):
+                if not self.storage_helper.path_exists(output_file.get_transferrable_path(), quiet_failure=True):
+                    logging.debug("(%s) Cached output no longer exists: %s" % (task.get_ID(), output_file.get_path()))
+                    outputs = None
+                    break
+
+        # Case: Cache miss
+        if outputs is None:
+            with self.cache_lock:
+                self.nr_misses += 1
+            return False
+
+        # Case: Cache hit
+        module = task.get_module()
+        for output_key, output_val in outputs.items():
+            module.set_output(output_key, output_val)
+
+        with self.cache_lock:
+            self.nr_hits            += 1
+            self.runtime_saved      += entry["runtime"]
+            self.cpu_hours_saved    += entry["runtime"] * entry["nr_cpus"] / 3600.0
+        return True
+
+    def store(self, key, task, runtime, nr_cpus):
+        # Record task output under key so future identical tasks can be skipped
+        entry = OrderedDict()
+        entry["task_id"]    = task.get_ID()
+        entry["module"]     = task.get_module_name()
+        entry["runtime"]    = runtime
+        entry["nr_cpus"]    = nr_cpus
+        entry["outputs"]    = OrderedDict()
+        for output_key, output_val in task.get_module().get_output().items():
+            entry["outputs"][output_key] = self.__encode_output(output_val)
+
+        self.storage_helper.write_file(self.__get_entry_path(key), json.dumps(entry, indent=4),
+                                       job_name="cache_store_%s" % task.get_ID())
+        with self.cache_lock:
+            self.nr_stored += 1
+
+    def get_stats(self):
+        # Return summary of how cache was used during run
+        with self.cache_lock:
+            stats = OrderedDict()
+            stats["cache_dir"]              = self.cache_dir
+            stats["hits"]                   = self.nr_hits
+            stats["misses"]                 = self.nr_misses
+            stats["stored"]                 = self.nr_stored
+            stats["runtime_saved(sec)"]     = self.runtime_saved
+            stats["cpu_hours_saved"]        = self.cpu_hours_saved
+            return stats
+
+    def __get_entry_path(self, key):
+        return "%s%s.json" % (self.cache_dir, key)
+
+    def __read_entry(self, key):
+        # Return cache entry for key (None if there's no entry)
+        entry_path = self.__get_entry_path(key)
+        if not self.storage_helper.path_exists(entry_path, quiet_failure=True):
+            return None
+        try:
+            return json.loads(self.storage_helper.read_file(entry_path, job_name="cache_read_%s" % key),
+                              object_pairs_hook=OrderedDict)
+        except BaseException as e:
+            logging.warning("Unable to read task cache entry '%s'!" % entry_path)
+            if str(e) != "":
+                logging.warning("Received the following message:\n%s" % e)
+            return None
+
+    def __get_checksum(self, path):
+        # Return checksum of a file's contents (computed once per run)
+        with self.cache_lock:
+            if path in self.checksums:
+                return self.checksums[path]
+
+        checksum = self.storage_helper.get_checksum(path)
+        with self.cache_lock:
+            self.checksums[path] = checksum
+        return checksum
+
+    def __encode_input(self, val):
+        # Return json-serializable representation of an argument value (None if value can't be cached)
+        if isinstance(val, list):
+            encoded = [self.__encode_input(item) for item in val]
+            return None if None in encoded else encoded
+
+        if isinstance(val, GAPFile):
+            # Resources inside docker images are identified by the image itself
+            if val.is_flagged("docker"):
+                return {"docker_path": val.get_path()}
+
+            # Output kept on a parent task's processor isn't accessible to the helper processor
+            if val.is_flagged("handoff"):
+                return None
+
+            # File names still matter as modules may name their output after their input
+            return {"filename": val.get_filename(),
+                    "checksum": self.__get_checksum(val.get_transferrable_path())}
+
+        return {"value": val if isinstance(val, (str, int, float, bool)) or val is None else str(val)}
+
+    def __encode_output(self, val):
+        # Return json-serializable representation of a module output
+        if isinstance(val, list):
+            return [self.__encode_output(item) for item in val]
+
+        if isinstance(val, GAPFile):
+            return {"file": val.to_dict()}
+
+        return {"value": val}
+
+    def __decode_outputs(self, task, outputs):
+        # Return module outputs recorded in a cache entry (None if outputs don't match the module)
+        module = task.get_module()
+        for output_key in outputs:
+            if output_key not in module.get_output_types():
+                return None
+
+        def decode(_key, _val):
+            if isinstance(_val, list):
+                return [decode(_key, _item) for _item in _val]
+            if "value" in _val:
+                return _val["value"]
+            return GAPFile.from_dict(_val["file"], file_id="%s.%s" % (module.get_ID(), _key))
+
+        return OrderedDict([(key, decode(key, val)) for key, val in outputs.items()])
+
+    def __get_output_files(self, outputs):
+        # Return flat list of the files in a list of (nested) outputs
+        output_files = []
+        for output in outputs:
+            if isinstance(output, list):
+                output_files.extend(self.__get_output_files(output))
+            elif isinstance(output, GAPFile):
+                output_files.append(output)
+        return output_files
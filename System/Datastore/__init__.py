@@ -1,4 +1,7 @@
 from .GAPFile import GAPFile
 from .Datastore import Datastore
 from .ResourceKit import ResourceKit
-from .SampleSet import SampleSet
\ No newline at end of file
+from .SampleSet import SampleSet
+from .RuntimeHistory import RuntimeHistory
+from .TaskCache import TaskCache
+from .RunJournal import RunJournal
@@ -4,7 +4,7 @@ import json
 from collections import OrderedDict
 
 from System.Graph import Graph, Scheduler
-from System.Datastore import ResourceKit, SampleSet, Datastore
+from System.Datastore import ResourceKit, SampleSet, Datastore, RuntimeHistory, TaskCache, RunJournal
 from System.Validators import GraphValidator, InputValidator, SampleValidator
 from System.Platform import StorageHelper, DockerHelper
 
@@ -16,7 +16,9 @@ class GAPipeline(object):
                  sample_data_config,
                  platform_config,
                  platform_module,
-                 final_output_dir):
+                 final_output_dir,
+                 full_graph_validation=False,
+                 resume=False):
 
         # GAP run id
         self.pipeline_id    = pipeline_id
@@ -33,6 +35,12 @@ class GAPipeline(object):
         # Final output directory where output is saved
         self.__final_output_dir     = final_output_dir
 
+        # Whether to re-validate the entire graph after each split (debugging only)
+        self.__full_graph_validation = full_graph_validation
+
+        # Whether to resume a previous run from the tasks it completed
+        self.__resume = resume
+
         # Obtain pipeline name and append to final output dir
 
         self.graph          = None
@@ -46,6 +54,15 @@ class GAPipeline(object):
         # Task scheduler for running jobs
         self.scheduler = None
 
+        # Module runtimes from previous runs used to prioritize tasks
+        self.runtime_history = None
+
+        # Output of tasks from previous runs used to skip already-computed tasks (None if disabled)
+        self.task_cache = None
+
+        # Record of completed tasks used to resume the run if it fails
+        self.run_journal = None
+
         # Helper processor for handling platform operations
         self.helper_processor   = None
         self.storage_helper     = None
@@ -60,16 +77,25 @@ class GAPipeline(object):
         self.sample_data = SampleSet(self.__sample_set_config)
 
         # Load the graph
-        self.graph = Graph(self.__graph_config)
+        self.graph = Graph(self.__graph_config, full_validation=self.__full_graph_validation)
 
         # Load platform
         plat_module     = importlib.import_module(self.__plat_module)
         plat_class      = plat_module.__dict__[self.__plat_module]
         self.platform   = plat_class(self.pipeline_id, self.__platform_config, self.__final_output_dir)
 
+        # Restore tasks completed by the previous run and continue recording task completion
+        self.run_journal = RunJournal(self.pipeline_id, self.__final_output_dir)
+        if self.__resume:
+            self.run_journal.replay(self.graph)
+        self.run_journal.start(resume=self.__resume)
+
         # Create datastore and scheduler
         self.datastore = Datastore(self.graph, self.resource_kit, self.sample_data, self.platform)
-        self.scheduler = Scheduler(self.graph, self.datastore, self.platform)
+        self.runtime_history = RuntimeHistory(self.platform.config.get("runtime_history_file", None))
+        self.platform.set_runtime_history(self.runtime_history)
+        self.scheduler = Scheduler(self.graph, self.datastore, self.platform, self.runtime_history,
+                                   run_journal=self.run_journal)
 
     def validate(self):
 
@@ -116,11 +142,22 @@ class GAPipeline(object):
         workspace = self.datastore.get_task_workspace()
         for dir_type, dir_path in workspace.get_workspace().items():
             self.storage_helper.mkdir(dir_path=str(dir_path), job_name="mkdir_%s" % dir_type, wait=True)
+
+        # Create task cache if tasks should be skipped when their output already exists
+        task_cache_dir = self.platform.config.get("task_cache_dir", None)
+        if task_cache_dir is not None:
+            self.task_cache = TaskCache(task_cache_dir, self.storage_helper)
+            self.task_cache.create()
+            self.scheduler.set_task_cache(self.task_cache)
         logging.info("CloudCounductor run validated! Beginning pipeline execution.")
 
     def run(self, rm_tmp_output_on_success=True):
         # Run until all tasks are complete
-        self.scheduler.run()
+        try:
+            self.scheduler.run()
+        finally:
+            # Record task runtimes to prioritize tasks in future runs
+            self.__update_runtime_history()
 
         # Remove temporary output on success
         if rm_tmp_output_on_success:
@@ -133,7 +170,24 @@ class GAPipeline(object):
                     logging.error("Received the following err message:\n%s" % e)
 
     def save_progress(self):
-        pass
+        # Make sure every completed task is in the run journal so the run can be resumed
+        if self.run_journal is None:
+            return
+
+        try:
+            if self.scheduler is not None:
+                for task_id, task_worker in self.scheduler.get_task_workers().items():
+                    task = task_worker.get_task()
+                    # Splitters are recorded along with the graph split so they can't be recorded afterwards
+                    if task.is_complete() and not task.is_splitter_task():
+                        self.run_journal.record_task(task)
+            self.run_journal.close()
+            logging.info("Pipeline progress saved to '%s'. Re-run with '--resume' to continue from the last "
+                         "completed tasks." % self.run_journal.get_journal_file())
+        except BaseException as e:
+            logging.error("Unable to save pipeline progress!")
+            if str(e) != "":
+                logging.error("Received the following message:\n%s" % e)
 
     def publish_report(self, err=False, err_msg=None, git_version=None):
         # Create and publish GAP pipeline report
@@ -158,10 +212,22 @@ class GAPipeline(object):
                 if str(e) != "":
                     logging.error("Received the follwoing err message:\n%s" % e)
 
+        # Close the run journal
+        if self.run_journal is not None:
+            self.run_journal.close()
+
         # Cleaning up the platform (let the platform decide what that means)
         if self.platform is not None:
             self.platform.clean_up()
 
+    def __update_runtime_history(self):
+        # Add runtimes of successfully completed tasks to runtime history
+        for task_id, task_worker in self.scheduler.get_task_workers().items():
+            if task_worker.is_success():
+                self.runtime_history.add_runtime(task_worker.get_task().get_module_name(), task_worker.get_runtime(),
+                                                 machine_family=task_worker.get_machine_family())
+        self.runtime_history.save()
+
     def __make_pipeline_report(self, err, err_msg, git_version):
 
         # Create a pipeline report that summarizes features of pipeline
@@ -171,10 +237,41 @@ class GAPipeline(object):
         if self.helper_processor is not None:
             report.set_start_time(self.helper_processor.get_start_time())
             report.set_total_runtime(self.helper_processor.get_runtime())
+            helper_data = {}
+            if self.helper_processor.get_boot_latency() is not None:
+                helper_data["boot_latency(sec)"] = self.helper_processor.get_boot_latency()
             report.register_task(task_name="Helper",
                                  start_time=self.helper_processor.get_start_time(),
                                  run_time=self.helper_processor.get_runtime(),
-                                 cost=self.helper_processor.compute_cost())
+                                 cost=self.helper_processor.compute_cost(),
+                                 task_data=helper_data)
+
+        # Register time/cost of task processors sitting idle in the platform's processor pool
+        if self.platform is not None and self.platform.pool_size > 0:
+            pool_stats = self.platform.get_processor_pool_stats()
+            report.set_processor_pool_stats(pool_stats)
+            report.register_task(task_name="ProcessorPool",
+                                 start_time=None,
+                                 run_time=pool_stats["idle_time(sec)"],
+                                 cost=pool_stats["idle_cost"])
+
+        # Register cost of shared host processors not charged to the tasks packed onto them
+        if self.platform is not None and self.platform.packing_max_task_cpus > 0:
+            packing_stats = self.platform.get_packing_stats()
+            report.set_packing_stats(packing_stats)
+            report.register_task(task_name="ProcessorHosts",
+                                 start_time=None,
+                                 run_time=0,
+                                 cost=packing_stats["unused_host_cost"])
+
+        # Register number of tasks skipped and processing time saved by the task cache
+        if self.task_cache is not None:
+            report.set_task_cache_stats(self.task_cache.get_stats())
+
+        # Register output of tasks completed by the previous run of a resumed pipeline
+        if self.run_journal is not None and self.datastore is not None:
+            for task in self.run_journal.get_resumed_tasks():
+                self.__register_output_files(report, task, err)
 
         # Register runtime data for pipeline tasks
         if self.scheduler is not None:
@@ -188,6 +285,14 @@ class GAPipeline(object):
                 start_time  = task_worker.get_start_time()
                 cmd         = task_worker.get_cmd()
                 task_data   = {"parent_task" : task_name.split(".")[0]}
+                if self.task_cache is not None:
+                    task_data["cached"] = task_worker.is_cache_hit()
+                if task_worker.get_boot_latency() is not None:
+                    task_data["boot_latency(sec)"] = task_worker.get_boot_latency()
+                input_egress = task_worker.get_input_egress()
+                if input_egress is not None:
+                    task_data["input_egress(GB)"]   = input_egress[0]
+                    task_data["input_egress_cost"]  = input_egress[1]
                 report.register_task(task_name=task_name,
                                      start_time=start_time,
                                      run_time=run_time,
@@ -196,20 +301,26 @@ class GAPipeline(object):
                                      task_data=task_data)
 
                 # Register data about task output files
-                if task.is_complete():
-                    output_files = self.datastore.get_task_output_files(task_id=task_name)
-                    for output_file in output_files:
-                        file_type       = output_file.get_type()
-                        file_path       = output_file.get_path()
-                        is_final_output = file_type in task.get_final_output_keys()
-                        file_size       = output_file.get_size()
-                        if is_final_output or err:
-                            # Only declare output files if file is final output file
-                            # OR file is temporary output file but pipeline failed
-                            report.register_output_file(task_name, file_type, file_path, file_size, is_final_output)
+                self.__register_output_files(report, task, err)
 
         return report
 
+    def __register_output_files(self, report, task, err):
+        # Register output files of a completed task in the pipeline report
+        if not task.is_complete():
+            return
+
+        output_files = self.datastore.get_task_output_files(task_id=task.get_ID())
+        for output_file in output_files:
+            file_type       = output_file.get_type()
+            file_path       = output_file.get_path()
+            is_final_output = file_type in task.get_final_output_keys()
+            file_size       = output_file.get_size()
+            if is_final_output or err:
+                # Only declare output files if file is final output file
+                # OR file is temporary output file but pipeline failed
+                report.register_output_file(task.get_ID(), file_type, file_path, file_size, is_final_output)
+
 
 class GAPReport(object):
     # Object for holding metadata related to a GAP pipeline run
@@ -239,6 +350,15 @@ class GAPReport(object):
         # Processors used by modules
         self.tasks = []
 
+        # Statistics on reuse of idle task processors
+        self.processor_pool_stats = None
+
+        # Statistics on packing small tasks onto shared host processors
+        self.packing_stats = None
+
+        # Statistics on tasks skipped because their output was found in the task cache
+        self.task_cache_stats = None
+
     @property
     def total_processing_time(self):
         proc_time = 0
@@ -295,6 +415,15 @@ class GAPReport(object):
                     proc_data[key] = val
         self.tasks.append(proc_data)
 
+    def set_processor_pool_stats(self, pool_stats):
+        self.processor_pool_stats = pool_stats
+
+    def set_packing_stats(self, packing_stats):
+        self.packing_stats = packing_stats
+
+    def set_task_cache_stats(self, task_cache_stats):
+        self.task_cache_stats = task_cache_stats
+
     def register_output_file(self, task_name, file_type, path, size=0, is_final_output=False):
         logging.debug("Task report(%s). file_type: %s, path: %s, size: %s" % (task_name, file_type, path, size))
         file_data = {"task_id" : task_name,
@@ -316,6 +445,12 @@ class GAPReport(object):
         report["total_output_size"] = self.total_output_size
         report["files"] = self.output_files
         report["tasks"] = self.tasks
+        if self.processor_pool_stats is not None:
+            report["processor_pool"] = self.processor_pool_stats
+        if self.packing_stats is not None:
+            report["task_packing"] = self.packing_stats
+        if self.task_cache_stats is not None:
+            report["task_cache"] = self.task_cache_stats
         return report
 
     def __str__(self):
@@ -6,7 +6,7 @@ from System.Graph import Task
 
 class Graph(object):
 
-    def __init__(self, pipeline_config_file):
+    def __init__(self, pipeline_config_file, full_validation=False):
 
         # Parse and validate pipeline config
         pipeline_config_spec    = "System/Graph/Graph.validate"
@@ -16,6 +16,15 @@ class Graph(object):
         # Generate graph
         self.tasks, self.adj_list = self.__generate_graph()
 
+        # Reverse adjacency index (task -> ordered set of children) and per-task number of incomplete parents
+        self.child_list, self.incomplete_parents = self.__index_graph()
+
+        # Number of tasks that haven't been completed
+        self.num_unfinished = len([task for task in self.tasks.values() if not task.is_complete()])
+
+        # Debug flag for re-validating the entire graph after each split instead of only the altered subgraph
+        self.full_validation = full_validation
+
         # Check validity of adjacency list
         self.__check_adjacency_list()
 
@@ -31,6 +40,12 @@ class Graph(object):
         # Add new node to nodelist
         self.tasks[task.get_ID()] = task
         self.adj_list[task.get_ID()] = []
+        self.child_list[task.get_ID()] = OrderedDict()
+        self.incomplete_parents[task.get_ID()] = 0
+
+        # Update number of unfinished tasks
+        if not task.is_complete():
+            self.num_unfinished += 1
 
     def remove_task(self, task_id):
         # Remove node and all edges from Graph
@@ -39,13 +54,24 @@ class Graph(object):
             raise RuntimeError("Graph Error: Attempt to remove non-existant task from graph!")
 
         # Remove node from vertice list
-        self.tasks.pop(task_id)
-        self.adj_list.pop(task_id)
+        task = self.tasks.pop(task_id)
+        parents = self.adj_list.pop(task_id)
+        children = self.child_list.pop(task_id)
+        self.incomplete_parents.pop(task_id)
+
+        # Update number of unfinished tasks
+        if not task.is_complete():
+            self.num_unfinished -= 1
+
+        # Remove all references to node in adjacency indexes
+        for parent_id in parents:
+            if parent_id in self.child_list:
+                self.child_list[parent_id].pop(task_id, None)
 
-        # Remove all references to node in adjacency list
-        for adj_list in self.adj_list.values():
-            if task_id in adj_list:
-                adj_list.remove(task_id)
+        for child_id in children:
+            self.adj_list[child_id].remove(task_id)
+            if not task.is_complete():
+                self.incomplete_parents[child_id] -= 1
 
     def add_dependency(self, child_task_id, parent_task_id):
         # Adds dependency where dep_nod_id must wait until ind_node_id is finished
@@ -56,8 +82,17 @@ class Graph(object):
             logging.error("Unable to add dependency to graph! Unknown task: %s!" % parent_task_id)
             raise RuntimeError("Attempt to add edge between non-existant tasks!")
 
+        # Edge already exists (e.g. splitter connected to the same closing merger for each split)
+        if child_task_id in self.child_list[parent_task_id]:
+            return
+
         # Add dependency
         self.adj_list[child_task_id].append(parent_task_id)
+        self.child_list[parent_task_id][child_task_id] = None
+
+        # Child must wait for parent if parent hasn't been completed
+        if not self.tasks[parent_task_id].is_complete():
+            self.incomplete_parents[child_task_id] += 1
 
     def get_tasks(self, task_id=None):
         if task_id is None:
@@ -71,11 +106,7 @@ class Graph(object):
         if task_id not in self.tasks:
             logging.error("Cannot list children for non-existant task: %s" % task_id)
             raise RuntimeError("Graph Error: Attempt to get children from nonexistant task!")
-        dependents = []
-        for task, edges in self.adj_list.items():
-            if task_id in edges:
-                dependents.append(task)
-        return dependents
+        return list(self.child_list[task_id].keys())
 
     def get_parents(self, task_id):
         if task_id not in self.tasks:
@@ -83,18 +114,39 @@ class Graph(object):
             raise RuntimeError("Graph Error: Attempt to get parents from nonexistant task!")
         return [x for x in self.adj_list[task_id]]
 
+    def set_complete(self, task_id):
+        # Mark task as complete and update readiness of its children
+        task = self.tasks[task_id]
+        if task.is_complete():
+            return
+
+        task.set_complete(is_complete=True)
+        self.num_unfinished -= 1
+        for child_id in self.child_list[task_id]:
+            self.incomplete_parents[child_id] -= 1
+
     def is_complete(self):
-        return len(self.get_unfinished_tasks()) < 1
+        return self.num_unfinished < 1
 
     def parents_complete(self, task_id):
         # Determine if all task parents have completed
-        parents = self.get_parents(task_id)
-        return len(parents) == len([x for x in parents if self.get_tasks(x).is_complete()])
+        if task_id not in self.tasks:
+            logging.error("Cannot check parents for non-existant task: %s" % task_id)
+            raise RuntimeError("Graph Error: Attempt to check parents of nonexistant task!")
+        return self.incomplete_parents[task_id] == 0
 
     def split_graph(self, splitter_task_id):
         # Recursively split tasks downstream of 'head_task' until a closing merge is reached
+        # Returns the IDs of the split tasks that were created
         child_tasks = self.get_children(splitter_task_id)
         splitter_task = self.tasks[splitter_task_id]
+
+        # IDs of split tasks created and tasks deprecated during the current split
+        split_task_ids = set()
+        deprecated_task_ids = OrderedDict()
+
+        # IDs of tasks that received an edge from the splitter (split tasks or closing mergers)
+        splitter_child_ids = OrderedDict()
         for split_id in splitter_task.module.get_output():
             # Create new graph partition for each new split
             split = splitter_task.module.get_output(split_id=split_id)
@@ -102,11 +154,14 @@ class Graph(object):
             # If no visible samples declared, split nodes inherit visible samples from splitter task
             visible_samples = split["visible_samples"] if split["visible_samples"] is not None else splitter_task.get_visible_samples()
             for child_task in child_tasks:
-                child_split = self.__split_subgraph(child_task, splitter_task_id, split_id, visible_samples)
+                child_split = self.__split_subgraph(child_task, splitter_task_id, split_id, visible_samples,
+                                                    split_task_ids=split_task_ids,
+                                                    deprecated_task_ids=deprecated_task_ids)
                 self.add_dependency(child_split, splitter_task_id)
+                splitter_child_ids[child_split] = None
 
         # Loop through deprecated tasks and give upstream dependencies for parent tasks that weren't in splitter's subtree
-        for task in self.__deprecated_tasks:
+        for task in deprecated_task_ids:
             # Get parents of deprecated task
             parents = self.get_parents(task)
             for parent in parents:
@@ -121,15 +176,24 @@ class Graph(object):
             #self.remove_task(task)
 
             # Set deprecated task to complete so it doesn't get run
-            self.tasks[task].set_complete(is_complete=True)
-
-            # Make sure graph structure is still valid
-            self.__check_adjacency_list()
-            self.__check_cycles()
-
-    @property
-    def __deprecated_tasks(self):
-        return [task.get_ID() for task in list(self.tasks.values()) if task.is_deprecated()]
+            self.set_complete(task)
+
+        # Make sure graph structure is still valid
+        if self.full_validation:
+            self.__check_adjacency_list(runtime=True)
+            self.__check_cycles(runtime=True)
+        else:
+            # Only new split tasks, closing mergers connected to the splitter and children of deprecated tasks
+            # (e.g. closing mergers further downstream) received new edges
+            altered_task_ids = OrderedDict.fromkeys(split_task_ids)
+            altered_task_ids.update(splitter_child_ids)
+            for task in deprecated_task_ids:
+                for child_task_id in self.child_list[task]:
+                    altered_task_ids[child_task_id] = None
+            self.__check_adjacency_list(runtime=True, task_ids=altered_task_ids)
+            self.__check_cycles(runtime=True, task_ids=altered_task_ids)
+
+        return list(split_task_ids)
 
     def __generate_graph(self):
 
@@ -143,9 +207,35 @@ class Graph(object):
 
         return tasks, adj_list
 
-    def __check_adjacency_list(self, runtime=False):
+    def __index_graph(self):
+        # Build reverse adjacency index and count incomplete parents of each task
+        child_list          = OrderedDict()
+        incomplete_parents  = OrderedDict()
+
+        for task_id in self.tasks:
+            child_list[task_id]         = OrderedDict()
+            incomplete_parents[task_id] = 0
+
+        for task_id, parents in self.adj_list.items():
+            for parent_id in parents:
+                # Undeclared parents are reported by the adjacency list check
+                if parent_id not in self.tasks:
+                    continue
+                # Duplicate parents are reported by the adjacency list check and only counted once
+                if task_id in child_list[parent_id]:
+                    continue
+                child_list[parent_id][task_id] = None
+                if not self.tasks[parent_id].is_complete():
+                    incomplete_parents[task_id] += 1
+
+        return child_list, incomplete_parents
+
+    def __check_adjacency_list(self, runtime=False, task_ids=None):
+        # Check input tasks of every task or only of the tasks in 'task_ids'
+        task_ids = self.adj_list.keys() if task_ids is None else task_ids
         errors = False
-        for task, adj_tasks in self.adj_list.items():
+        for task in task_ids:
+            adj_tasks = self.adj_list[task]
 
             # Enforce uniqueness of task inputs. Duplicate entries are probably a mistake so better to just throw error
             if len(adj_tasks) != len(set(adj_tasks)):
@@ -168,9 +258,14 @@ class Graph(object):
             else:
                 raise RuntimeError("Runtime graph alteration resulted in invalid graph!")
 
-    def __split_subgraph(self, task_id, splitter_task_id, split_id, visible_samples, level=1, split_task_ids=[]):
+    def __split_subgraph(self, task_id, splitter_task_id, split_id, visible_samples, level=1,
+                         split_task_ids=None, deprecated_task_ids=None):
         # Recursively split subgraph that depends on 'task'
 
+        # IDs of tasks created/deprecated so far in the current split
+        split_task_ids = set() if split_task_ids is None else split_task_ids
+        deprecated_task_ids = OrderedDict() if deprecated_task_ids is None else deprecated_task_ids
+
         task = self.tasks[task_id]
 
         if task.is_merger_task():
@@ -192,6 +287,7 @@ class Graph(object):
         # Can happen if two tasks in split subtree have same child
         if split_task.get_ID() in split_task_ids:
             task.deprecate()
+            deprecated_task_ids[task_id] = None
             return split_task.get_ID()
 
         # Add newly created task to existing graph and clone parental dependencies
@@ -199,55 +295,69 @@ class Graph(object):
 
         # Mark original task as deprecated so it can be discarded
         task.deprecate()
+        deprecated_task_ids[task_id] = None
 
-        # Add new task ID to list of ids in current split
-        split_task_ids.append(split_task.get_ID())
+        # Add new task ID to set of ids in current split
+        split_task_ids.add(split_task.get_ID())
 
         # Create dependencies between current task and splits created for each child task
         child_tasks = self.get_children(task_id)
         for child_task in child_tasks:
             # Split each child subgraph
-            child_split = self.__split_subgraph(child_task, splitter_task_id, split_id, visible_samples, level, split_task_ids)
+            child_split = self.__split_subgraph(child_task, splitter_task_id, split_id, visible_samples, level,
+                                                split_task_ids, deprecated_task_ids)
             # Connect task to split child subgraph
             self.add_dependency(child_split, split_task.get_ID())
 
         # Return split task
         return split_task.get_ID()
 
-    def __check_cycles(self, runtime=False):
-        # Taken with modification from https://www.geeksforgeeks.org/detect-cycle-in-a-graph/
+    def __check_cycles(self, runtime=False, task_ids=None):
+        # Iterative depth-first search over the child index
+        # Adapted from https://www.geeksforgeeks.org/detect-cycle-in-a-graph/
+        # If 'task_ids' is given, only the subgraph reachable from those tasks is searched.
+        # Any new cycle must pass through the child end of a new edge so searching from those tasks is sufficient.
+        task_ids = self.tasks.keys() if task_ids is None else task_ids
         cycle = False
-        visited = []
-        recStack = []
-        for task_id in list(self.tasks.keys()):
+        visited = set()
+        for task_id in task_ids:
             if task_id not in visited:
-                if self.__is_cycle(task_id, visited, recStack):
+                if self.__is_cycle(task_id, visited):
                     cycle = True
+                    break
         if cycle:
             if not runtime:
                 raise IOError("Incorrect pipeline graph: Cycle detected!")
             else:
                 raise RuntimeError("Runtime graph alteration resulted in invalid graph: Cycle detected!")
 
-    def __is_cycle(self, task_id, visited, recStack):
-
-        # Mark current task as visited
-        visited.append(task_id)
-        # Add current task to current recursion stack
-        recStack.append(task_id)
-
-        # Check if any subgraph of current task contains a cycle
-        neighbors = self.get_children(task_id)
-        for neighbor_id in neighbors:
-            if neighbor_id not in visited:
-                if self.__is_cycle(neighbor_id, visited, recStack):
+    def __is_cycle(self, task_id, visited):
+
+        # Tasks on the current DFS path
+        rec_stack = set()
+
+        # Mark start task as visited and add it to current path
+        visited.add(task_id)
+        rec_stack.add(task_id)
+
+        # Stack of (task, iterator over task's children)
+        stack = [(task_id, iter(self.child_list[task_id]))]
+        while len(stack) > 0:
+            curr_task_id, children = stack[-1]
+            for neighbor_id in children:
+                if neighbor_id not in visited:
+                    # Descend into child subgraph
+                    visited.add(neighbor_id)
+                    rec_stack.add(neighbor_id)
+                    stack.append((neighbor_id, iter(self.child_list[neighbor_id])))
+                    break
+                elif neighbor_id in rec_stack:
+                    logging.error("Incorrect pipeline graph: Cycle detected that includes task '%s'!" % curr_task_id)
                     return True
-            elif neighbor_id in recStack:
-                logging.error("Incorrect pipeline graph: Cycle detected that includes task '%s'!" % task_id)
-                return True
-
-        # Pop current task from recursion stack
-        recStack.remove(task_id)
+            else:
+                # All children explored so pop current task from path
+                stack.pop()
+                rec_stack.discard(curr_task_id)
         return False
 
     def __str__(self):
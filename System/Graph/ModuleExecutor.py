@@ -1,59 +1,83 @@
 import logging
 import os
+import queue
+import threading
 
+from System.Workers import Thread
 from System.Platform import StorageHelper, DockerHelper, Platform
 
 class ModuleExecutor(object):
 
-    def __init__(self, task_id, processor, workspace, docker_image=None):
+    def __init__(self, task_id, processor, workspace, docker_image=None, transfer_window=10, transfer_batch_size=100):
         self.task_id        = task_id
         self.processor      = processor
         self.workspace      = workspace
-        self.storage_helper = StorageHelper(self.processor)
         self.docker_helper  = DockerHelper(self.processor)
         self.docker_image   = docker_image
 
+        # Manifests of batch transfers are kept in the workspace so transfers can be rerun after a restart
+        manifest_dir        = os.path.join(self.workspace.get_wrk_dir(), ".manifests")
+        self.storage_helper = StorageHelper(self.processor, manifest_dir=manifest_dir)
+
+        # Max number of input transfer batches running at the same time
+        self.transfer_window = transfer_window
+
+        # Max number of input files transferred by a single command on the processor
+        self.transfer_batch_size = transfer_batch_size
+
+        # Directories where remote storage locations of streamed inputs are mounted: bucket url -> mount dir
+        self.stream_mounts = {}
+
+        # Output files kept on the processor for the task the processor is handed off to: (output_file, dest_dir)
+        self.deferred_outputs = []
+
         # Create workspace directory structure
         self.__create_workspace()
 
     def load_input(self, inputs):
 
-        # List of jobs that have been started in process of loading input
-        job_names = []
-
-        # Pull docker image if necessary
+        # Pull docker image if necessary. Pull runs alongside the input transfers and is waited on at the end.
+        docker_job_name = None
         if self.docker_image is not None:
             docker_image_name = self.docker_image.get_image_name().split("/")[0]
             docker_image_name = docker_image_name.replace(":","_")
-            job_name = "docker_pull_%s" % docker_image_name
-            self.docker_helper.pull(self.docker_image.get_image_name(), job_name=job_name)
-            job_names.append(job_name)
+            docker_job_name = "docker_pull_%s" % docker_image_name
+            self.docker_helper.pull(self.docker_image.get_image_name(), job_name=docker_job_name)
 
         # Load input files
         # Inputs: list containing remote files, local files, and docker images
-        src_seen = []
-        dest_seen = []
-        count = 1
-        batch_size = 5
-        loading_counter = 0
+        # Transfers to run: (src_path, dest_path)
+        transfers = []
+
+        # Filename each remote file will have after transfer (None = same as src)
+        staged_files = {}
+
+        # Paths of files that will be in the working directory
+        dest_seen = set()
+
+        # Inputs read directly from remote storage
+        streamed_inputs = []
+
         for task_input in inputs:
 
-            # Don't transfer local files
-            if ":" not in task_input.get_path():
+            # Don't transfer local files unless they're the output of a task that handed off the processor
+            if ":" not in task_input.get_path() and not task_input.is_flagged("handoff"):
+                continue
+
+            # Don't transfer files that will be streamed
+            if task_input.is_flagged("stream"):
+                streamed_inputs.append(task_input)
                 continue
 
             # Directory where input will be transferred
             dest_dir = self.workspace.get_wrk_dir()
 
-            # Input filename after transfer (None = same as src)
-            dest_filename = None
+            # Get name of file that's going to be transferred
+            src_path = task_input.get_transferrable_path()
 
             # Case: Transfer file into wrk directory if its not already there
-            if task_input.get_transferrable_path() not in src_seen:
+            if src_path not in staged_files:
 
-                # Get name of file that's going to be transferred
-                src_path = task_input.get_transferrable_path()
-                job_name = "load_input_%s_%s_%s" % (self.task_id, task_input.get_type(), count)
                 logging.debug("Input path: %s, transfer path: %s" % (task_input.get_path(), src_path))
 
                 # Generate complete transfer path
@@ -65,7 +89,7 @@ class ModuleExecutor(object):
                     if task_input.sample_name is not None:
                         dest_filename = "{0}_{1}".format(task_input.sample_name, task_input.filename)
                     else:
-                        dest_filename = "{0}_{1}".format(Platform.generate_unique_id(), dest_filename)
+                        dest_filename = "{0}_{1}".format(Platform.generate_unique_id(), task_input.filename)
                     logging.debug("Changing filename from '{0}' to '{1}'.".format(task_input.filename, dest_filename))
                     dest_path = os.path.join(dest_dir, dest_filename)
                 else:
@@ -75,39 +99,36 @@ class ModuleExecutor(object):
                 # Show the final log file
                 logging.debug("Destination: {0}".format(dest_path))
 
-                # Move file to dest_path
-                self.storage_helper.mv(src_path=src_path,
-                                       dest_path=dest_path,
-                                       job_name=job_name)
-                loading_counter += 1
-                
-                # Add transfer path to list of remote paths that have been transferred to local workspace
-                src_seen.append(src_path)
-                count += 1
-                job_names.append(job_name)
-                
-                # If loading_counter is batch_size, clear out queue
-                if loading_counter >= batch_size:
-                    logging.debug("Batch size reached on task {0}".format(
-                        self.task_id))
-                    # Wait for all processes to finish
-                    while len(job_names):
-                        self.processor.wait_process(job_names.pop())
-                    loading_counter = 0
+                # Add file to list of files to transfer to local workspace
+                transfers.append((src_path, dest_path))
+                staged_files[src_path] = dest_filename
 
             # Update path after transferring to wrk directory and add to list of files in working directory
-            task_input.update_path(new_dir=dest_dir, new_filename=dest_filename)
-            dest_seen.append(task_input.get_path())
+            task_input.update_path(new_dir=dest_dir, new_filename=staged_files[src_path])
+            dest_seen.add(task_input.get_path())
             logging.debug("Updated path: %s" % task_input.get_path())
 
-        # Wait for all processes to finish
-        for job_name in job_names:
-            self.processor.wait_process(job_name)
+        # Transfer files in batches with up to 'transfer_window' batches running at a time
+        self.__transfer_inputs(transfers)
+
+        # Wait for docker image to finish loading
+        if docker_job_name is not None:
+            self.processor.wait_process(docker_job_name)
 
         # Recursively give every permission to all files we just added
         logging.info("(%s) Final workspace perm. update for task '%s'..." % (self.processor.name, self.task_id))
         self.__grant_workspace_perms(job_name="grant_final_wrkspace_perms")
 
+        # Mount storage of streamed inputs last so permission updates don't traverse the mounted buckets
+        self.__mount_inputs(streamed_inputs)
+
+    def unload_input(self):
+        # Unmount storage of streamed inputs once the task no longer needs them
+        for count, mount_dir in enumerate(self.stream_mounts.values(), 1):
+            job_name = "unmount_%s_%s" % (self.task_id, count)
+            self.storage_helper.unmount(mount_dir, job_name=job_name, wait=True)
+        self.stream_mounts = {}
+
     def run(self, cmd, job_name=None):
 
         # Check or create job name
@@ -121,14 +142,25 @@ class ModuleExecutor(object):
         self.processor.run(job_name, cmd, docker_image=docker_image_name)
         return self.processor.wait_process(job_name)
 
-    def save_output(self, outputs, final_output_types):
+    def run_stage(self, stage_name, cmd, job_name=None):
+        # Run one stage of a staged command unless the stage has already completed in the task workspace
+        # A marker file is written once the stage succeeds, so re-running the stage after the processor is reset
+        # (e.g. preemption) returns immediately if it had already finished
+        marker_dir  = os.path.join(self.workspace.get_wrk_dir(), "stages")
+        marker      = os.path.join(marker_dir, "%s.done" % stage_name)
+        staged_cmd  = "if [ -e {0} ]; then echo Stage {1} already complete; " \
+                      "else ( {2} ) && mkdir -p {3} && touch {0}; fi".format(marker, stage_name, cmd, marker_dir)
+        return self.run(staged_cmd, job_name=job_name)
+
+    def save_output(self, outputs, final_output_types, defer_output=False):
         # Return output files to workspace output dir
+        # Non-final output is kept on the processor if the output is deferred
 
         # Get workspace places for output files
         final_output_dir = self.workspace.get_output_dir()
         tmp_output_dir = self.workspace.get_tmp_output_dir()
         count = 1
-        job_names = []
+        transfers = []
 
         # List of output file paths. We create this list to ensure the files are not being overwritten
         output_filepaths = []
@@ -161,26 +193,48 @@ class ModuleExecutor(object):
                 # Just add the new path to the list of output file paths
                 output_filepaths.append(destination_path)
 
-            # Transfer to correct output directory
-            job_name = "save_output_%s_%s_%s" % (self.task_id, output_file.get_type(), count)
+            # Keep file on processor until it's known whether the next task can use it there
+            if defer_output and output_file.get_type() not in final_output_types:
+                self.deferred_outputs.append((output_file, dest_dir))
+                output_file.flag("handoff")
+                logging.debug("(%s) Keeping file '%s' on processor: %s" % (self.task_id, output_file.get_type(), output_file.get_path()))
+                count += 1
+                continue
+
+            # Add file to list of files to transfer to correct output directory
             curr_path = output_file.get_transferrable_path()
-            self.storage_helper.mv(curr_path, dest_dir, job_name=job_name)
+            transfers.append((curr_path, dest_dir))
 
             # Update path of output file to reflect new location
-            job_names.append(job_name)
             output_file.update_path(new_dir=dest_dir)
             logging.debug("(%s) Transferring file '%s' from old path '%s' to new path '%s' ('%s')" % (
                 self.task_id, output_file.get_type(), curr_path, output_file.get_path(), output_file.get_transferrable_path()))
 
             count += 1
 
-        # Wait for transfers to complete
-        for job_name in job_names:
-            self.processor.wait_process(job_name)
+        # Transfer all output files with a single command and wait for transfers to complete
+        if len(transfers) > 0:
+            job_name = "save_output_%s" % self.task_id
+            self.storage_helper.mv_batch(transfers, job_name=job_name, wait=True)
 
         # Wait for output files to finish transferring
         self.processor.wait()
 
+    def flush_output(self):
+        # Transfer output files kept on the processor to the workspace output dir
+        if len(self.deferred_outputs) == 0:
+            return
+
+        transfers = [(output_file.get_transferrable_path(), dest_dir) for output_file, dest_dir in self.deferred_outputs]
+        logging.info("(%s) Uploading output kept on processor for task '%s'..." % (self.processor.name, self.task_id))
+        self.storage_helper.mv_batch(transfers, job_name="save_output_%s_deferred" % self.task_id, wait=True)
+
+        # Update path of output files to reflect new location
+        for output_file, dest_dir in self.deferred_outputs:
+            output_file.update_path(new_dir=dest_dir)
+            output_file.unflag("handoff")
+        self.deferred_outputs = []
+
     def save_logs(self):
         # Move log files to final output log directory
         log_files = os.path.join(self.workspace.get_wrk_log_dir(), "*")
@@ -206,7 +260,91 @@ class ModuleExecutor(object):
         # Wait for all the above commands to complete
         logging.info("(%s) Successfully created workspace for task '%s'!" % (self.processor.name, self.task_id))
 
+    def __transfer_inputs(self, transfers):
+        # Split transfers into batches each run as a single command on the processor
+        # Keep up to 'transfer_window' batches running at all times. A new batch starts as soon as any running batch finishes
+
+        if len(transfers) == 0:
+            return
+
+        transfer_queue = queue.Queue()
+        for count, start in enumerate(range(0, len(transfers), self.transfer_batch_size), 1):
+            job_name = "load_input_%s_%s" % (self.task_id, count)
+            transfer_queue.put((job_name, transfers[start:start+self.transfer_batch_size]))
+
+        # Start workers and wait for all transfers to finish
+        failed = threading.Event()
+        workers = []
+        for _ in range(min(self.transfer_window, transfer_queue.qsize())):
+            worker = InputTransferWorker(self.task_id, transfer_queue, self.storage_helper, self.processor, failed)
+            worker.start()
+            workers.append(worker)
+
+        for worker in workers:
+            worker.join()
+
+        # Raise the first error encountered by any of the workers
+        for worker in workers:
+            worker.finalize()
+
+    def __mount_inputs(self, streamed_inputs):
+        # Mount each bucket holding streamed inputs under the working directory so it's visible inside docker
+        job_names = []
+        for task_input in streamed_inputs:
+            bucket_url = "/".join(task_input.get_path().split("/")[0:3])
+            if bucket_url not in self.stream_mounts:
+                bucket = bucket_url.split("/")[2]
+                self.stream_mounts[bucket_url] = os.path.join(self.workspace.get_wrk_dir(), "stream", bucket)
+                job_name = "mount_%s_%s" % (self.task_id, len(self.stream_mounts))
+                self.storage_helper.mount(bucket_url, self.stream_mounts[bucket_url], job_name=job_name)
+                job_names.append(job_name)
+
+            # Read file from its location in the mounted bucket
+            object_path = task_input.get_path()[len(bucket_url):].lstrip("/")
+            task_input.set_path(os.path.join(self.stream_mounts[bucket_url], object_path))
+            logging.debug("Streamed input path: %s" % task_input.get_path())
+
+        # Wait for mounts to finish
+        for job_name in job_names:
+            try:
+                self.processor.wait_process(job_name)
+            except BaseException:
+                logging.error("(%s) Unable to mount remote storage for streamed inputs of task '%s'! "
+                              "Make sure gcsfuse is installed on the processor." % (self.processor.name, self.task_id))
+                raise
+
     def __grant_workspace_perms(self, job_name):
         cmd = "sudo chmod -R 777 %s" % self.workspace.get_wrk_dir()
         self.processor.run(job_name=job_name, cmd=cmd)
         self.processor.wait_process(job_name)
+
+
+class InputTransferWorker(Thread):
+    # Thread transferring batches of task inputs from a shared queue until the queue is empty or another batch fails
+
+    def __init__(self, task_id, transfer_queue, storage_helper, processor, failed):
+        err_msg = "Input transfer for task %s has failed" % task_id
+        super(InputTransferWorker, self).__init__(err_msg)
+
+        self.transfer_queue = transfer_queue
+        self.storage_helper = storage_helper
+        self.processor      = processor
+
+        # Event set once any transfer fails so the remaining transfers aren't started
+        self.failed         = failed
+
+    def work(self):
+        try:
+            while not self.failed.is_set():
+                try:
+                    job_name, transfers = self.transfer_queue.get_nowait()
+                except queue.Empty:
+                    return
+
+                # Move batch of files to their dest paths and wait for transfer to finish
+                self.storage_helper.mv_batch(transfers, job_name=job_name)
+                self.processor.wait_process(job_name)
+
+        except BaseException:
+            self.failed.set()
+            raise
@@ -1,23 +1,54 @@
 import logging
-import time
+import queue
+from collections import OrderedDict
 
 from System.Graph import TaskWorker
 
 class Scheduler(object):
 
-    def __init__(self, task_graph, datastore, platform):
+    # Number of times a ready task can be passed over by lower priority tasks before backfilling is stopped
+    MAX_TASK_SKIPS = 10
+
+    def __init__(self, task_graph, datastore, platform, runtime_history=None, run_journal=None):
 
         # Initialize pipeline definition variables
         self.task_graph     = task_graph
         self.datastore      = datastore
         self.platform       = platform
 
+        # Historical module runtimes used to estimate task runtimes (all tasks assumed equal if None)
+        self.runtime_history = runtime_history
+
+        # Journal recording task completion so the run can be resumed (progress isn't recorded if None)
+        self.run_journal = run_journal
+
+        # Cache of output produced by tasks in previous runs (tasks always run if None)
+        self.task_cache = None
+
         # Initialize set of task workers
         self.task_workers = {}
 
+        # Queue where task workers post the id of their task as soon as they finish running
+        self.completion_queue = queue.Queue()
+
+        # Workers for tasks that can be launched because all of their parents have completed
+        self.ready_tasks = OrderedDict()
+
+        # Number of times each ready task couldn't be launched due to lack of platform resources
+        self.task_skips = {}
+
+        # Estimated runtime of the longest path from each task to the end of the graph
+        self.critical_paths = {}
+
+        # Number of task workers that have been launched but haven't reported back yet
+        self.num_running = 0
+
     def get_task_workers(self):
         return self.task_workers
 
+    def set_task_cache(self, task_cache):
+        self.task_cache = task_cache
+
     def run(self):
         try:
             self.__run_tasks()
@@ -25,32 +56,136 @@ class Scheduler(object):
             self.__finalize()
 
     def __run_tasks(self):
+
         # Execute tasks until are are completed or until error encountered
         while not self.task_graph.is_complete():
 
-            # Check all tasks to see if they need anything updated
-            unfinished_tasks = self.task_graph.get_unfinished_tasks()
-            for task in unfinished_tasks:
+            # Rescan the whole graph if nothing is running (e.g. tasks unblocked by a graph split)
+            if self.num_running == 0:
+                for task in self.task_graph.get_unfinished_tasks():
+                    self.__add_ready_task(task.get_ID())
+                self.__launch_ready_tasks()
+
+            # Processors freed-up after uploading output that was handed off to a task may make room for ready tasks
+            if self.num_running == 0 and self.platform.wait_for_handoff_flushes():
+                self.__launch_ready_tasks()
+
+            # Make sure the pipeline can still progress
+            if self.num_running == 0:
+                if len(self.ready_tasks) > 0:
+                    logging.error("Scheduler error! Platform doesn't have enough free resources to run any of the "
+                                  "following tasks: %s" % ", ".join(self.ready_tasks.keys()))
+                else:
+                    logging.error("Scheduler error! No tasks are running and no more tasks can be launched, "
+                                  "but the pipeline graph is not complete!")
+                raise RuntimeError("Scheduler could not find any task that can be run!")
+
+            # Wait until a task worker reports that it has finished
+            task_id = self.completion_queue.get()
+            self.num_running -= 1
+
+            # Finalize the completed task
+            self.__finalize_task_worker(self.task_workers[task_id])
+
+            # Only the children of the finished task can have become ready.
+            # For a splitter these now include the newly created splits.
+            for child_id in self.task_graph.get_children(task_id):
+                self.__add_ready_task(child_id)
+
+            # Start running the tasks that became ready
+            self.__launch_ready_tasks()
 
-                # Task id
-                task_id = task.get_ID()
+    def __add_ready_task(self, task_id):
 
-                # Check if task worker has been created for task
-                task_worker = None if task_id not in self.task_workers else self.task_workers[task_id]
+        # Skip tasks that are already running or have already been handled
+        if task_id in self.task_workers or task_id in self.ready_tasks:
+            return
 
-                # Finalize completed tasks
-                if task_worker is not None and task_worker.get_status() == TaskWorker.COMPLETE:
-                    self.__finalize_task_worker(task_worker)
-                    continue
+        # Skip tasks that have been completed or split/replaced
+        task = self.task_graph.get_tasks(task_id)
+        if task.is_complete() or task.is_deprecated():
+            return
 
-                # Start running tasks that are ready to run but aren't currently
-                if task_worker is None and self.task_graph.parents_complete(task_id) and not task.is_deprecated():
-                    logging.info("Launching task: '%s'" % task_id)
-                    self.task_workers[task_id] = TaskWorker(task, self.datastore, self.platform)
-                    self.task_workers[task_id].start()
+        # Add task to ready set if it can be run
+        if self.task_graph.parents_complete(task_id):
+            self.ready_tasks[task_id] = TaskWorker(task, self.datastore, self.platform,
+                                                   completion_queue=self.completion_queue,
+                                                   task_cache=self.task_cache)
 
-            # Sleeping for 5 seconds before checking again
-            time.sleep(5)
+    def __launch_ready_tasks(self):
+        # Start running ready tasks in order of decreasing critical path length
+        # Tasks are first-fit packed into the free platform resources. Lower priority tasks can backfill
+        # resources a higher priority task doesn't fit in unless that task has been passed over too many times.
+        # Tasks with a processor handed off to them go first as they don't need any additional resources.
+        ready_task_ids = sorted(self.ready_tasks.keys(),
+                                key=lambda task_id: (self.platform.has_handoff(task_id), self.__get_critical_path(task_id)),
+                                reverse=True)
+        for task_id in ready_task_ids:
+            task_worker = self.ready_tasks[task_id]
+
+            # Reserve platform resources for task
+            try:
+                nr_cpus, mem, disk_space = task_worker.get_resource_requirements()
+                is_reserved = self.platform.reserve_resources(task_id, nr_cpus, mem, disk_space,
+                                                              docker_image=task_worker.get_docker_image_name())
+            except BaseException as e:
+                # Launch task without resources so the error fails the task through its worker like any other task error
+                logging.debug("Unable to determine resources for task '%s'! Failing task." % task_id)
+                task_worker.set_launch_error(e)
+                self.__launch_task(task_id, task_worker)
+                continue
+
+            if not is_reserved:
+                self.task_skips[task_id] = self.task_skips.get(task_id, 0) + 1
+                if self.task_skips[task_id] > self.MAX_TASK_SKIPS:
+                    # Hold remaining resources until starved task can be launched
+                    logging.debug("Task '%s' has waited too long for resources! Lower priority tasks will not "
+                                  "be launched until it can run." % task_id)
+                    break
+                continue
+
+            self.__launch_task(task_id, task_worker)
+
+    def __launch_task(self, task_id, task_worker):
+        # Start running task worker of a ready task
+        logging.info("Launching task: '%s'" % task_id)
+        self.ready_tasks.pop(task_id)
+        self.task_skips.pop(task_id, None)
+        self.task_workers[task_id] = task_worker
+        task_worker.start()
+        self.num_running += 1
+
+    def __get_critical_path(self, task_id):
+        # Return estimated runtime of the longest path from a task to the end of the graph
+        stack = [task_id]
+        while len(stack) > 0:
+            curr_task_id = stack[-1]
+            if curr_task_id in self.critical_paths:
+                stack.pop()
+                continue
+
+            # Ignore children that have been replaced by splits
+            children = [child_id for child_id in self.task_graph.get_children(curr_task_id)
+                        if not self.task_graph.get_tasks(child_id).is_deprecated()]
+
+            # Compute critical paths of children first
+            pending = [child_id for child_id in children if child_id not in self.critical_paths]
+            if len(pending) > 0:
+                stack.extend(pending)
+                continue
+
+            longest_child_path = max([self.critical_paths[child_id] for child_id in children], default=0)
+            self.critical_paths[curr_task_id] = self.__get_estimated_runtime(curr_task_id) + longest_child_path
+            stack.pop()
+
+        return self.critical_paths[task_id]
+
+    def __get_estimated_runtime(self, task_id):
+        # Estimate task runtime from previous runs of the same module
+        if self.runtime_history is None:
+            return 1.0
+        module_name = self.task_graph.get_tasks(task_id).get_module_name()
+        return self.runtime_history.get_runtime(module_name)
 
     def __finalize_task_worker(self, task_worker):
 
@@ -72,11 +207,19 @@ class Scheduler(object):
         elif task_worker.is_success():
             logging.info("Task '%s' finished successfully!" % task.get_ID())
             # Split subgraph if task is a splitter
+            split_task_ids = None
             if task.is_splitter_task():
-                self.task_graph.split_graph(task.get_ID())
+                split_task_ids = self.task_graph.split_graph(task.get_ID())
+
+                # Critical paths need to be re-computed for the new graph
+                self.critical_paths = {}
 
             # Set task to complete if task worker completed successfully
-            task.set_complete(True)
+            self.task_graph.set_complete(task.get_ID())
+
+            # Record task completion so the run can be resumed from this point
+            if self.run_journal is not None:
+                self.run_journal.record_task(task, split_task_ids)
 
     def __finalize(self):
 
@@ -86,30 +229,27 @@ class Scheduler(object):
         # Cancel any still-running jobs
         self.__cancel_unfinished_tasks()
 
-        # Wait for all jobs to finish
-        done = False
-        while not done:
-            # Wait for all task workers to finish up cancelling
-            done = True
-            for task_id, task_worker in self.task_workers.items():
-                if not task_worker.get_status() is TaskWorker.FINALIZED:
-                    # Indicate that not all tasks have been finalized
-                    done = False
-
-                # Finalize tasks that have finished running/cancelling
-                if task_worker.get_status() is TaskWorker.COMPLETE:
-                    try:
-                        self.__finalize_task_worker(task_worker)
-
-                    except BaseException as e:
-                        # Log error but don't raise exception as we want to finish finalizing all task workers
-                        if not task_worker.is_cancelled():
-                            logging.error("Task '%s' failed due to runtime error!" % task_id)
-                            if str(e) != "":
-                                logging.error("Received the following message:\n%s" % e)
-
-            # Wait for a bit before checking again
-            time.sleep(5)
+        # Wait for all task workers to finish running/cancelling
+        while self.num_running > 0:
+
+            # Wait until the next task worker reports that it has finished
+            task_id = self.completion_queue.get()
+            self.num_running -= 1
+
+            # Finalize tasks that have finished running/cancelling
+            task_worker = self.task_workers[task_id]
+            try:
+                self.__finalize_task_worker(task_worker)
+
+            except BaseException as e:
+                # Log error but don't raise exception as we want to finish finalizing all task workers
+                if not task_worker.is_cancelled():
+                    logging.error("Task '%s' failed due to runtime error!" % task_id)
+                    if str(e) != "":
+                        logging.error("Received the following message:\n%s" % e)
+
+        # Upload output still kept on processors handed off to tasks that never ran
+        self.platform.flush_handoffs()
 
     def __cancel_unfinished_tasks(self):
         # Cancel any still-running jobs
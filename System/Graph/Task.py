@@ -25,11 +25,17 @@ class Task(object):
         # Get the config inputs
         self.__module_args          = kwargs.pop("args", [])
 
+        # Input keys whose files are streamed from remote storage instead of being transferred to the processor
+        self.__stream_input_keys    = kwargs.pop("stream_input", [])
+
         # Initialize modules
         self.module                 = self.__load_module(self.__module_name,
                                                          is_docker=self.__docker_image is not None,
                                                          submodule=self.__submodule_name)
 
+        # Check that module can stream the requested inputs
+        self.__check_stream_input_keys()
+
         # Whether task has been completed
         self.complete   = False
 
@@ -58,8 +64,9 @@ class Task(object):
         # Split_id is the name of the partition the newly created task will be able to access
         # visible_samples is list of samples visible to new split
 
-        # Create copy of current task and give new id
-        split_task = copy.deepcopy(self)
+        # Create shallow copy of current task and give new id
+        # Graph config args and final output keys are read-only so they're shared with the original task
+        split_task = copy.copy(self)
         new_id = "%s.%s" % (self.__task_id, split_id)
         split_task.__task_id = new_id
 
@@ -80,8 +87,8 @@ class Task(object):
         # Specify that new split task is the result of a split
         split_task.__is_split = True
 
-        # Give new module id to module
-        split_task.module.set_ID(new_id)
+        # Give split task its own copy of the module with the new module id
+        split_task.module = self.module.clone(new_id)
 
         # Remove deprecated flag possibly inherited from parent
         split_task.__deprecated = False
@@ -94,6 +101,10 @@ class Task(object):
     def get_module(self):
         return self.module
 
+    def get_module_name(self):
+        # Name of the module class executed by the task
+        return self.module.__class__.__name__
+
     def is_splitter_task(self):
         return isinstance(self.module, Splitter)
 
@@ -120,6 +131,9 @@ class Task(object):
     def get_docker_image_id(self):
         return self.__docker_image
 
+    def get_stream_input_keys(self):
+        return self.__stream_input_keys
+
     def set_complete(self, is_complete):
         self.complete = is_complete
 
@@ -147,6 +161,20 @@ class Task(object):
     def get_clones(self):
         return self.__clones
 
+    def __check_stream_input_keys(self):
+        # Make sure each streamed input is declared as streamable by the task module
+        module_args = self.module.get_arguments()
+        for input_key in self.__stream_input_keys:
+            if input_key not in module_args:
+                logging.error("Task '%s' requested streaming for input '%s' but module '%s' has no such input!"
+                              % (self.__task_id, input_key, self.get_module_name()))
+                raise IOError("Invalid stream_input specified for task '%s' in graph config!" % self.__task_id)
+
+            if not module_args[input_key].is_streamable():
+                logging.error("Task '%s' requested streaming for input '%s' but module '%s' needs the input "
+                              "transferred to the processor!" % (self.__task_id, input_key, self.get_module_name()))
+                raise IOError("Invalid stream_input specified for task '%s' in graph config!" % self.__task_id)
+
     def __load_module(self, module_name, is_docker, submodule=None):
 
         # Try importing the module
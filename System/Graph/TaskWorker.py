@@ -1,10 +1,10 @@
 import threading
-import time
 import math
 import logging
 
 from System.Workers import Thread
 from System.Graph import ModuleExecutor
+from System.Platform import Processor
 
 class TaskWorker(Thread):
 
@@ -18,7 +18,7 @@ class TaskWorker(Thread):
 
     STATUSES        = ["IDLE", "LOADING", "RUNNING", "FINALIZING", "COMPLETE", "CANCELLING", "FINALIZED"]
 
-    def __init__(self, task, datastore, platform):
+    def __init__(self, task, datastore, platform, completion_queue=None, task_cache=None):
         # Class for executing task
 
         # Initialize new thread
@@ -42,6 +42,20 @@ class TaskWorker(Thread):
         # Processor for executing task
         self.proc       = None
 
+        # Processor runtime/cost accumulated before task acquired processor (non-zero if processor was reused)
+        self.proc_runtime_offset    = 0
+        self.proc_cost_offset       = 0
+
+        # Runtime/cost of task once processor has been handed back to platform for reuse
+        self.final_runtime  = None
+        self.final_cost     = None
+
+        # Whether processor was created for the task (rather than leased from the platform's pool)
+        self.created_proc = False
+
+        # Child task the processor will be handed off to along with the task output (None if output isn't kept)
+        self.handoff_task_id = None
+
         # Garbage collector for destroying instance on cancellation
         self.garbage_collector = None
 
@@ -57,6 +71,40 @@ class TaskWorker(Thread):
         # Command that was run to carry out task
         self.cmd = None
 
+        # Task resource requirements
+        self.cpus           = None
+        self.mem            = None
+        self.disk_space     = None
+        self.docker_image   = None
+        self.input_files    = None
+
+        # Size (GB) of task input stored in each storage location
+        self.input_locations = {}
+
+        # Error raised by the scheduler while launching the task (re-raised by the worker so the task fails)
+        self.launch_error = None
+
+        # Error raised while uploading output kept on the processor (re-raised once the worker has cleaned up)
+        self.output_error = None
+
+        # Queue where task id is posted once the worker has finished running
+        self.completion_queue = completion_queue
+
+        # Cache of output produced by tasks in previous runs (None if task output isn't cached)
+        self.task_cache = task_cache
+
+        # Key identifying task output in the task cache and whether output was found in the cache
+        self.cache_key  = None
+        self.cache_hit  = False
+
+    def run(self):
+        try:
+            super(TaskWorker, self).run()
+        finally:
+            # Notify scheduler that task worker is done running (regardless of success)
+            if self.completion_queue is not None:
+                self.completion_queue.put(self.task.get_ID())
+
     def set_status(self, new_status):
 
         # Updates instance status with threading.lock() to prevent race conditions
@@ -76,45 +124,95 @@ class TaskWorker(Thread):
     def get_runtime(self):
         if self.proc is None:
             return 0
+        elif self.final_runtime is not None:
+            return self.final_runtime
         else:
-            return self.proc.get_runtime()
+            return self.proc.get_runtime() - self.proc_runtime_offset
 
     def get_cost(self):
         if self.proc is None:
             return 0
+        elif self.final_cost is not None:
+            return self.final_cost
         else:
-            return self.proc.compute_cost()
+            return self.proc.compute_cost() - self.proc_cost_offset
 
     def get_start_time(self):
-        if self.proc is None:
+        if self.proc is None or self.proc.get_start_time() is None:
             return None
         else:
-            return self.proc.get_start_time()
+            return self.proc.get_start_time() + self.proc_runtime_offset
 
     def get_cmd(self):
         return self.cmd
 
+    def get_machine_family(self):
+        # Return machine family of the processor that ran the task (None if platform has no machine families)
+        if self.proc is None:
+            return None
+        return self.proc.get_machine_family()
+
+    def get_boot_latency(self):
+        # Return seconds between requesting the task's processor and running the first command on it
+        if self.proc is None or not self.created_proc:
+            return None
+        return self.proc.get_boot_latency()
+
+    def get_input_egress(self):
+        # Return (GB, cost) of transferring task input to the task's processor from where it's stored
+        # Return None if the platform doesn't charge for transferring data between locations
+        if self.proc is None:
+            return None
+        return self.proc.get_input_egress(self.input_locations)
+
+    def is_cache_hit(self):
+        return self.cache_hit
+
+    def compute_resource_requirements(self):
+        # Set task input arguments and determine resources needed to run task
+        # Must be called before worker is started so the scheduler can reserve resources for the task
+
+        # Set the input arguments that will be passed to the task module
+        self.datastore.set_task_input_args(self.task.get_ID())
+
+        # Compute task resource requirements
+        self.cpus   = self.module.get_argument("nr_cpus")
+        self.mem    = self.module.get_argument("mem")
+
+        # Compute disk space requirements
+        self.input_files    = self.datastore.get_task_input_files(self.task.get_ID())
+        if self.task.get_docker_image_id() is not None:
+            self.docker_image   = self.datastore.get_docker_image(docker_id=self.task.get_docker_image_id())
+        self.disk_space     = self.__compute_disk_requirements(self.input_files, self.docker_image)
+        logging.debug("(%s) CPU: %s, Mem: %s, Disk space: %s" % (self.task.get_ID(), self.cpus, self.mem, self.disk_space))
+
+    def get_resource_requirements(self):
+        # Return (nr_cpus, mem, disk_space) needed by task
+        if self.cpus is None:
+            self.compute_resource_requirements()
+        return self.cpus, self.mem, self.disk_space
+
+    def get_docker_image_name(self):
+        # Return name of docker image task runs in (None if task doesn't use docker)
+        if self.cpus is None:
+            self.compute_resource_requirements()
+        return None if self.docker_image is None else self.docker_image.get_image_name()
+
+    def set_launch_error(self, err):
+        # Record error that prevented the scheduler from reserving resources for the task
+        self.launch_error = err
+
     def work(self):
         # Run task module command and save outputs
         try:
-            # Set the input arguments that will be passed to the task module
-            self.datastore.set_task_input_args(self.task.get_ID())
+            # Fail task if the scheduler couldn't determine its resource requirements
+            if self.launch_error is not None:
+                raise self.launch_error
 
-            # Compute task resource requirements
-            cpus    = self.module.get_argument("nr_cpus")
-            mem     = self.module.get_argument("mem")
-
-            # Compute disk space requirements
-            docker_image    = None
-            input_files     = self.datastore.get_task_input_files(self.task.get_ID())
-            if self.task.get_docker_image_id() is not None:
-                docker_image    = self.datastore.get_docker_image(docker_id=self.task.get_docker_image_id())
-            disk_space      = self.__compute_disk_requirements(input_files, docker_image)
-            logging.debug("(%s) CPU: %s, Mem: %s, Disk space: %s" % (self.task.get_ID(), cpus, mem, disk_space))
-
-            # Wait for platform to have enough resources to run task
-            while not self.platform.can_make_processor(cpus, mem, disk_space) and not self.is_cancelled():
-                time.sleep(5)
+            # Compute resource requirements if the scheduler hasn't already
+            cpus, mem, disk_space = self.get_resource_requirements()
+            input_files     = self.input_files
+            docker_image    = self.docker_image
 
             # Quit if pipeline is cancelled
             self.__check_cancelled()
@@ -126,6 +224,12 @@ class TaskWorker(Thread):
             # Specify that module output files should be placed in task's working directory
             self.module.set_output_dir(task_workspace.get_wrk_out_dir())
 
+            # Skip task without creating a processor if an identical task has already produced the output
+            if self.__load_cached_output():
+                with self.status_lock:
+                    self.__err = False
+                return
+
             # Execute command if one exists
             self.set_status(self.LOADING)
 
@@ -135,18 +239,36 @@ class TaskWorker(Thread):
             # Create the specific processor for the task
             if has_command:
                 # Get processor capable of running job
-                self.proc = self.platform.get_processor(self.task.get_ID(), cpus, mem, disk_space)
+                self.proc = self.platform.get_processor(self.task.get_ID(), cpus, mem, disk_space,
+                                                        module_name=self.task.get_module_name(),
+                                                        docker_image=self.get_docker_image_name())
                 logging.debug("(%s) Successfully acquired processor!" % self.task.get_ID())
             else:
                 # Get small processor
-                self.proc = self.platform.get_processor(self.task.get_ID(), 1, 1, disk_space)
+                self.proc = self.platform.get_processor(self.task.get_ID(), 1, 1, disk_space,
+                                                        module_name=self.task.get_module_name(),
+                                                        docker_image=self.get_docker_image_name())
                 logging.debug("(%s) Successfully acquired processor!" % self.task.get_ID())
 
+            # Re-load input arguments as parent output may have been uploaded while task was waiting for a processor
+            self.datastore.set_task_input_args(self.task.get_ID())
+            input_files = self.input_files = self.datastore.get_task_input_files(self.task.get_ID())
+            self.input_locations = self.__get_input_locations(input_files)
+
+            # Only count processor usage from the time the task acquired it (processor may have been reused)
+            self.proc_runtime_offset    = self.proc.get_runtime()
+            self.proc_cost_offset       = self.proc.compute_cost()
+
             # Check to see if pipeline has been cancelled
             self.__check_cancelled()
 
-            # Create the processor
-            self.proc.create()
+            # Create the processor unless it was leased from the platform's pool of running processors
+            if self.proc.get_status() != Processor.AVAILABLE:
+                boot_start = self.platform.get_time()
+                self.created_proc = True
+                self.proc.set_input_locations(self.input_locations)
+                self.proc.create()
+                self.platform.record_boot_time(self.platform.get_time() - boot_start)
 
             # Check to see if pipeline has been cancelled
             self.__check_cancelled()
@@ -155,7 +277,9 @@ class TaskWorker(Thread):
             self.module_executor = ModuleExecutor(task_id=self.task.get_ID(),
                                                   processor=self.proc,
                                                   workspace=task_workspace,
-                                                  docker_image=docker_image)
+                                                  docker_image=docker_image,
+                                                  transfer_window=self.platform.config.get("input_transfer_window", 10),
+                                                  transfer_batch_size=self.platform.config.get("input_transfer_batch_size", 100))
 
             # Check to see if pipeline has been cancelled
             self.__check_cancelled()
@@ -173,12 +297,37 @@ class TaskWorker(Thread):
                 self.set_status(self.RUNNING)
                 self.cmd = self.module.update_command()
 
-                if not self.module.is_resumable:
+                # Staged commands resume from their last completed stage so they don't need checkpoints
+                is_resumable = self.module.is_resumable or self.module.is_staged(self.cmd)
+                if not is_resumable:
                     logging.debug("Module (%s) is not resumable adding checkpoint(s)!" % self.module.get_ID())
                     self.proc.add_checkpoint() # mark a checkpoint after all the input is done
 
-                # Check if we received a list of commands or only one
-                if isinstance(self.cmd, list):
+                # Check if we received stages, a list of commands or only one
+                if self.module.is_staged(self.cmd):
+
+                    logging.info("Task '{0}' has {1} stages, so we will run them sequentially.".format(
+                        self.task.get_ID(), len(self.cmd)))
+
+                    # Initialize the output and error placeholders
+                    out, err = None, None
+
+                    # Process each stage (stages completed before a processor reset are skipped)
+                    for stage_name, cmd in self.cmd.items():
+
+                        # Create a unique job_name
+                        job_name = "{0}_{1}".format(self.task.get_ID(), stage_name)
+
+                        # Run the stage
+                        out, err = self.module_executor.run_stage(stage_name, cmd, job_name=job_name)
+
+                        # Check to see if pipeline has been cancelled
+                        self.__check_cancelled()
+
+                    # Post-process only last stage output if necessary
+                    self.module.process_cmd_output(out, err)
+
+                elif isinstance(self.cmd, list):
 
                     logging.info("Task '{0}' has a list of commands, so we will run them sequentially.".format(
                         self.task.get_ID()))
@@ -225,7 +374,13 @@ class TaskWorker(Thread):
             output_files = self.datastore.get_task_output_files(self.task.get_ID())
             final_output_types = self.task.get_final_output_keys()
             if len(output_files) > 0:
-                self.module_executor.save_output(output_files, final_output_types)
+                # Keep output on processor if it can be handed off to the only task using the output
+                self.handoff_task_id = self.__get_handoff_task_id()
+                self.module_executor.save_output(output_files, final_output_types,
+                                                 defer_output=self.handoff_task_id is not None)
+
+            # Record task output so identical tasks in future runs can be skipped
+            self.__store_cached_output()
 
             # Indicate that task finished without any errors
             if not self.__cancelled:
@@ -249,6 +404,11 @@ class TaskWorker(Thread):
             # Notify that task worker has completed regardless of success
             self.set_status(TaskWorker.COMPLETE)
 
+        # Fail task if its output couldn't be uploaded after the task finished
+        if self.output_error is not None:
+            logging.error("Task '%s' failed!" % self.task.get_ID())
+            raise self.output_error
+
     def cancel(self):
         # Cancel pipeline during runtime
 
@@ -277,6 +437,9 @@ class TaskWorker(Thread):
 
     def __clean_up(self):
 
+        # Free any resources reserved for the task that weren't claimed by a processor
+        self.platform.release_reservation(self.task.get_ID())
+
         # Do nothing if errors occurred before processor was even created
         if self.proc is None:
             return
@@ -291,6 +454,55 @@ class TaskWorker(Thread):
             if str(e) != "":
                 logging.error("Received following error:\n%s" % e)
 
+        # Try to unmount storage used to stream task inputs
+        # Processor isn't reused if storage is still mounted as clearing its workspace would reach into the storage
+        inputs_unloaded = True
+        try:
+            if self.module_executor is not None and not self.__cancelled:
+                self.module_executor.unload_input()
+        except BaseException as e:
+            inputs_unloaded = False
+            logging.warning("Unable to unmount streamed inputs for task '%s'!" % self.task.get_ID())
+            if str(e) != "":
+                logging.warning("Received following error:\n%s" % e)
+
+        # Try to hand processor off to the task using the output kept on the processor
+        # Upload the output now if the processor can't be handed off
+        if self.handoff_task_id is not None and self.is_success():
+            try:
+                final_runtime   = self.get_runtime()
+                final_cost      = self.get_cost()
+                if inputs_unloaded and self.platform.hand_off_processor(self.proc, self.handoff_task_id,
+                                                                        self.module_executor.flush_output):
+                    self.final_runtime  = final_runtime
+                    self.final_cost     = final_cost
+                    return
+                self.module_executor.flush_output()
+            except BaseException as e:
+                logging.error("Unable to upload output of task '%s'!" % self.task.get_ID())
+                if str(e) != "":
+                    logging.error("Received following error:\n%s" % e)
+                with self.status_lock:
+                    self.__err = True
+                self.output_error = e
+
+        # Try to hand processor back to platform so it can be reused by another task
+        try:
+            if self.is_success() and inputs_unloaded:
+                # Processor usage after this point is no longer charged to the task
+                self.final_runtime  = self.get_runtime()
+                self.final_cost     = self.get_cost()
+                if self.platform.release_processor(self.proc):
+                    return
+                self.final_runtime  = None
+                self.final_cost     = None
+        except BaseException as e:
+            self.final_runtime  = None
+            self.final_cost     = None
+            logging.warning("Unable to return processor '%s' to platform for reuse!" % self.proc.get_name())
+            if str(e) != "":
+                logging.warning("Received following error:\n%s" % e)
+
         # Try to destroy platform if it's not off
         try:
 
@@ -313,10 +525,16 @@ class TaskWorker(Thread):
         if docker_image is not None:
             input_size += docker_image.get_size()
 
+        # Size of input files streamed from remote storage instead of being transferred
+        stream_size = 0
+
         # Add sizes of each input file
         for input_file in input_files:
+            # Streamed files aren't stored on disk so only leave room for the output produced from them
+            if input_file.is_flagged("stream"):
+                stream_size += input_file.get_size()
             # Overestimate for gzipped files
-            if input_file.get_path().endswith(".gz"):
+            elif input_file.get_path().endswith(".gz"):
                 input_size += input_file.get_size()*5
             else:
                 input_size += input_file.get_size()
@@ -326,7 +544,7 @@ class TaskWorker(Thread):
             input_multiplier = self.platform.config.get("input_multiplier", 5)
 
         # Set size of desired disk
-        disk_size = int(math.ceil(input_multiplier * input_size))
+        disk_size = int(math.ceil(input_multiplier * input_size + stream_size))
 
         # Make sure platform can create a disk that size
         min_disk_size = self.platform.get_min_disk_space()
@@ -339,6 +557,75 @@ class TaskWorker(Thread):
         disk_size = min(disk_size, max_disk_size)
         return disk_size
 
+    @staticmethod
+    def __get_input_locations(input_files):
+        # Return size (GB) of the task's input stored in each storage location
+        # Inputs inside docker images or kept on the processor are never transferred
+        input_locations = {}
+        for input_file in input_files:
+            if input_file.is_flagged("docker") or input_file.is_flagged("handoff"):
+                continue
+            if input_file.get_location() is None or input_file.get_size() is None:
+                continue
+            input_locations[input_file.get_location()] = \
+                input_locations.get(input_file.get_location(), 0) + input_file.get_size()
+        return input_locations
+
+    def __get_handoff_task_id(self):
+        # Return the child task that can run on the task's processor (None if there's no such task)
+        if not self.platform.task_affinity or self.task.is_splitter_task():
+            return None
+
+        # Output must be used by a single task
+        graph = self.datastore.graph
+        children = [child_id for child_id in graph.get_children(self.task.get_ID())
+                    if not graph.get_tasks(child_id).is_deprecated()]
+        if len(children) != 1:
+            return None
+
+        # Child must be able to start as soon as task finishes so the processor doesn't sit idle
+        for parent_id in graph.get_parents(children[0]):
+            if parent_id != self.task.get_ID() and not graph.get_tasks(parent_id).is_complete():
+                return None
+
+        return children[0]
+
+    def __load_cached_output(self):
+        # Set task output to output found in the task cache
+        # Return True if output was found, False if task needs to be run
+        if self.task_cache is None or self.task.is_splitter_task():
+            return False
+
+        try:
+            self.cache_key = self.task_cache.get_task_key(self.task, self.docker_image)
+            if self.cache_key is None or not self.task_cache.load(self.cache_key, self.task):
+                return False
+            logging.info("Task '%s' output found in task cache! Skipping task." % self.task.get_ID())
+            self.cache_hit = True
+            return True
+
+        except BaseException as e:
+            # Task can always just be run if cache can't be read
+            self.cache_key = None
+            logging.warning("Unable to check task cache for task '%s'!" % self.task.get_ID())
+            if str(e) != "":
+                logging.warning("Received following error:\n%s" % e)
+            return False
+
+    def __store_cached_output(self):
+        # Add task output to the task cache
+        # Output kept on the processor for a child task hasn't been uploaded yet so it isn't cached
+        if self.cache_key is None or self.handoff_task_id is not None or self.__cancelled:
+            return
+
+        try:
+            self.task_cache.store(self.cache_key, self.task, runtime=self.get_runtime(), nr_cpus=self.cpus)
+        except BaseException as e:
+            # Task output is still valid if it can't be cached
+            logging.warning("Unable to add output of task '%s' to task cache!" % self.task.get_ID())
+            if str(e) != "":
+                logging.warning("Received following error:\n%s" % e)
+
     def __check_cancelled(self):
         if self.__cancelled:
             raise RuntimeError("(%s) Task failed due to cancellation!")
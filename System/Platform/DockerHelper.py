@@ -38,6 +38,25 @@ class DockerHelper(object):
             logging.error("Unable to check docker image existence: %s" % image_name)
             raise
 
+    def get_image_digest(self, image_name, job_name=None, **kwargs):
+        # Return id of the image content (changes whenever the image behind a tag changes)
+        cmd = "sudo docker image inspect %s --format='{{.Id}}'" % image_name
+
+        # Run command and return job name
+        job_name = "get_digest_%s" % image_name if job_name is None else job_name
+        self.proc.run(job_name, cmd, **kwargs)
+
+        # Wait for cmd to finish and get output
+        try:
+            out, err = self.proc.wait_process(job_name)
+            return out.strip()
+
+        except BaseException as e:
+            logging.error("Unable to get docker image digest: %s" % image_name)
+            if str(e) != "":
+                logging.error("Received the following msg:\n%s" % e)
+            raise
+
     def get_image_size(self, image_name, job_name=None, **kwargs):
         # Return file size in gigabytes
         cmd = "sudo docker image inspect %s --format='{{.Size}}'" % image_name
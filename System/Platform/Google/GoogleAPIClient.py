@@ -0,0 +1,247 @@
+import logging
+import subprocess as sp
+import random
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+
+
+class GoogleAPIError(Exception):
+    pass
+
+
+class GoogleAPINotFound(GoogleAPIError):
+    pass
+
+
+class GoogleAPIClient(object):
+    # Client for the Google Cloud REST APIs (Compute, Storage, Pub/Sub) shared by every thread of the pipeline
+    # Requests are sent over a pool of keep-alive connections instead of forking a gcloud/gsutil process per call
+    # Authenticates with an OAuth2 access token obtained from gcloud and refreshed before it expires
+
+    # Root url of each API
+    DEFAULT_API_ROOTS = {"compute": "https://compute.googleapis.com/compute/v1",
+                         "storage": "https://storage.googleapis.com/storage/v1",
+                         "pubsub":  "https://pubsub.googleapis.com/v1"}
+
+    # Maximum number of open connections to each API host
+    POOL_SIZE = 32
+
+    # Seconds before a request is abandoned
+    REQUEST_TIMEOUT = 60
+
+    # Seconds an access token is used before a new one is requested (tokens expire after an hour)
+    TOKEN_TTL = 45 * 60
+
+    # Lock for creating the session and reading/updating the access token from multiple threads
+    client_lock = threading.Lock()
+
+    # Lock held while a new access token is obtained so only one thread runs gcloud at a time
+    token_lock = threading.Lock()
+
+    # Session holding the connection pools
+    session = None
+
+    # Api root urls (can be pointed at a local server for testing)
+    api_roots = dict(DEFAULT_API_ROOTS)
+
+    # Google project the APIs are called for
+    project = None
+
+    # Current access token and the time it was obtained
+    access_token = None
+    token_time = 0
+
+    # Number of requests sent through the client
+    nr_requests = 0
+
+    @staticmethod
+    def configure(project=None, api_root=None):
+        # Set project used for API calls and optionally send every API call to a different server
+        # (e.g. a local fake server providing the same paths as the Google APIs)
+        with GoogleAPIClient.client_lock:
+            if project is not None:
+                GoogleAPIClient.project = project
+
+            if api_root is not None:
+                api_root = api_root.rstrip("/")
+                GoogleAPIClient.api_roots = {"compute":  "%s/compute/v1" % api_root,
+                                             "storage":  "%s/storage/v1" % api_root,
+                                             "pubsub":   "%s/pubsub/v1" % api_root}
+
+            # Access token of a previous configuration can't be reused
+            GoogleAPIClient.access_token = None
+
+    @staticmethod
+    def get_project():
+        with GoogleAPIClient.client_lock:
+            if GoogleAPIClient.project is None:
+                GoogleAPIClient.project = GoogleAPIClient.__run_gcloud("gcloud config get-value project",
+                                                                       err_msg="Unable to determine Google project")
+            return GoogleAPIClient.project
+
+    @staticmethod
+    def get_url(api, path):
+        # Return url of a resource path within an API
+        return "%s/%s" % (GoogleAPIClient.api_roots[api], path.lstrip("/"))
+
+    @staticmethod
+    def get(api, path, params=None, num_retries=5):
+        return GoogleAPIClient.request("GET", api, path, params=params, num_retries=num_retries)
+
+    @staticmethod
+    def post(api, path, body=None, params=None, num_retries=5, idempotent=False):
+        # POST requests (e.g. inserts) are only re-sent after a connection error if they're safe to repeat
+        return GoogleAPIClient.request("POST", api, path, params=params, body=body, num_retries=num_retries,
+                                       idempotent=idempotent)
+
+    @staticmethod
+    def delete(api, path, params=None, num_retries=5):
+        return GoogleAPIClient.request("DELETE", api, path, params=params, num_retries=num_retries)
+
+    @staticmethod
+    def list_items(api, path, item_key="items", params=None):
+        # Return all items of a (paged) list request
+        params = {} if params is None else dict(params)
+        items = []
+        prefixes = []
+        while True:
+            response = GoogleAPIClient.get(api, path, params=params)
+            items.extend(response.get(item_key, []))
+            prefixes.extend(response.get("prefixes", []))
+            if "nextPageToken" not in response:
+                break
+            params["pageToken"] = response["nextPageToken"]
+        return items, prefixes
+
+    @staticmethod
+    def request(method, api, path, params=None, body=None, num_retries=5, idempotent=None):
+        # Send request to API and return json response
+        # Only GET/DELETE requests are assumed to be safe to repeat unless specified otherwise
+
+        idempotent = method != "POST" if idempotent is None else idempotent
+        url = GoogleAPIClient.get_url(api, path)
+        try:
+            response = GoogleAPIClient.__get_session().request(method, url,
+                                                               params=params,
+                                                               json=body,
+                                                               headers=GoogleAPIClient.__get_headers(),
+                                                               timeout=GoogleAPIClient.REQUEST_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            # Retry requests that failed due to a connection problem
+            # Requests that aren't safe to repeat are only retried if they couldn't have reached the server
+            if num_retries > 0 and (idempotent or GoogleAPIClient.__is_connect_error(e)):
+                logging.debug("Google API request failed (%s %s): %s. Retrying..." % (method, url, e))
+                time.sleep(random.uniform(1, 5))
+                return GoogleAPIClient.request(method, api, path, params, body, num_retries=num_retries-1,
+                                               idempotent=idempotent)
+            logging.error("Google API request failed (%s %s)! The following error appeared:\n    %s" % (method, url, e))
+            raise GoogleAPIError("Google API request failed!")
+
+        with GoogleAPIClient.client_lock:
+            GoogleAPIClient.nr_requests += 1
+
+        # Case: Resource doesn't exist
+        if response.status_code == 404:
+            raise GoogleAPINotFound("Resource not found!")
+
+        # Case: Access token expired or was revoked
+        if response.status_code == 401 and num_retries > 0:
+            with GoogleAPIClient.client_lock:
+                GoogleAPIClient.access_token = None
+            return GoogleAPIClient.request(method, api, path, params, body, num_retries=num_retries-1,
+                                           idempotent=idempotent)
+
+        # Case: Rate limit or temporary server error
+        if (response.status_code == 429 or response.status_code >= 500) and num_retries > 0:
+            sleep_time = GoogleAPIClient.__get_retry_delay(response, num_retries)
+            logging.warning("Google API request returned status %d. Sleeping for %s seconds before re-trying...\n"
+                            "Failed request:\t%s %s" % (response.status_code, sleep_time, method, url))
+            time.sleep(sleep_time)
+            return GoogleAPIClient.request(method, api, path, params, body, num_retries=num_retries-1,
+                                           idempotent=idempotent)
+
+        if response.status_code >= 400:
+            logging.error("Google API request failed (%s %s) with status %d! The following error appeared:\n    %s"
+                          % (method, url, response.status_code, response.text))
+            raise GoogleAPIError("Google API request error!")
+
+        # Some requests (e.g. deletes) return no content
+        if len(response.content) == 0:
+            return {}
+        return response.json()
+
+    @staticmethod
+    def get_nr_requests():
+        return GoogleAPIClient.nr_requests
+
+    @staticmethod
+    def __get_session():
+        # Create session on first use so connections are only opened by pipelines using the APIs
+        with GoogleAPIClient.client_lock:
+            if GoogleAPIClient.session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=len(GoogleAPIClient.api_roots),
+                                      pool_maxsize=GoogleAPIClient.POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                GoogleAPIClient.session = session
+            return GoogleAPIClient.session
+
+    @staticmethod
+    def __get_headers():
+        # Return authorization header with a valid access token
+        access_token = GoogleAPIClient.__get_valid_token()
+        if access_token is None:
+            # Obtain new token without holding the client lock so other threads' requests aren't blocked by gcloud
+            with GoogleAPIClient.token_lock:
+                # Token may have been refreshed by another thread in the meantime
+                access_token = GoogleAPIClient.__get_valid_token()
+                if access_token is None:
+                    access_token = GoogleAPIClient.__run_gcloud("gcloud auth print-access-token",
+                                                                err_msg="Unable to obtain Google access token")
+                    with GoogleAPIClient.client_lock:
+                        GoogleAPIClient.access_token = access_token
+                        GoogleAPIClient.token_time = time.time()
+        return {"Authorization": "Bearer %s" % access_token}
+
+    @staticmethod
+    def __get_valid_token():
+        # Return current access token or None if it needs to be refreshed
+        with GoogleAPIClient.client_lock:
+            if GoogleAPIClient.access_token is None \
+                    or time.time() - GoogleAPIClient.token_time > GoogleAPIClient.TOKEN_TTL:
+                return None
+            return GoogleAPIClient.access_token
+
+    @staticmethod
+    def __is_connect_error(e):
+        # Return True if a request failed before a connection to the server was established (i.e. it was never sent)
+        if isinstance(e, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(e, requests.exceptions.ConnectionError) and len(e.args) > 0 and isinstance(e.args[0], MaxRetryError):
+            # Connection refused/unresolvable host are raised as a subclass of ConnectTimeoutError
+            return isinstance(e.args[0].reason, ConnectTimeoutError)
+        return False
+
+    @staticmethod
+    def __get_retry_delay(response, num_retries):
+        # Return seconds to wait before retrying request (server's advice or exponential backoff with jitter)
+        try:
+            return int(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return min(random.uniform(1, 2) * 2 ** (5 - num_retries), 60)
+
+    @staticmethod
+    def __run_gcloud(cmd, err_msg):
+        # Run gcloud command and return its output (only used for values that change rarely)
+        proc = sp.Popen(cmd, shell=True, stdout=sp.PIPE, stderr=sp.PIPE)
+        out, err = proc.communicate()
+        out = out.decode("utf8").strip()
+        if proc.returncode != 0 or out == "":
+            logging.error("%s. The following error appeared:\n    %s" % (err_msg, err.decode("utf8")))
+            raise GoogleAPIError("%s!" % err_msg)
+        return out
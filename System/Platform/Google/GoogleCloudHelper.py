@@ -5,10 +5,14 @@ import random
 import requests
 import base64
 import os
-import sys
 import math
 import zlib
 import time
+import threading
+from collections import OrderedDict
+
+from System.Platform.Google import GoogleAPIClient
+from System.Platform.Google.GoogleAPIClient import GoogleAPIError, GoogleAPINotFound
 
 
 class GoogleCloudHelperError(Exception):
@@ -19,11 +23,162 @@ class GoogleResourceNotFound(Exception):
     pass
 
 
+class ControlPlaneRequest(object):
+    # Instance operation (create/delete/start/stop) sent to Google Cloud in a single command
+    # along with the same operation requested for other instances at the same time
+    # Mimics the interface of a Process so instances can wait on requests like on any other command
+
+    def __init__(self, action, name, zone, args="", num_retries=0):
+
+        # Operation, instance and the gcloud options of the operation
+        self.action         = action
+        self.name           = name
+        self.zone           = zone
+        self.args           = args
+
+        # Equivalent command if the request was sent for the instance alone
+        self.command        = GoogleCloudHelper.get_instance_cmd(action, [name], zone, args)
+
+        self.num_retries    = num_retries
+        self.docker_image   = None
+        self.quiet          = False
+        self.log_success    = True
+        self.complete       = False
+        self.stopped        = False
+        self.to_rerun       = False
+        self.out            = ""
+        self.err            = ""
+
+        # Exit code and output of the batched command (set once the batch has been sent)
+        self.returncode     = None
+        self.batch_out      = b""
+        self.batch_err      = b""
+        self.done           = threading.Event()
+
+    def finish(self, out, err, returncode):
+        # Set result of the batched command the request was sent with
+        self.batch_out      = out
+        self.batch_err      = err
+        self.returncode     = returncode
+        self.done.set()
+
+    def communicate(self):
+        self.done.wait()
+        return self.batch_out, self.batch_err
+
+    def poll(self):
+        return self.returncode
+
+    def is_complete(self):
+        return self.complete
+
+    def set_complete(self):
+        self.complete = True
+
+    def set_output(self, out, err):
+        self.out = out
+        self.err = err
+
+    def has_failed(self):
+        return self.returncode is not None and self.returncode != 0
+
+    def get_command(self):
+        return self.command
+
+    def get_num_retries(self):
+        return self.num_retries
+
+    def get_docker_image(self):
+        return self.docker_image
+
+    def get_output(self):
+        return self.out, self.err
+
+    def is_quiet(self):
+        return self.quiet
+
+    def stop(self):
+        # Request can't be withdrawn from its batch so just mark it as stopped
+        self.stopped = True
+
+    def is_stopped(self):
+        return self.stopped
+
+    def do_log_success(self):
+        return self.log_success
+
+    def set_to_rerun(self):
+        self.to_rerun = True
+
+    def needs_rerun(self):
+        return self.to_rerun
+
+
 class GoogleCloudHelper(object):
 
     prices = None
-    machine_types = None
-    active_zones = None
+
+    # Active zones of the project: region (None for all regions) -> list of zones
+    active_zones = {}
+
+    # Machine types available in each zone: zone -> list of machine types
+    machine_types = {}
+
+    # Directory where snapshots of prices/machine types are kept between runs and seconds before they're refreshed
+    SNAPSHOT_DIR            = "~/.cloudconductor/gcp_snapshots/"
+    PRICES_TTL              = 24 * 3600
+    MACHINE_TYPES_TTL       = 7 * 24 * 3600
+
+    # Machine families instances can be created from
+    MACHINE_FAMILIES        = ["n1", "n2", "n2d", "c2", "e2"]
+
+    # Relative speed of a vCPU of each machine family (compared to n1)
+    # Used to estimate module runtimes on families the module hasn't run on yet
+    FAMILY_SPEEDS           = {"n1": 1.0, "e2": 1.0, "n2": 1.2, "n2d": 1.2, "c2": 1.4}
+
+    # Custom machine shapes of each family: (min vCPUs, allowed vCPU counts, min and max GB of memory per vCPU)
+    # None means any even number of vCPUs is allowed
+    CUSTOM_SHAPES           = {"n1":  (1, None, 0.9, 6.5),
+                               "n2":  (2, None, 0.5, 8.0),
+                               "n2d": (2, [2, 4, 8, 16, 32, 48, 64, 80, 96], 0.5, 8.0),
+                               "e2":  (2, list(range(2, 33, 2)), 0.5, 8.0)}
+
+    # Lock for loading prices/machine types from multiple threads
+    snapshot_lock = threading.Lock()
+
+    # Price (cents per GB) of transferring data out of a storage location to a region on the same/another continent
+    # Reading from a bucket in the same region, or in a multi-region/dual-region containing the region, is free
+    INTRA_CONTINENT_EGRESS_PRICE = 1.0
+    INTER_CONTINENT_EGRESS_PRICE = 8.0
+
+    # Regions included in each dual-region storage location
+    DUAL_REGIONS = {"NAM4":  ["us-central1", "us-east1"],
+                    "EUR4":  ["europe-north1", "europe-west4"],
+                    "ASIA1": ["asia-northeast1", "asia-northeast2"]}
+
+    # Continent of multi-region storage locations
+    MULTI_REGIONS = {"US": "northamerica", "EU": "europe", "ASIA": "asia"}
+
+    # Seconds an instance request waits for requests for the same operation on other instances before being sent
+    CONTROL_PLANE_BATCH_WINDOW = 2
+
+    # Seconds the list of instances in a zone is used to answer instance status requests before it's refreshed
+    INSTANCE_LIST_TTL = 10
+
+    # Lock for accessing instance requests/lists from multiple threads
+    control_plane_lock = threading.Lock()
+
+    # Requests waiting to be sent: (action, zone, args) -> list of requests
+    pending_requests = OrderedDict()
+
+    # Most recent list of the instances in each zone: zone -> (time of listing, {instance name: instance data})
+    instance_lists = {}
+
+    # Locks so only one thread lists the instances of a zone at a time
+    instance_list_locks = {}
+
+    # Time each zone last had instances created/deleted/started/stopped (lists made before that are out of date)
+    zone_change_times = {}
 
     @staticmethod
     def run_cmd(cmd, err_msg=None, num_retries=5):
@@ -61,21 +216,41 @@ class GoogleCloudHelper(object):
         return out
 
     @staticmethod
-    def get_active_zones(region=None):
-        # Return list of zones in a region
+    def call_api(method, api, path, params=None, body=None, err_msg=None, idempotent=False):
+        # Call a Google Cloud REST API through the shared client and return the response
+        # POST calls are only re-sent after a connection error if they're marked as idempotent
+        try:
+            if method == "post":
+                return GoogleAPIClient.post(api, path, body=body, params=params, idempotent=idempotent)
+            if method == "list_items":
+                return GoogleAPIClient.list_items(api, path, params=params)
+            if method == "delete":
+                return GoogleAPIClient.delete(api, path, params=params)
+            return GoogleAPIClient.get(api, path, params=params)
+
+        except GoogleAPINotFound:
+            raise GoogleResourceNotFound("Resource not found!")
+
+        except GoogleAPIError:
+            if err_msg is not None:
+                logging.error("%s. See the above error for details." % err_msg.rstrip("!."))
+            raise RuntimeError("GoogleCloudHelper API error!")
 
-        if GoogleCloudHelper.active_zones is not None:
-            return GoogleCloudHelper.active_zones
+    @staticmethod
+    def get_active_zones(region=None):
+        # Return list of zones in a region (zones are listed once per region)
+        with GoogleCloudHelper.snapshot_lock:
+            if region in GoogleCloudHelper.active_zones:
+                return list(GoogleCloudHelper.active_zones[region])
 
-        # Run command to get list of zones
-        cmd         = "gcloud compute zones list --format=json"
-        err_msg     = "Unable to list zones within the current project!"
-        out         = GoogleCloudHelper.run_cmd(cmd, err_msg)
+        # List the zones of the project
+        path        = "projects/%s/zones" % GoogleAPIClient.get_project()
+        items, _    = GoogleCloudHelper.call_api("list_items", "compute", path,
+                                                 err_msg="Unable to list zones within the current project!")
 
         # Parse json
         zones       = []
-        msg_json    = json.loads(out)
-        for zone in msg_json:
+        for zone in items:
             # Get region and zone name
             zone_name = zone["name"]
             region_name = GoogleCloudHelper.get_region(zone_name)
@@ -91,12 +266,56 @@ class GoogleCloudHelper(object):
 
             # Add zone to list of zones if its active and falls within filter region (or no filter region is provided)
             zones.append(zone["name"])
-        return zones
+
+        with GoogleCloudHelper.snapshot_lock:
+            GoogleCloudHelper.active_zones[region] = zones
+        return list(zones)
 
     @staticmethod
     def get_region(zone):
         return "-".join(zone.split("-")[0:2])
 
+    @staticmethod
+    def get_egress_price(location, region):
+        # Return price (cents per GB) of transferring data from a storage location (e.g. bucket location) to a region
+        if location is None:
+            return 0.0
+
+        location = location.upper()
+        if location == region.upper() or region in GoogleCloudHelper.DUAL_REGIONS.get(location, []):
+            return 0.0
+
+        # Dual-regions are on a single continent
+        if location in GoogleCloudHelper.DUAL_REGIONS:
+            location_continent = GoogleCloudHelper.get_continent(GoogleCloudHelper.DUAL_REGIONS[location][0])
+        else:
+            location_continent = GoogleCloudHelper.MULTI_REGIONS.get(location,
+                                                                     GoogleCloudHelper.get_continent(location.lower()))
+
+        # Multi-regions can be read for free from any region they contain
+        if location_continent == GoogleCloudHelper.get_continent(region):
+            return 0.0 if location in GoogleCloudHelper.MULTI_REGIONS else GoogleCloudHelper.INTRA_CONTINENT_EGRESS_PRICE
+        return GoogleCloudHelper.INTER_CONTINENT_EGRESS_PRICE
+
+    @staticmethod
+    def get_egress(input_locations, region):
+        # Return (GB, cost in cents) of transferring data stored in different locations to a region
+        # input_locations: location -> GB stored in location
+        egress_size = 0.0
+        egress_cost = 0.0
+        for location, size in input_locations.items():
+            price = GoogleCloudHelper.get_egress_price(location, region)
+            if price > 0:
+                egress_size += size
+                egress_cost += size * price
+        return egress_size, egress_cost
+
+    @staticmethod
+    def get_continent(region):
+        # Return continent of a region (e.g. us-east1 -> northamerica, europe-west4 -> europe)
+        prefix = region.split("-")[0]
+        return "northamerica" if prefix == "us" else prefix
+
     @staticmethod
     def select_random_zone(region):
         # Return a random active zone within a Compute region
@@ -114,37 +333,64 @@ class GoogleCloudHelper(object):
     @staticmethod
     def get_prices():
 
-        if GoogleCloudHelper.prices:
-            return GoogleCloudHelper.prices
+        with GoogleCloudHelper.snapshot_lock:
+            if GoogleCloudHelper.prices:
+                return GoogleCloudHelper.prices
 
-        try:
-            price_json_url = "https://cloudpricingcalculator.appspot.com/static/data/pricelist.json"
+            # Use prices saved by a recent run
+            GoogleCloudHelper.prices = GoogleCloudHelper.__load_snapshot("prices", GoogleCloudHelper.PRICES_TTL)
+            if GoogleCloudHelper.prices is not None:
+                return GoogleCloudHelper.prices
 
-            # Disabling low levels of logging from module requests
-            logging.getLogger("requests").setLevel(logging.WARNING)
+            try:
+                price_json_url = "https://cloudpricingcalculator.appspot.com/static/data/pricelist.json"
 
-            GoogleCloudHelper.prices = requests.get(price_json_url).json()["gcp_price_list"]
+                # Disabling low levels of logging from module requests
+                logging.getLogger("requests").setLevel(logging.WARNING)
 
-            return GoogleCloudHelper.prices
-        except BaseException as e:
-            if str(e) != "":
-                logging.error("Could not obtain instance prices. The following error appeared: %s." % e)
-            raise
+                GoogleCloudHelper.prices = requests.get(price_json_url).json()["gcp_price_list"]
+                GoogleCloudHelper.__save_snapshot("prices", GoogleCloudHelper.prices)
+
+                return GoogleCloudHelper.prices
+            except BaseException as e:
+                if str(e) != "":
+                    logging.error("Could not obtain instance prices. The following error appeared: %s." % e)
+                raise
 
     @staticmethod
     def get_machine_types(zone):
+        # Return the dedicated-cpu machine types of the supported families available in a zone
+
+        with GoogleCloudHelper.snapshot_lock:
+            if zone in GoogleCloudHelper.machine_types:
+                return GoogleCloudHelper.machine_types[zone]
 
-        if GoogleCloudHelper.machine_types:
-            return GoogleCloudHelper.machine_types
+            # Use machine types saved by a recent run
+            snapshot_name = "machine_types_%s" % zone
+            machine_types = GoogleCloudHelper.__load_snapshot(snapshot_name, GoogleCloudHelper.MACHINE_TYPES_TTL)
 
-        cmd = "gcloud compute machine-types list --filter='zone:(%s)' --format=json" % zone
-        machine_types = GoogleCloudHelper.run_cmd(cmd, err_msg="Cannot obtain machine types on GCP")
+            if machine_types is None:
+                path = "projects/%s/zones/%s/machineTypes" % (GoogleAPIClient.get_project(), zone)
+                machine_types, _ = GoogleCloudHelper.call_api("list_items", "compute", path,
+                                                              err_msg="Cannot obtain machine types on GCP")
 
-        # Select only F1, G1, N1 instances
-        GoogleCloudHelper.machine_types = [ m_type for m_type in json.loads(machine_types)
-                                            if m_type["name"][:2].lower() in ["f1", "g1", "n1"]]
+                # Select only standard/highcpu/highmem machine types of supported families that don't share cpus
+                machine_types = [{"name": m_type["name"],
+                                  "guestCpus": m_type["guestCpus"],
+                                  "memoryMb": m_type["memoryMb"]} for m_type in machine_types
+                                 if GoogleCloudHelper.get_machine_family(m_type["name"]) in GoogleCloudHelper.MACHINE_FAMILIES
+                                 and m_type["name"].split("-")[1] in ["standard", "highcpu", "highmem"]
+                                 and not m_type.get("isSharedCpu", False)]
+                GoogleCloudHelper.__save_snapshot(snapshot_name, machine_types)
 
-        return GoogleCloudHelper.machine_types
+            GoogleCloudHelper.machine_types[zone] = machine_types
+            return machine_types
+
+    @staticmethod
+    def get_machine_family(instance_type):
+        # Return machine family of an instance type (e.g. 'n2' for 'n2-standard-8' and 'n1' for 'custom-4-16')
+        family = instance_type.split("-")[0]
+        return "n1" if family == "custom" else family
 
     @staticmethod
     def send_pubsub_message(topic, message=None, attributes=None, encode=True, compress=False):
@@ -166,15 +412,17 @@ class GoogleCloudHelper(object):
         if encode:
             message = base64.b64encode(message).decode("utf8")
 
-        # Parse the attributes and pack into a single data structure message
-        attrs = ",".join(["%s=%s" % (str(k), str(v)) for k, v in attributes.items()])
-
-        # Run command to publish message to the topic
-        cmd = "gcloud --quiet --no-user-output-enabled pubsub topics publish %s --message \"%s\" --attribute=%s" \
-              % (topic, message, attrs)
+        # Message data is sent base64 encoded
+        if not isinstance(message, bytes):
+            message = message.encode("utf8")
+        pubsub_message = {"data": base64.b64encode(message).decode("utf8")}
+        if len(attributes) > 0:
+            pubsub_message["attributes"] = {str(k): str(v) for k, v in attributes.items()}
 
+        # Publish message to the topic
+        path = "projects/%s/topics/%s:publish" % (GoogleAPIClient.get_project(), topic)
         err_msg = "Could not send a message to Google Pub/Sub"
-        GoogleCloudHelper.run_cmd(cmd, err_msg=err_msg)
+        GoogleCloudHelper.call_api("post", "pubsub", path, body={"messages": [pubsub_message]}, err_msg=err_msg)
 
     @staticmethod
     def authenticate(key_file):
@@ -187,6 +435,9 @@ class GoogleCloudHelper(object):
         cmd = "gcloud auth activate-service-account --key-file %s" % key_file
         GoogleCloudHelper.run_cmd(cmd, "Authentication to Google Cloud failed!")
 
+        # API calls are made for the project of the service account
+        GoogleAPIClient.configure(project=GoogleCloudHelper.get_field_from_key_file(key_file, "project_id"))
+
         logging.info("Authentication to Google Cloud was successful.")
 
     @staticmethod
@@ -204,24 +455,15 @@ class GoogleCloudHelper(object):
 
     @staticmethod
     def get_disk_image_info(disk_image_name):
-        # Returns information about a disk image for a project. Returns none if no image exists with the name.
-        cmd = "gcloud compute images list --format=json"
-        proc = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE, shell=True)
-        out, err = proc.communicate()
-
-        # Convert to string formats
-        out = out.decode("utf8")
-        err = err.decode("utf8")
-
-        # Load results into json
-        disk_images = json.loads(out.rstrip())
-        for disk_image in disk_images:
-            if disk_image["name"] == disk_image_name:
-                return disk_image
-
-        # Throw error because disk image can't be found
-        logging.error("Unable to find disk image '%s'" % disk_image_name)
-        raise GoogleCloudHelperError("Invalid disk image provided in GooglePlatform config!")
+        # Returns information about a disk image for a project
+        try:
+            path = "projects/%s/global/images/%s" % (GoogleAPIClient.get_project(), disk_image_name)
+            return GoogleCloudHelper.call_api("get", "compute", path,
+                                              err_msg="Unable to get info of disk image '%s'" % disk_image_name)
+        except GoogleResourceNotFound:
+            # Throw error because disk image can't be found
+            logging.error("Unable to find disk image '%s'" % disk_image_name)
+            raise GoogleCloudHelperError("Invalid disk image provided in GooglePlatform config!")
 
     @staticmethod
     def get_field_from_key_file(key_file, field_name):
@@ -248,23 +490,13 @@ class GoogleCloudHelper(object):
     def pubsub_topic_exists(topic_id):
 
         # Check to see if the reporting Pub/Sub topic exists
-        cmd = "gcloud pubsub topics list --format=json"
-        out, err = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE, shell=True).communicate()
-
-        # Convert to string formats
-        out = out.decode("utf8")
-        err = err.decode("utf8")
-
-        if len(err):
-            logging.error("Cannot verify if the pubsub topic '%s' exists. The following error appeared: %s" % (topic_id, err))
-            raise GoogleCloudHelperError("Cannot verify if pubsub topic exists. Please check the above error message.")
-
-        topics = json.loads(out)
-        for topic in topics:
-            if topic["name"].split("/")[-1] == topic_id:
-                return True
-
-        return False
+        try:
+            path = "projects/%s/topics/%s" % (GoogleAPIClient.get_project(), topic_id)
+            GoogleCloudHelper.call_api("get", "pubsub", path,
+                                       err_msg="Cannot verify if the pubsub topic '%s' exists" % topic_id)
+            return True
+        except GoogleResourceNotFound:
+            return False
 
     @staticmethod
     def get_bucket_from_path(path):
@@ -290,121 +522,82 @@ class GoogleCloudHelper(object):
         GoogleCloudHelper.run_cmd(cmd, "Unable to make bucket '%s'!" % gs_bucket)
 
     @staticmethod
-    def get_optimal_instance_type(nr_cpus, mem, zone, is_preemptible=False):
-
-        # Obtaining prices from Google Cloud Platform
-        prices = GoogleCloudHelper.get_prices()
-
-        # Defining instance types to mem/cpu ratios
-        ratio = dict()
-        ratio["highcpu"] = 1.80 / 2
-        ratio["standard"] = 7.50 / 2
-        ratio["highmem"] = 13.00 / 2
-
-        # Identifying needed predefined instance type
-        if nr_cpus == 1:
-            instance_type = "standard"
-        else:
-            ratio_mem_cpu = mem * 1.0 / nr_cpus
-            if ratio_mem_cpu <= ratio["highcpu"]:
-                instance_type = "highcpu"
-            elif ratio_mem_cpu <= ratio["standard"]:
-                instance_type = "standard"
-            else:
-                instance_type = "highmem"
-
-        # Obtain available machine type in the current zone
-        machine_types = GoogleCloudHelper.get_machine_types(zone)
+    def get_optimal_instance_type(nr_cpus, mem, zone, is_preemptible=False, families=None, family_runtimes=None):
+        # Return nr_cpus, mem, and name of the instance type that's expected to run a task for the lowest cost
+        # Candidates are the smallest predefined machine type of each family with enough cpus/mem and a custom shape
+        # of each family supporting custom shapes. The expected cost of a candidate is its price multiplied by the task's
+        # expected runtime on the candidate's family (family_runtimes: family -> sec, families assumed equally fast
+        # if not provided). Ties are broken by the expected runtime.
+        families = GoogleCloudHelper.MACHINE_FAMILIES if families is None else families
+        region = GoogleCloudHelper.get_region(zone)
 
-        # Initializing predefined instance data
-        predef_inst = {}
+        # Obtain the candidate instance types
+        candidates = GoogleCloudHelper.__get_predefined_candidates(nr_cpus, mem, zone, families)
+        candidates.extend(GoogleCloudHelper.__get_custom_candidates(nr_cpus, mem, families))
 
-        # Obtain the machine type that has the closes number of CPUs
-        predef_inst["nr_cpus"] = sys.maxsize
-        for machine_type in machine_types:
+        # Rank candidates by expected cost then expected runtime
+        best_score = None
+        best_inst = None
+        for inst_cpus, inst_mem, inst_type in candidates:
 
-            # Skip instances that are not of the same type
-            if instance_type not in machine_type["name"]:
+            # Skip candidates that can't be priced in the region
+            try:
+                price = GoogleCloudHelper.get_machine_price(inst_type, inst_cpus, inst_mem, region, is_preemptible)
+            except KeyError:
+                logging.debug("Unable to price instance type '%s' in region '%s'. Skipping it." % (inst_type, region))
                 continue
 
-            # Select the instance if its number of vCPUs is closer to the required nr_cpus
-            if machine_type["guestCpus"] >= nr_cpus and machine_type["guestCpus"] < predef_inst["nr_cpus"]:
-                predef_inst["nr_cpus"] = machine_type["guestCpus"]
-                predef_inst["mem"] = machine_type["memoryMb"] / 1024
-                predef_inst["type_name"] = machine_type["name"]
+            runtime = 1.0
+            if family_runtimes is not None:
+                runtime = family_runtimes.get(GoogleCloudHelper.get_machine_family(inst_type), 1.0)
 
-        # Obtaining the price of the predefined instance
-        region = GoogleCloudHelper.get_region(zone)
-        if is_preemptible:
-            predef_inst["price"] = prices["CP-COMPUTEENGINE-VMIMAGE-%s-PREEMPTIBLE" % predef_inst["type_name"].upper()][region]
-        else:
-            predef_inst["price"] = prices["CP-COMPUTEENGINE-VMIMAGE-%s" % predef_inst["type_name"].upper()][region]
+            score = (price * runtime, runtime)
+            if best_score is None or score < best_score:
+                best_score = score
+                best_inst = (inst_cpus, inst_mem, inst_type)
 
-        # Initializing custom instance data
-        custom_inst = {}
+        if best_inst is None:
+            logging.error("Unable to find an instance type with %s cpus and %sGB memory in zone '%s' among "
+                          "machine families: %s" % (nr_cpus, mem, zone, ", ".join(families)))
+            raise GoogleCloudHelperError("GoogleCloudHelper failed to select an instance type!")
 
-        # Computing the number of cpus for a possible custom machine and making sure it's an even number or 1.
-        custom_inst["nr_cpus"] = 1 if nr_cpus == 1 else nr_cpus + nr_cpus%2
-
-        # Making sure the memory value is not under HIGHCPU and not over HIGHMEM
-        if nr_cpus != 1:
-            mem = max(ratio["highcpu"] * custom_inst["nr_cpus"], mem)
-            mem = min(ratio["highmem"] * custom_inst["nr_cpus"], mem)
-        else:
-            mem = max(1, mem)
-            mem = min(6, mem)
+        return best_inst
 
-        # Computing the ceil of the current memory
-        custom_inst["mem"] = int(math.ceil(mem))
-
-        # Generating custom instance name
-        custom_inst["type_name"] = "custom-%d-%d" % (custom_inst["nr_cpus"], custom_inst["mem"])
-
-        # Computing the price of a custom instance
-        if is_preemptible:
-            custom_price_cpu = prices["CP-COMPUTEENGINE-CUSTOM-VM-CORE-PREEMPTIBLE"][region]
-            custom_price_mem = prices["CP-COMPUTEENGINE-CUSTOM-VM-RAM-PREEMPTIBLE"][region]
-        else:
-            custom_price_cpu = prices["CP-COMPUTEENGINE-CUSTOM-VM-CORE"][region]
-            custom_price_mem = prices["CP-COMPUTEENGINE-CUSTOM-VM-RAM"][region]
-        custom_inst["price"] = custom_price_cpu * custom_inst["nr_cpus"] + custom_price_mem * custom_inst["mem"]
+    @staticmethod
+    def get_machine_price(instance_type, nr_cpus, mem, region, is_preemptible=False):
+        # Return hourly price of the cpus/mem of an instance type in a region
+        prices = GoogleCloudHelper.get_prices()
+        family = GoogleCloudHelper.get_machine_family(instance_type).upper()
+        suffix = "-PREEMPTIBLE" if is_preemptible else ""
 
-        # Determine which is cheapest and return
-        if predef_inst["price"] <= custom_inst["price"]:
-            nr_cpus = predef_inst["nr_cpus"]
-            mem = predef_inst["mem"]
-            instance_type = predef_inst["type_name"]
+        # Get price of CPUs, mem for custom instance
+        if "custom" in instance_type:
+            if family == "N1":
+                cpu_price_key = "CP-COMPUTEENGINE-CUSTOM-VM-CORE%s" % suffix
+                mem_price_key = "CP-COMPUTEENGINE-CUSTOM-VM-RAM%s" % suffix
+            else:
+                cpu_price_key = "CP-COMPUTEENGINE-%s-CUSTOM-VM-CORE%s" % (family, suffix)
+                mem_price_key = "CP-COMPUTEENGINE-%s-CUSTOM-VM-RAM%s" % (family, suffix)
+            return prices[cpu_price_key][region]*nr_cpus + prices[mem_price_key][region]*mem
 
-        else:
-            nr_cpus = custom_inst["nr_cpus"]
-            mem = custom_inst["mem"]
-            instance_type = custom_inst["type_name"]
+        # Get price of predefined instance
+        price_key = "CP-COMPUTEENGINE-VMIMAGE-%s%s" % (instance_type.upper(), suffix)
+        if price_key in prices:
+            return prices[price_key][region]
 
-        return nr_cpus, mem, instance_type
+        # Newer families are priced by the cpus/mem of the instance
+        cpu_price_key = "CP-COMPUTEENGINE-%s-PREDEFINED-VM-CORE%s" % (family, suffix)
+        mem_price_key = "CP-COMPUTEENGINE-%s-PREDEFINED-VM-RAM%s" % (family, suffix)
+        return prices[cpu_price_key][region]*nr_cpus + prices[mem_price_key][region]*mem
 
     @staticmethod
     def get_instance_price(nr_cpus, mem, disk_space, instance_type, zone, is_preemptible=False, is_boot_disk_ssd=False, nr_local_ssd=0):
 
         prices = GoogleCloudHelper.get_prices()
         region = GoogleCloudHelper.get_region(zone)
-        is_custom = instance_type.startswith('custom')
-        price = 0
-
-        # Get price of CPUs, mem for custom instance
-        if is_custom:
-            cpu_price_key = "CP-COMPUTEENGINE-CUSTOM-VM-CORE"
-            mem_price_key = "CP-COMPUTEENGINE-CUSTOM-VM-RAM"
-            if is_preemptible:
-                cpu_price_key += "-PREEMPTIBLE"
-                mem_price_key += "-PREEMPTIBLE"
-            price += prices[cpu_price_key][region]*nr_cpus + prices[mem_price_key][region]*mem
 
-        # Get price of CPUs, mem for standard instance
-        else:
-            price_key = "CP-COMPUTEENGINE-VMIMAGE-%s" % instance_type.upper()
-            if is_preemptible:
-                price_key = "CP-COMPUTEENGINE-VMIMAGE-%s-PREEMPTIBLE" % instance_type.upper()
-            price += prices[price_key][region]
+        # Get price of CPUs, mem
+        price = GoogleCloudHelper.get_machine_price(instance_type, nr_cpus, mem, region, is_preemptible)
 
         # Get price of the instance's disk
         if is_boot_disk_ssd:
@@ -421,15 +614,58 @@ class GoogleCloudHelper(object):
 
         return price
 
+    @staticmethod
+    def get_family_runtimes(runtimes, families=None):
+        # Return expected runtime of a task on each machine family
+        # runtimes: family -> runtime (sec) measured for the task's module on that family
+        # Runtimes on families without measurements are scaled from the measurement on the most similar family
+        families = GoogleCloudHelper.MACHINE_FAMILIES if families is None else families
+        if len(runtimes) == 0:
+            return None
+
+        family_runtimes = {}
+        for family in families:
+            if family in runtimes:
+                family_runtimes[family] = runtimes[family]
+                continue
+            speed = GoogleCloudHelper.FAMILY_SPEEDS.get(family, 1.0)
+            ref_family = min(runtimes, key=lambda f: abs(GoogleCloudHelper.FAMILY_SPEEDS.get(f, 1.0) - speed))
+            family_runtimes[family] = runtimes[ref_family] * GoogleCloudHelper.FAMILY_SPEEDS.get(ref_family, 1.0) / speed
+        return family_runtimes
+
     @staticmethod
     def ls(gs_path):
-        # List files that match a directory
-        cmd = "gsutil ls %s" % gs_path
-        out = GoogleCloudHelper.run_cmd(cmd, "Unable to list files on google storage path: %s" % gs_path)
-        out_files = out.split("\n")
-        if "" in out_files:
-            out_files.remove("")
-        return out_files
+        # List files that match a path (same output as 'gsutil ls')
+        # Wildcard paths list every matching object while directory paths list the objects/sub-directories they contain
+        bucket      = GoogleCloudHelper.get_bucket_from_path(gs_path)
+        bucket_name = bucket[5:].rstrip("/")
+        obj_path    = gs_path[len(bucket):] if len(gs_path) > len(bucket) else ""
+        path        = "b/%s/o" % bucket_name
+        err_msg     = "Unable to list files on google storage path: %s" % gs_path
+
+        # Case: Path contains wildcards
+        if any(char in obj_path for char in "*?["):
+            items, _ = GoogleCloudHelper.call_api("list_items", "storage", path,
+                                                  params={"matchGlob": obj_path, "fields": "items(name),nextPageToken"},
+                                                  err_msg=err_msg)
+            return ["%s%s" % (bucket, item["name"]) for item in items]
+
+        # Case: Path is an object
+        if obj_path != "" and not obj_path.endswith("/"):
+            items, _ = GoogleCloudHelper.call_api("list_items", "storage", path,
+                                                  params={"prefix": obj_path, "delimiter": "/",
+                                                          "fields": "items(name),prefixes,nextPageToken"},
+                                                  err_msg=err_msg)
+            if obj_path in [item["name"] for item in items]:
+                return ["%s%s" % (bucket, obj_path)]
+            obj_path += "/"
+
+        # Case: Path is a directory
+        items, prefixes = GoogleCloudHelper.call_api("list_items", "storage", path,
+                                                     params={"prefix": obj_path, "delimiter": "/",
+                                                             "fields": "items(name),prefixes,nextPageToken"},
+                                                     err_msg=err_msg)
+        return ["%s%s" % (bucket, name) for name in [item["name"] for item in items] + prefixes]
 
     @staticmethod
     def get_external_ip(name, zone):
@@ -444,15 +680,207 @@ class GoogleCloudHelper(object):
         return external_ip
 
     @staticmethod
-    def describe(ins_name, zone):
-        cmd = 'gcloud compute instances describe %s --format json --zone %s' % (ins_name, zone)
-        out = GoogleCloudHelper.run_cmd(cmd, err_msg="Unable to describe instance '%s'!" % ins_name)
+    def submit_instance_request(action, name, zone, args="", num_retries=0):
+        # Request an operation on an instance and return the request so the caller can wait for it
+        # Requests for the same operation with the same options in the same zone are sent together in a single command
+        request = ControlPlaneRequest(action, name, zone, args, num_retries)
+        batch_key = (action, zone, args)
+
+        with GoogleCloudHelper.control_plane_lock:
+            new_batch = batch_key not in GoogleCloudHelper.pending_requests
+            if new_batch:
+                GoogleCloudHelper.pending_requests[batch_key] = []
+            GoogleCloudHelper.pending_requests[batch_key].append(request)
+
+        # First request of a batch sends the batch once other requests have had time to join it
+        if new_batch:
+            sender = threading.Thread(target=GoogleCloudHelper.__send_instance_requests, args=(batch_key,))
+            sender.daemon = True
+            sender.start()
+
+        return request
+
+    @staticmethod
+    def get_instance_cmd(action, names, zone, args=""):
+        # Return gcloud command performing an operation on one or more instances
+        if action == "create" and len(names) > 1:
+            # Create identical instances with a single bulk insert
+            cmd = "gcloud compute instances bulk create --predefined-names=%s --zone %s" % (",".join(names), zone)
+        else:
+            cmd = "gcloud compute instances %s %s --zone %s" % (action, " ".join(names), zone)
+
+        if args != "":
+            cmd = "%s %s" % (cmd, args)
+
+        # Provide input to confirmation prompt of delete command
+        if action == "delete":
+            cmd = "yes 2>/dev/null | %s" % cmd
+        return cmd
+
+    @staticmethod
+    def get_instance_info(name, zone):
+        # Return Google Cloud info of an instance (same info as 'instances describe')
+        # Answered from a list of every instance in the zone that's shared by all instances in the zone
+        instances = GoogleCloudHelper.__get_zone_instances(zone)
+        if name not in instances:
+            raise GoogleResourceNotFound("Resource not found!")
+        return instances[name]
+
+    @staticmethod
+    def __get_zone_instances(zone):
+        # Return the most recent list of the instances in a zone: {instance name: instance data}
+        with GoogleCloudHelper.control_plane_lock:
+            if zone not in GoogleCloudHelper.instance_list_locks:
+                GoogleCloudHelper.instance_list_locks[zone] = threading.Lock()
+            list_lock = GoogleCloudHelper.instance_list_locks[zone]
+
+        with list_lock:
+            list_time, instances = GoogleCloudHelper.instance_lists.get(zone, (0, {}))
+
+            # Re-list instances if list is too old or instances have been changed since it was made
+            if time.time() - list_time > GoogleCloudHelper.INSTANCE_LIST_TTL \
+                    or list_time <= GoogleCloudHelper.zone_change_times.get(zone, 0):
+                list_time   = time.time()
+                path        = "projects/%s/zones/%s/instances" % (GoogleAPIClient.get_project(), zone)
+                items, _    = GoogleCloudHelper.call_api("list_items", "compute", path,
+                                                         err_msg="Unable to list instances in zone '%s'" % zone)
+                instances   = {instance["name"]: instance for instance in items}
+                GoogleCloudHelper.instance_lists[zone] = (list_time, instances)
+
+        return instances
+
+    @staticmethod
+    def __send_instance_requests(batch_key):
+        # Send all requests in a batch as a single command and pass the result to each request
+        time.sleep(GoogleCloudHelper.CONTROL_PLANE_BATCH_WINDOW)
+        with GoogleCloudHelper.control_plane_lock:
+            batch = GoogleCloudHelper.pending_requests.pop(batch_key)
+
+        action, zone, args = batch_key
+        out, err, returncode = GoogleCloudHelper.__run_instance_cmd(action, batch, zone, args)
+
+        # Bulk creation fails as a whole if the zone can't fit every instance (e.g. stockout or quota)
+        # Instances that were created anyway succeed and the rest are retried together, letting the zone create
+        # as many of them as it can. Only instances that still weren't created fail on their own.
+        if action == "create" and len(batch) > 1 and returncode != 0:
+            try:
+                batch = GoogleCloudHelper.__finish_created_requests(batch, zone, out, err)
+                if len(batch) > 0:
+                    logging.warning("Unable to create %d instance(s) in zone '%s'. Retrying creation of the instances "
+                                    "that weren't created." % (len(batch), zone))
+
+                    # Bulk create as many of the remaining instances as possible
+                    retry_args = ("%s --min-count=1" % args).strip() if len(batch) > 1 else args
+                    retry_out, retry_err, retry_returncode = \
+                        GoogleCloudHelper.__run_instance_cmd(action, batch, zone, retry_args)
+                    batch = GoogleCloudHelper.__finish_created_requests(batch, zone, retry_out, retry_err)
+
+                    # Keep the original error if the retry didn't report why the remaining instances weren't created
+                    if retry_returncode != 0:
+                        out, err, returncode = retry_out, retry_err, retry_returncode
+
+            except BaseException as e:
+                # Remaining requests fail with the error of the batch if the created instances can't be determined
+                logging.warning("Unable to determine which instances were created in zone '%s': %s" % (zone, e))
+
+        for request in batch:
+            request.finish(out, err, returncode)
+
+    @staticmethod
+    def __run_instance_cmd(action, batch, zone, args):
+        # Run a single command performing an operation on the instances of a batch of requests
+        # Returns the output and exit code of the command
+        cmd = GoogleCloudHelper.get_instance_cmd(action, [request.name for request in batch], zone, args)
+        logging.debug("Sending '%s' request for %d instance(s) in zone '%s'." % (action, len(batch), zone))
+        try:
+            proc = sp.Popen(cmd, shell=True, stdout=sp.PIPE, stderr=sp.PIPE)
+            out, err = proc.communicate()
+            returncode = proc.returncode
+        except BaseException as e:
+            out, err, returncode = b"", str(e).encode("utf8"), 1
+
+        # Instance lists made before the operation finished are out of date
+        with GoogleCloudHelper.control_plane_lock:
+            GoogleCloudHelper.zone_change_times[zone] = time.time()
+
+        return out, err, returncode
+
+    @staticmethod
+    def __finish_created_requests(batch, zone, out, err):
+        # Complete the create requests of instances that exist in the zone
+        # Returns the requests of instances that weren't created
+        instances = GoogleCloudHelper.__get_zone_instances(zone)
+        remaining = []
+        for request in batch:
+            if request.name in instances:
+                request.finish(out, err, 0)
+            else:
+                remaining.append(request)
+        return remaining
+
+    @staticmethod
+    def create_disk(disk_name, zone, disk_space, is_ssd=False):
+        # Create an empty persistent disk (size in GB) and wait for it to be ready
+        disk_type = "pd-ssd" if is_ssd else "pd-standard"
+        body = {"name": disk_name,
+                "sizeGb": str(int(disk_space)),
+                "type": "zones/%s/diskTypes/%s" % (zone, disk_type)}
+        path = "projects/%s/zones/%s/disks" % (GoogleAPIClient.get_project(), zone)
+        operation = GoogleCloudHelper.call_api("post", "compute", path, body=body,
+                                               err_msg="Unable to create disk '%s'" % disk_name)
+        GoogleCloudHelper.wait_for_operation(operation, zone)
+
+    @staticmethod
+    def delete_disk(disk_name, zone):
+        # Delete a persistent disk (disks that no longer exist are ignored)
+        path = "projects/%s/zones/%s/disks/%s" % (GoogleAPIClient.get_project(), zone, disk_name)
         try:
-            return json.loads(out)
-        except ValueError:
-            logging.error("GoogleCloudHelper describe returned non-json output for instance '%s'!"
-                          "Output received:\n%s" % (ins_name, out))
-            raise
+            operation = GoogleCloudHelper.call_api("delete", "compute", path,
+                                                   err_msg="Unable to delete disk '%s'" % disk_name)
+        except GoogleResourceNotFound:
+            return
+        GoogleCloudHelper.wait_for_operation(operation, zone)
+
+    @staticmethod
+    def attach_disk(ins_name, zone, disk_name, device_name, auto_delete=True):
+        # Attach an existing persistent disk to an instance
+        # Disk will be deleted along with the instance if auto_delete is set
+        body = {"source": "projects/%s/zones/%s/disks/%s" % (GoogleAPIClient.get_project(), zone, disk_name),
+                "deviceName": device_name,
+                "autoDelete": auto_delete}
+        path = "projects/%s/zones/%s/instances/%s/attachDisk" % (GoogleAPIClient.get_project(), zone, ins_name)
+        operation = GoogleCloudHelper.call_api("post", "compute", path, body=body,
+                                               err_msg="Unable to attach disk '%s' to '%s'" % (disk_name, ins_name))
+        GoogleCloudHelper.wait_for_operation(operation, zone)
+
+    @staticmethod
+    def detach_disk(ins_name, zone, device_name):
+        # Detach a disk from an instance so it outlives the instance
+        path = "projects/%s/zones/%s/instances/%s/detachDisk" % (GoogleAPIClient.get_project(), zone, ins_name)
+        operation = GoogleCloudHelper.call_api("post", "compute", path, params={"deviceName": device_name},
+                                               err_msg="Unable to detach disk '%s' from '%s'" % (device_name, ins_name))
+        GoogleCloudHelper.wait_for_operation(operation, zone)
+
+    @staticmethod
+    def wait_for_operation(operation, zone):
+        # Wait for a zonal compute operation to finish and raise an error if it failed
+        path = "projects/%s/zones/%s/operations/%s" % (GoogleAPIClient.get_project(), zone, operation["name"])
+        while operation.get("status", None) != "DONE":
+            # Wait call returns once the operation is done or after at most 2 minutes
+            operation = GoogleCloudHelper.call_api("post", "compute", "%s/wait" % path,
+                                                   err_msg="Unable to wait for operation '%s'" % operation["name"],
+                                                   idempotent=True)
+
+        if "error" in operation:
+            logging.error("Google Cloud operation '%s' on '%s' failed with the following errors:\n%s"
+                          % (operation.get("operationType", ""), operation.get("targetLink", ""),
+                             json.dumps(operation["error"], indent=4)))
+            raise RuntimeError("GoogleCloudHelper operation error!")
+
+    @staticmethod
+    def describe(ins_name, zone):
+        path = "projects/%s/zones/%s/instances/%s" % (GoogleAPIClient.get_project(), zone, ins_name)
+        return GoogleCloudHelper.call_api("get", "compute", path, err_msg="Unable to describe instance '%s'!" % ins_name)
 
     @staticmethod
     def remove_metadata(name, zone, keys):
@@ -468,3 +896,82 @@ class GoogleCloudHelper(object):
 
         # Run command
         GoogleCloudHelper.run_cmd(cmd, err_msg="Could not remove metadata from instance '%s'" % name)
+
+    @staticmethod
+    def __get_predefined_candidates(nr_cpus, mem, zone, families):
+        # Return the smallest predefined machine type of each family with enough cpus and memory
+        smallest = {}
+        for machine_type in GoogleCloudHelper.get_machine_types(zone):
+            family = GoogleCloudHelper.get_machine_family(machine_type["name"])
+            inst_mem = machine_type["memoryMb"] / 1024.0
+            if family not in families or machine_type["guestCpus"] < nr_cpus or inst_mem < mem:
+                continue
+            candidate = (machine_type["guestCpus"], inst_mem, machine_type["name"])
+            if family not in smallest or candidate[0:2] < smallest[family][0:2]:
+                smallest[family] = candidate
+        return list(smallest.values())
+
+    @staticmethod
+    def __get_custom_candidates(nr_cpus, mem, families):
+        # Return the custom shape of each family closest to the required cpus and memory
+        candidates = []
+        for family in families:
+            if family not in GoogleCloudHelper.CUSTOM_SHAPES:
+                continue
+            min_cpus, allowed_cpus, min_mem_ratio, max_mem_ratio = GoogleCloudHelper.CUSTOM_SHAPES[family]
+
+            # Add cpus if memory per cpu would be above the family's maximum
+            inst_cpus = max(nr_cpus, min_cpus, int(math.ceil(mem / max_mem_ratio)))
+
+            # Round to a number of cpus the family allows (1 or an even number by default)
+            if allowed_cpus is None:
+                inst_cpus = inst_cpus if inst_cpus == 1 else inst_cpus + inst_cpus % 2
+            else:
+                inst_cpus = min([cpus for cpus in allowed_cpus if cpus >= inst_cpus], default=None)
+                if inst_cpus is None:
+                    continue
+
+            # Raise memory to the family's minimum memory per cpu and round up to the nearest GB
+            inst_mem = int(math.ceil(max(mem, min_mem_ratio * inst_cpus, 1)))
+            if inst_mem > max_mem_ratio * inst_cpus:
+                continue
+
+            # Custom n1 types are named without their family
+            inst_type = "custom-%d-%d" % (inst_cpus, inst_mem)
+            if family != "n1":
+                inst_type = "%s-%s" % (family, inst_type)
+            candidates.append((inst_cpus, inst_mem, inst_type))
+        return candidates
+
+    @staticmethod
+    def __load_snapshot(snapshot_name, ttl):
+        # Return data saved by a previous run if it's more recent than ttl seconds (None otherwise)
+        snapshot_file = os.path.join(os.path.expanduser(GoogleCloudHelper.SNAPSHOT_DIR), "%s.json" % snapshot_name)
+        if not os.path.exists(snapshot_file) or time.time() - os.path.getmtime(snapshot_file) > ttl:
+            return None
+        try:
+            with open(snapshot_file, "r") as fh:
+                return json.load(fh)
+        except BaseException as e:
+            logging.warning("Unable to read '%s'. It will be downloaded again." % snapshot_file)
+            if str(e) != "":
+                logging.debug("Received the following message:\n%s" % e)
+            return None
+
+    @staticmethod
+    def __save_snapshot(snapshot_name, data):
+        # Save data so runs starting within its ttl don't need to download it
+        snapshot_dir = os.path.expanduser(GoogleCloudHelper.SNAPSHOT_DIR)
+        try:
+            if not os.path.exists(snapshot_dir):
+                os.makedirs(snapshot_dir)
+            # Write to temporary file first so concurrent runs never read a partial snapshot
+            tmp_file = os.path.join(snapshot_dir, "%s.json.%d" % (snapshot_name, os.getpid()))
+            with open(tmp_file, "w") as fh:
+                json.dump(data, fh)
+            os.rename(tmp_file, os.path.join(snapshot_dir, "%s.json" % snapshot_name))
+        except BaseException as e:
+            # Losing the snapshot only means it will be downloaded again by the next run
+            logging.warning("Unable to save '%s' to '%s'!" % (snapshot_name, snapshot_dir))
+            if str(e) != "":
+                logging.debug("Received the following message:\n%s" % e)
@@ -4,7 +4,7 @@ import subprocess as sp
 import tempfile
 
 from System.Platform import Platform
-from System.Platform.Google import Instance, PreemptibleInstance, GoogleCloudHelper
+from System.Platform.Google import Instance, PreemptibleInstance, PreemptionPolicy, ZonePlacement, GoogleCloudHelper
 
 class GooglePlatform(Platform):
 
@@ -22,7 +22,7 @@ class GooglePlatform(Platform):
         # Get Google compute zone from config
         self.zone = self.config["zone"]
 
-        # Determine whether to distribute processors across zones randomly
+        # Determine whether to distribute processors across the zones of the region
         self.randomize_zone = self.config["randomize_zone"]
 
         # Obtain the reporting topic
@@ -32,12 +32,29 @@ class GooglePlatform(Platform):
         # Boolean for whether worker instance create by platform will be preemptible
         self.is_preemptible = self.config["task_processor"]["is_preemptible"]
 
+        # Preemption rates observed across runs used to decide whether tasks run on preemptible instances
+        self.preemption_policy = None
+        if self.is_preemptible and self.config["preemption_policy"]:
+            self.preemption_policy = PreemptionPolicy(self.config["preemption_history_file"])
+
         # Use authentication key file to gain access to google cloud project using Oauth2 authentication
         GoogleCloudHelper.authenticate(self.key_file)
 
         # Create local gcloud SSH key to be able to directly use SSH
         GoogleCloudHelper.configure_gcloud_ssh()
 
+        # Zones processors can be placed in
+        # Processors are placed in the region of the configured zone (where the output bucket is created)
+        # unless their input is stored in one of the other regions they're allowed to be placed in
+        home_region = GoogleCloudHelper.get_region(self.zone)
+        zones = [self.zone]
+        if self.randomize_zone:
+            zones = GoogleCloudHelper.get_active_zones(home_region)
+        for region in self.config["placement_regions"]:
+            if region != home_region:
+                zones.extend(GoogleCloudHelper.get_active_zones(region))
+        self.zone_placement = ZonePlacement(zones, home_region=home_region)
+
     def validate(self):
         # Check that final output dir begins with gs://
         if not self.final_output_dir.startswith("gs://"):
@@ -95,6 +112,17 @@ class GooglePlatform(Platform):
                             disk_space,
                             **instance_config)
 
+    def init_host_processor(self, name, nr_cpus, mem, disk_space):
+        # Googlefy instance name
+        name = self.__format_instance_name(name)
+        # Hosts are never preemptible as a preemption would fail every task running on the host
+        instance_config = self.__get_instance_config()
+        return Instance(name,
+                        nr_cpus,
+                        mem,
+                        disk_space,
+                        **instance_config)
+
     def publish_report(self, report=None):
 
         # Exit as nothing to output
@@ -151,6 +179,15 @@ class GooglePlatform(Platform):
             except RuntimeError:
                 logging.warning("(%s) Unable to destroy instance!" % instance_name)
 
+        # Log how instances were spread across zones
+        for zone, zone_stats in self.zone_placement.get_stats().items():
+            logging.debug("Zone %s: %s instance creations, %s capacity errors."
+                          % (zone, zone_stats["placed"], zone_stats["capacity_errors"]))
+
+        # Save preemption rates observed during the run
+        if self.preemption_policy is not None:
+            self.preemption_policy.save()
+
         logging.info("Clean up complete!")
 
     ####### PRIVATE UTILITY METHODS
@@ -165,11 +202,17 @@ class GooglePlatform(Platform):
         # Add platform-specific options
         params["zone"]                  = self.zone
         params["service_acct"]          = self.service_acct
+        params["runtime_history"]       = self.runtime_history
+        params["workspace_mount"]       = self.wrk_dir
+        params["boot_disk_space"]       = self.MIN_DISK_SPACE
 
-        # Randomize the zone within the region if specified
-        if self.randomize_zone:
-            region          = GoogleCloudHelper.get_region(self.zone)
-            params["zone"]  = GoogleCloudHelper.select_random_zone(region)
+        # Place instance in the zone with capacity and the fewest instances
+        params["zone"]                  = self.zone_placement.select_zone()
+        params["zone_placement"]        = self.zone_placement
+
+        # Preemptible instances can be moved to any zone they're allowed to run in if it's expected to be cheaper
+        if self.preemption_policy is not None:
+            params["preemption_policy"] = self.preemption_policy
 
         # Get instance type
         return params
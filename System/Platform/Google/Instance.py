@@ -1,15 +1,49 @@
+import os
 import logging
+import socket
 import subprocess as sp
 import time
 import math
 import random
 import getpass
+import tempfile
+import shutil
+import atexit
+import threading
 
-from System.Platform import Process, Processor
-from System.Platform.Google import GoogleCloudHelper, GoogleResourceNotFound
+from System.Platform import Processor
+from System.Platform.Google import GoogleCloudHelper, GoogleResourceNotFound, ZonePlacement
 
 class Instance(Processor):
 
+    # Directory holding the control sockets of the SSH master connections shared by commands run on an instance
+    # Created with a random name the first time it's needed so only the current user (and run) can place sockets in it
+    SSH_CONTROL_DIR         = None
+    ssh_control_lock        = threading.Lock()
+
+    # Seconds an idle SSH master connection is kept open
+    SSH_CONTROL_PERSIST     = 600
+
+    # Send every command over a persistent SSH master connection (a new connection is opened per command if False)
+    SSH_MULTIPLEX           = True
+
+    # Private key and port used to connect to instances
+    SSH_KEY_FILE            = "~/.ssh/google_compute_engine"
+    SSH_PORT                = 22
+
+    # Seconds between checks of whether a new instance accepts SSH connections and maximum seconds to wait for it
+    READY_CHECK_INTERVAL    = 1
+    READY_TIMEOUT           = 600
+
+    # Minimum expected savings (cents) on input transfer for placing an instance outside the home region
+    LOCALITY_MIN_SAVINGS    = 1.0
+
+    # Device name of the persistent disk holding the workspace (disk appears as /dev/disk/by-id/google-<device name>)
+    WORKSPACE_DEVICE        = "workspace"
+
+    # Docker storage directory (moved to the workspace disk, which is sized for the docker images of the task)
+    DOCKER_ROOT             = "/var/lib/docker"
+
     def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
         # Call super constructor
         super(Instance, self).__init__(name, nr_cpus, mem, disk_space, **kwargs)
@@ -23,6 +57,26 @@ class Instance(Processor):
         self.is_boot_disk_ssd   = kwargs.pop("is_boot_disk_ssd",    False)
         self.nr_local_ssd       = kwargs.pop("nr_local_ssd",        0)
 
+        # Machine families the instance type can be selected from
+        self.machine_families   = kwargs.pop("machine_families",    GoogleCloudHelper.MACHINE_FAMILIES)
+
+        # Runtimes of modules in previous runs (used to estimate how long the task will take on each machine family)
+        self.runtime_history    = kwargs.pop("runtime_history",     None)
+
+        # Keep the workspace on a separate persistent disk that can be moved to a replacement instance
+        # Boot disk then only needs to hold the disk image (docker images are stored on the workspace disk)
+        self.persistent_workspace   = kwargs.pop("persistent_workspace",    False)
+        self.workspace_mount        = kwargs.pop("workspace_mount",         "/data/")
+        self.boot_disk_space        = kwargs.pop("boot_disk_space",         10)
+
+        # Name of the workspace disk and whether it currently exists and is attached to the instance
+        self.workspace_disk         = "%s-wrk" % self.name if self.persistent_workspace else None
+        self.workspace_disk_exists  = False
+        self.workspace_disk_attached = False
+
+        # Service choosing the zone of the instance if the current zone can't create it
+        self.zone_placement         = kwargs.pop("zone_placement",          None)
+
         # Initialize the region of the instance
         self.region             = GoogleCloudHelper.get_region(self.zone)
 
@@ -61,11 +115,14 @@ class Instance(Processor):
         while True:
 
             try:
-                # Obtain the instance information
-                data = GoogleCloudHelper.describe(self.name, self.zone)
+                # Obtain the instance information from the list of instances shared by all instances in the zone
+                data = GoogleCloudHelper.get_instance_info(self.name, self.zone)
 
-                # Update the external IP address
-                self.external_IP = data["networkInterfaces"][0]["accessConfigs"][0].get("natIP", None)
+                # Update the external IP address and close SSH connection to the old address if it changed
+                external_IP = data["networkInterfaces"][0]["accessConfigs"][0].get("natIP", None)
+                if external_IP != self.external_IP:
+                    self.__close_ssh_master()
+                self.external_IP = external_IP
 
                 # Set the status accordingly
                 if data["status"] in ["TERMINATED", "STOPPING"]:
@@ -87,6 +144,7 @@ class Instance(Processor):
             except GoogleResourceNotFound:
 
                 # Update the external IP address
+                self.__close_ssh_master()
                 self.external_IP = None
 
                 # Set the status to OFF
@@ -105,6 +163,11 @@ class Instance(Processor):
                     time.sleep(5)
                     retries += 1
 
+    def get_machine_family(self):
+        if self.instance_type is None:
+            return None
+        return GoogleCloudHelper.get_machine_family(self.instance_type)
+
     def adapt_cmd(self, cmd):
         # Adapt command for running on instance through gcloud ssh
         cmd = cmd.replace("'", "'\"'\"'")
@@ -115,9 +178,7 @@ class Instance(Processor):
 
         logging.debug("(%s) Using the following IP address: %s" % (self.name, self.external_IP))
 
-        cmd = "ssh -i ~/.ssh/google_compute_engine " \
-              "-o CheckHostIP=no -o StrictHostKeyChecking=no " \
-              "{0}@{1} -- '{2}'".format(getpass.getuser(), self.external_IP, cmd)
+        cmd = "ssh {0} {1}@{2} -- '{3}'".format(self.__get_ssh_options(), getpass.getuser(), self.external_IP, cmd)
         return cmd
 
     def create(self):
@@ -128,16 +189,38 @@ class Instance(Processor):
 
         # Set status to indicate that commands can't be run on processor because it's busy
         logging.info("(%s) Process 'create' started!" % self.name)
+        self.set_create_time()
+
+        # Choose where to create the instance
+        self.select_placement()
+
+        # Try to create instance until either it's successful, we're out of retries, or the processor is locked
+        self.__submit_create(num_retries=self.default_num_cmd_retries)
+        self.wait_process("create")
+
+        # Attach the workspace disk (created with the first instance and re-attached to replacement instances)
+        if self.persistent_workspace:
+            self.attach_workspace_disk()
+
+        # Wait for instance to be accessible through SSH
+        logging.debug("(%s) Waiting for instance to be accessible" % self.name)
+        self.wait_until_ready()
+
+    def __submit_create(self, num_retries):
         # Determine instance type and actual resource usage based on current Google prices in instance zone
-        self.nr_cpus, self.mem, self.instance_type = GoogleCloudHelper.get_optimal_instance_type(self.nr_cpus,
-                                                                                                 self.mem,
-                                                                                                 self.zone,
-                                                                                                 self.is_preemptible)
+        # and how long the task is expected to take on each machine family
+        self.nr_cpus, self.mem, self.instance_type = \
+            GoogleCloudHelper.get_optimal_instance_type(self.nr_cpus,
+                                                        self.mem,
+                                                        self.zone,
+                                                        self.is_preemptible,
+                                                        families=self.machine_families,
+                                                        family_runtimes=self.get_family_runtimes())
 
         # Determine instance price at time of creation
         self.price = GoogleCloudHelper.get_instance_price(self.nr_cpus,
                                                           self.mem,
-                                                          self.disk_space,
+                                                          self.get_total_disk_space(),
                                                           self.instance_type,
                                                           self.zone,
                                                           self.is_preemptible,
@@ -145,21 +228,14 @@ class Instance(Processor):
                                                           self.nr_local_ssd)
         logging.debug("(%s) Instance type is %s. Price per hour: %s cents" % (self.name, self.instance_type, self.price))
 
-        # Generate gcloud create cmd
-        cmd = self.__get_gcloud_create_cmd()
+        # Record zone so other instances are spread to other zones
+        if self.zone_placement is not None:
+            self.zone_placement.assign(self.name, self.zone)
 
-        # Try to create instance until either it's successful, we're out of retries, or the processor is locked
-        self.processes["create"] = Process(cmd,
-                                           cmd=cmd,
-                                           stdout=sp.PIPE,
-                                           stderr=sp.PIPE,
-                                           shell=True,
-                                           num_retries=self.default_num_cmd_retries)
-        self.wait_process("create")
-
-        # Wait for instance to be accessible through SSH
-        logging.debug("(%s) Waiting for instance to be accessible" % self.name)
-        self.wait_until_ready()
+        # Request instance creation (sent together with other instances created with the same options)
+        self.processes["create"] = GoogleCloudHelper.submit_instance_request("create", self.name, self.zone,
+                                                                             args=self.__get_gcloud_create_args(),
+                                                                             num_retries=num_retries)
 
     def recreate(self):
 
@@ -181,23 +257,63 @@ class Instance(Processor):
 
         # Set status to indicate that instance cannot run commands and is destroying
         logging.info("(%s) Process 'destroy' started!" % self.name)
-        cmd = self.__get_gcloud_destroy_cmd()
 
-        # Run command, wait for destroy to complete, and set status to 'OFF'
-        self.processes["destroy"] = Process(cmd,
-                                            cmd=cmd,
-                                            stdout=sp.PIPE,
-                                            stderr=sp.PIPE,
-                                            shell=True,
-                                            num_retries=self.default_num_cmd_retries)
+        # Close the SSH connection to the instance
+        self.__close_ssh_master()
+
+        # Request deletion (sent together with other instances being deleted), wait for destroy to complete
+        self.processes["destroy"] = GoogleCloudHelper.submit_instance_request("delete", self.name, self.zone,
+                                                                              num_retries=self.default_num_cmd_retries)
 
         # Wait for delete to complete if requested
         if wait:
             self.wait_process("destroy")
 
+        # Instance no longer counts towards the instances in its zone
+        if self.zone_placement is not None:
+            self.zone_placement.release(self.name)
+
         # Reset flag that we configured SSH
         self.ssh_connections_increased = False
 
+        # Attached workspace disk is deleted along with the instance but a detached one has to be deleted separately
+        if self.workspace_disk_exists and not self.workspace_disk_attached:
+            logging.debug("(%s) Deleting detached workspace disk '%s'." % (self.name, self.workspace_disk))
+            GoogleCloudHelper.delete_disk(self.workspace_disk, self.zone)
+        self.workspace_disk_exists      = False
+        self.workspace_disk_attached    = False
+
+    def attach_workspace_disk(self):
+        # Create the workspace disk if it doesn't exist yet and attach it to the instance
+        if not self.workspace_disk_exists:
+            logging.debug("(%s) Creating %sGB workspace disk '%s'." % (self.name, self.disk_space, self.workspace_disk))
+            GoogleCloudHelper.create_disk(self.workspace_disk, self.zone, self.disk_space, is_ssd=self.is_boot_disk_ssd)
+            self.workspace_disk_exists = True
+
+        # Disk is deleted along with the instance unless it's detached first
+        logging.debug("(%s) Attaching workspace disk '%s'." % (self.name, self.workspace_disk))
+        GoogleCloudHelper.attach_disk(self.name, self.zone, self.workspace_disk, self.WORKSPACE_DEVICE, auto_delete=True)
+        self.workspace_disk_attached = True
+
+    def detach_workspace_disk(self):
+        # Detach the workspace disk so it outlives the instance and can be attached to its replacement
+        if not self.workspace_disk_attached:
+            return
+
+        logging.debug("(%s) Detaching workspace disk '%s'." % (self.name, self.workspace_disk))
+        try:
+            GoogleCloudHelper.detach_disk(self.name, self.zone, self.WORKSPACE_DEVICE)
+        except GoogleResourceNotFound:
+            # Instance (and the disk with it) no longer exists
+            self.workspace_disk_exists = False
+        self.workspace_disk_attached = False
+
+    def get_total_disk_space(self):
+        # Return size of all the disks of the instance (boot disk and workspace disk)
+        if self.persistent_workspace:
+            return self.boot_disk_space + self.disk_space
+        return self.disk_space
+
     def wait_process(self, proc_name):
         # Get process from process list
         proc_obj = self.processes[proc_name]
@@ -221,8 +337,12 @@ class Instance(Processor):
 
         # Case: Process completed with errors
         if proc_obj.has_failed():
-            # Determine whether to retry or raise errors
-            self.handle_failure(proc_name, proc_obj)
+            # Failures are handled one at a time as handling may reset the instance and re-run its commands
+            with self.process_lock:
+                # Skip if the command was already re-run while handling the failure of another command (e.g. preemption)
+                if self.processes[proc_name] is proc_obj:
+                    # Determine whether to retry or raise errors
+                    self.handle_failure(proc_name, proc_obj)
             # If no errors thrown, try waiting on the process again
             return self.wait_process(proc_name)
 
@@ -230,6 +350,10 @@ class Instance(Processor):
             # Set start time
             self.set_start_time()
 
+            # Zone is able to provide resources again
+            if self.zone_placement is not None:
+                self.zone_placement.record_success(self.zone)
+
         # Set status to 'OFF' if destroy is True
         elif proc_name in ["destroy", "stop"]:
             # Set the stop time
@@ -250,6 +374,10 @@ class Instance(Processor):
         if self.is_locked() and proc_name != "destroy":
             self.raise_error(proc_name, proc_obj)
 
+        # Move instance to another zone if its zone ran out of resources
+        if self.handle_capacity_error(proc_name, proc_obj):
+            return
+
         # Check to see if issue was caused by rate limit. If so, cool out for a random time limit
         if "Rate Limit Exceeded" in proc_obj.err:
             self.throttle_api_rate(proc_name, proc_obj)
@@ -292,12 +420,9 @@ class Instance(Processor):
         if can_retry and proc_name in ["create", "destroy"]:
             time.sleep(3)
             logging.warning("(%s) Process '%s' failed but we still got %s retries left. Re-running command!" % (self.name, proc_name, proc_obj.get_num_retries()))
-            self.processes[proc_name] = Process(proc_obj.get_command(),
-                                                cmd=proc_obj.get_command(),
-                                                stdout=sp.PIPE,
-                                                stderr=sp.PIPE,
-                                                shell=True,
-                                                num_retries=proc_obj.get_num_retries() - 1)
+            self.processes[proc_name] = GoogleCloudHelper.submit_instance_request(proc_obj.action, self.name, self.zone,
+                                                                                  args=proc_obj.args,
+                                                                                  num_retries=proc_obj.get_num_retries() - 1)
         # Retry 'run' command
         elif can_retry:
             time.sleep(3)
@@ -313,6 +438,65 @@ class Instance(Processor):
         else:
             self.raise_error(proc_name, proc_obj)
 
+    def select_placement(self):
+        # Move instance to the region its input is stored in if that saves transferring the input across regions
+        if self.zone_placement is None or self.workspace_disk_exists or len(self.input_locations) == 0:
+            return
+
+        regions = self.zone_placement.get_regions()
+        if len(regions) < 2:
+            return
+
+        # Expected cost of transferring the input to each region
+        costs = {region: GoogleCloudHelper.get_egress(self.input_locations, region)[1] for region in regions}
+        region = min(regions, key=lambda r: (costs[r], r != self.region))
+        if costs[self.region] - costs[region] < self.LOCALITY_MIN_SAVINGS:
+            return
+
+        zone = self.zone_placement.select_zone(region=region)
+        if zone is None:
+            return
+
+        logging.info("(%s) Placing instance in zone %s near its input (expected input transfer cost: %.2f cents "
+                     "instead of %.2f cents)." % (self.name, zone, costs[region], costs[self.region]))
+        self.zone   = zone
+        self.region = region
+
+    def get_input_egress(self, input_locations):
+        return GoogleCloudHelper.get_egress(input_locations, self.region)
+
+    def handle_capacity_error(self, proc_name, proc_obj):
+        # Retry creating the instance in another zone if its zone ran out of resources or quota
+        # Return True if instance creation was re-submitted
+        if proc_name not in ["create", "start"] or not ZonePlacement.is_capacity_error(proc_obj.err):
+            return False
+
+        # Avoid zone for new instances for a while
+        if self.zone_placement is not None:
+            self.zone_placement.record_capacity_error(self.zone)
+
+        # Stopped instances and workspace disks can't be moved to another zone
+        if proc_name != "create" or self.zone_placement is None \
+                or self.workspace_disk_exists or proc_obj.get_num_retries() <= 0:
+            return False
+
+        # Make sure instance wasn't created after all
+        self.update_status()
+        if self.get_status() != Processor.OFF:
+            return False
+
+        # Select another zone within the region
+        new_zone = self.zone_placement.select_zone(exclude=[self.zone], region=self.region)
+        if new_zone is None:
+            return False
+
+        logging.warning("(%s) Zone %s is out of capacity. Creating instance in zone %s instead."
+                        % (self.name, self.zone, new_zone))
+        self.zone   = new_zone
+        self.region = GoogleCloudHelper.get_region(new_zone)
+        self.__submit_create(num_retries=proc_obj.get_num_retries() - 1)
+        return True
+
     def wait_until_ready(self):
         # Wait until instance can be SSHed
 
@@ -320,23 +504,17 @@ class Instance(Processor):
         self.ssh_ready = False
         needs_recreate = True
 
-        # Initializing the cycle count
-        cycle_count = 0
-
         # Waiting for 10 minutes for instance to be SSH-able
-        while cycle_count < 40:
-
-            # Increment the cycle count
-            cycle_count += 1
+        # Status comes from the list of instances shared by the whole zone and the SSH check is a single connection
+        # attempt from this host, so checking often doesn't add any load on the cloud API
+        wait_start = time.time()
+        while time.time() - wait_start < self.READY_TIMEOUT:
 
             # Raise an error if the instance gets locked
             if self.is_locked():
                 logging.debug("(%s) Instance locked while waiting for creation!" % self.name)
                 raise RuntimeError("(%s) Instance locked while waiting for creation!" % self.name)
 
-            # Wait for 15 seconds before checking the status again
-            time.sleep(15)
-
             # Update the status from the cloud
             self.update_status()
 
@@ -347,6 +525,8 @@ class Instance(Processor):
 
             # Check if ssh server is accessible. If not wait another cycle
             if self.check_ssh():
+                logging.debug("(%s) Instance accepted SSH connections after %.1f seconds."
+                              % (self.name, time.time() - wait_start))
 
                 # Increase number of SSH connections
                 self.__configure_SSH()
@@ -357,9 +537,17 @@ class Instance(Processor):
                 # Break the loop as we finished configuring the SSH
                 break
 
+            # Wait before checking the status again
+            time.sleep(self.READY_CHECK_INTERVAL)
+
         # Check if it needs resetting
         if needs_recreate:
             self.recreate()
+            return
+
+        # Mount the workspace disk (formatted the first time it's used)
+        if self.persistent_workspace:
+            self.__mount_workspace_disk()
 
         # If we arrived at this point, then we are all set!
         self.ssh_ready = True
@@ -405,19 +593,13 @@ class Instance(Processor):
         if self.external_IP is None:
             return False
 
-        # Generate the command to run
-        cmd = "nc -w 1 {0} 22".format(self.external_IP)
-
-        # Run the command
-        proc = sp.Popen(cmd, stderr=sp.PIPE, stdout=sp.PIPE, shell=True)
-        out, err = proc.communicate()
-
-        # Convert to string formats
-        out = out.decode("utf8")
-        err = err.decode("utf8")
+        # Connect to the ssh port and read the server's greeting
+        try:
+            with socket.create_connection((self.external_IP, self.SSH_PORT), timeout=1) as ssh_socket:
+                out = ssh_socket.recv(256).decode("utf8", "ignore")
 
         # If any error occured, then the ssh is not ready
-        if err:
+        except (OSError, socket.timeout):
             return False
 
         # Otherwise, return only if there is ssh in the received header
@@ -429,13 +611,13 @@ class Instance(Processor):
         if self.ssh_connections_increased:
             return
 
-        # Increase the number of concurrent SSH connections
+        # Increase the number of concurrent SSH connections and of sessions multiplexed over a single connection
         logging.info(
-            "(%s) Increasing the number of maximum concurrent SSH connections to %s." % (self.name, max_connections))
+            "(%s) Increasing the number of maximum concurrent SSH connections/sessions to %s." % (self.name, max_connections))
+        cmd = "sudo bash -c 'echo \"MaxStartups {0}\" >> /etc/ssh/sshd_config; " \
+              "echo \"MaxSessions {0}\" >> /etc/ssh/sshd_config' ".format(max_connections)
         if log:
-            cmd = "sudo bash -c 'echo \"MaxStartups %s\" >> /etc/ssh/sshd_config' !LOG2! " % max_connections
-        else:
-            cmd = "sudo bash -c 'echo \"MaxStartups %s\" >> /etc/ssh/sshd_config' " % max_connections
+            cmd += "!LOG2! "
         self.run("configureSSH", cmd)
         self.wait_process("configureSSH")
 
@@ -448,17 +630,81 @@ class Instance(Processor):
         self.run("restartSSH", cmd)
         self.wait_process("restartSSH")
 
+        # Close the current SSH connection as it was opened with the old session limit
+        self.__close_ssh_master()
+
         # Set instance as connections already increased
         self.ssh_connections_increased = True
 
-    def __get_gcloud_create_cmd(self):
-        # Create base command
-        args = list()
-        args.append("gcloud compute instances create %s" % self.name)
+    def __mount_workspace_disk(self):
+        # Mount workspace disk at the workspace directory unless it's already mounted
+        # Disk is only formatted if it has no filesystem so files written before a preemption are kept
+        device = "/dev/disk/by-id/google-%s" % self.WORKSPACE_DEVICE
+        cmd = "sudo bash -c 'mountpoint -q {1} || {{ blkid {0} >/dev/null || mkfs.ext4 -q -F {0}; " \
+              "mkdir -p {1} && mount -o discard,defaults {0} {1} && chmod 777 {1}; }}'".format(device,
+                                                                                            self.workspace_mount)
+
+        # Boot disk is only as large as the disk image, so docker images are pulled to the workspace disk instead
+        docker_dir = os.path.join(self.workspace_mount, ".docker")
+        cmd += " && sudo bash -c 'command -v docker >/dev/null || exit 0; mountpoint -q {1} || " \
+               "{{ systemctl stop docker.socket docker; mkdir -p {0} {1} && mount --bind {0} {1} && " \
+               "systemctl start docker; }}'".format(docker_dir, self.DOCKER_ROOT)
+        self.run("mountWorkspace", cmd)
+        self.wait_process("mountWorkspace")
+
+    def __get_ssh_options(self):
+        # SSH options shared by commands run on the instance and by the command closing the master connection
+        # Both must resolve to the same control socket, so they're always built here
+        options = "-i {0} -p {1} -o CheckHostIP=no -o StrictHostKeyChecking=no".format(self.SSH_KEY_FILE, self.SSH_PORT)
+        if not self.SSH_MULTIPLEX:
+            return options
+
+        # Send every command over one persistent master connection to the instance
+        # The first command opens the master connection and later commands reuse it instead of doing a new handshake
+        # %C is a hash of the connection details so each instance address gets its own short socket path
+        control_path = os.path.join(Instance.get_ssh_control_dir(), "%C")
+        return "{0} -o ControlMaster=auto -o ControlPath={1} -o ControlPersist={2} " \
+               "-o ServerAliveInterval=30 -o ServerAliveCountMax=4".format(options, control_path, self.SSH_CONTROL_PERSIST)
+
+    @staticmethod
+    def get_ssh_control_dir():
+        # Return directory for SSH control sockets (private to the current user and removed when the run ends)
+        with Instance.ssh_control_lock:
+            if Instance.SSH_CONTROL_DIR is None:
+                Instance.SSH_CONTROL_DIR = tempfile.mkdtemp(prefix="cc_ssh_")
+                atexit.register(shutil.rmtree, Instance.SSH_CONTROL_DIR, ignore_errors=True)
+            return Instance.SSH_CONTROL_DIR
+
+    def __close_ssh_master(self):
+        # Close the master SSH connection to the instance (if one is open)
+        if self.external_IP is None or not self.SSH_MULTIPLEX:
+            return
+
+        cmd = "ssh {0} -O exit {1}@{2}".format(self.__get_ssh_options(), getpass.getuser(), self.external_IP)
+        proc = sp.Popen(cmd, stderr=sp.PIPE, stdout=sp.PIPE, shell=True)
+        proc.communicate()
+        logging.debug("(%s) Closed SSH master connection to %s (if any)." % (self.name, self.external_IP))
 
-        # Specify the zone where instance will exist
-        args.append("--zone")
-        args.append(self.zone)
+    def get_family_runtimes(self):
+        # Return expected runtime of the instance's task on each machine family (None if module has never been run)
+        if self.runtime_history is None or self.module_name is None:
+            return None
+
+        runtimes = {}
+        for family in self.machine_families:
+            runtime = self.runtime_history.get_runtime(self.module_name, machine_family=family)
+            if runtime is not None:
+                runtimes[family] = runtime
+
+        # Runtimes recorded before machine families were tracked were measured on n1 instances
+        if len(runtimes) == 0 and self.runtime_history.has_runtime(self.module_name):
+            runtimes["n1"] = self.runtime_history.get_runtime(self.module_name)
+
+        return GoogleCloudHelper.get_family_runtimes(runtimes, self.machine_families)
+
+    def __get_gcloud_create_args(self):
+        # Return options of the gcloud create command (instances with the same options can be created together)
+        args = list()
 
         # Specify that instance is not preemptible
         if self.is_preemptible:
@@ -468,12 +714,13 @@ class Instance(Processor):
         args.append("--image")
         args.append(str(self.disk_image))
 
-        # Set boot disk size
+        # Set boot disk size (workspace is on a separate disk if it's persistent)
+        boot_disk_space = self.boot_disk_space if self.persistent_workspace else self.disk_space
         args.append("--boot-disk-size")
-        if self.disk_space >= 10240:
-            args.append("%dTB" % int(math.ceil(self.disk_space / 1024.0)))
+        if boot_disk_space >= 10240:
+            args.append("%dTB" % int(math.ceil(boot_disk_space / 1024.0)))
         else:
-            args.append("%dGB" % int(self.disk_space))
+            args.append("%dGB" % int(boot_disk_space))
 
         # Set boot disk type
         args.append("--boot-disk-type")
@@ -495,6 +742,9 @@ class Instance(Processor):
 
         # Determine Google Instance type and insert into gcloud command
         if "custom" in self.instance_type:
+            args.append("--custom-vm-type")
+            args.append(self.get_machine_family())
+
             args.append("--custom-cpu")
             args.append(str(self.nr_cpus))
 
@@ -505,15 +755,3 @@ class Instance(Processor):
             args.append(self.instance_type)
 
         return " ".join(args)
-
-    def __get_gcloud_destroy_cmd(self):
-        args = list()
-        args.append("gcloud compute instances delete %s" % self.name)
-
-        # Specify the zone where instance is running
-        args.append("--zone")
-        args.append(self.zone)
-
-        # Provide input to the command
-        args[0:0] = ["yes", "2>/dev/null", "|"]
-        return " ".join(args)
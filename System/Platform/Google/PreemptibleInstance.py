@@ -1,12 +1,22 @@
+import os
 import logging
-import subprocess as sp
 import time
 
-from System.Platform import Process, Processor
-from System.Platform.Google import Instance
+from System.Platform import Processor
+from System.Platform.Google import Instance, GoogleCloudHelper
 
 class PreemptibleInstance(Instance):
 
+    # Seconds to wait for the cloud to report a preemption after an SSH connection failed
+    PREEMPTION_CHECK_TIMEOUT = 60
+
+    # Processes setting up the boot disk that have to be re-run on a replacement instance
+    # even when the workspace disk (and everything written to it, including docker images) is kept
+    BOOT_DISK_PROCESSES = ["mount_"]
+
+    # File left in the workspace once everything written to it was flushed after the preemption notice
+    PREEMPTION_MARKER = ".preempted"
+
     def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
         # Call super constructor
         super(PreemptibleInstance, self).__init__(name, nr_cpus, mem, disk_space, **kwargs)
@@ -21,6 +31,27 @@ class PreemptibleInstance(Instance):
         # Stack for determining costs across resets
         self.reset_history = []
 
+        # Whether the current instance is watching for its preemption notice
+        self.watching_preemption = False
+
+        # Whether the workspace disk was flushed after the preemption notice of the previous instance
+        self.workspace_synced = False
+
+        # Preemption rates used to choose between preemptible/on-demand and between zones before each creation
+        self.preemption_policy  = kwargs.pop("preemption_policy",   None)
+
+        # Start of the run of the current instance already recorded in the preemption history
+        self.recorded_start_time = None
+
+    def select_placement(self):
+        # Choose region based on the location of the input first
+        super(PreemptibleInstance, self).select_placement()
+
+        # Choose zone and whether to use a preemptible instance based on the expected cost of the task
+        # Zone can't change once the workspace disk exists as disks can only be attached within their zone
+        if self.preemption_policy is not None and self.is_preemptible and not self.workspace_disk_exists:
+            self.__select_instance_kind()
+
     def recreate(self):
         if self.creation_resets < self.default_num_cmd_retries:
             self.creation_resets += 1
@@ -39,15 +70,10 @@ class PreemptibleInstance(Instance):
     def start(self):
 
         logging.info("(%s) Process 'start' started!" % self.name)
-        cmd = self.__get_gcloud_start_cmd()
 
-        # Run command, wait for start to complete
-        self.processes["start"] = Process(cmd,
-                                          cmd=cmd,
-                                          stdout=sp.PIPE,
-                                          stderr=sp.PIPE,
-                                          shell=True,
-                                          num_retries=self.default_num_cmd_retries)
+        # Request start (sent together with other instances being started), wait for start to complete
+        self.processes["start"] = GoogleCloudHelper.submit_instance_request("start", self.name, self.zone,
+                                                                            num_retries=self.default_num_cmd_retries)
 
         # Wait for start to complete if requested
         self.wait_process("start")
@@ -56,23 +82,35 @@ class PreemptibleInstance(Instance):
         logging.debug("(%s) Waiting for instance to be accessible" % self.name)
         self.wait_until_ready()
 
+    def wait_until_ready(self):
+        super(PreemptibleInstance, self).wait_until_ready()
+
+        # Watch for the preemption notice once the instance is up (watcher is started again after every restart)
+        if self.ssh_ready and not self.watching_preemption:
+            if self.persistent_workspace:
+                self.workspace_synced = self.__clear_preemption_marker()
+            self.__watch_preemption()
+
     def stop(self):
 
         logging.info("(%s) Process 'stop' started!" % self.name)
-        cmd = self.__get_gcloud_stop_cmd()
+        self.watching_preemption = False
+        self.__record_exposure()
 
-        # Run command to stop the instances
-        self.processes["stop"] = Process(cmd,
-                                         cmd=cmd,
-                                         stdout=sp.PIPE,
-                                         stderr=sp.PIPE,
-                                         shell=True,
-                                         num_retries=self.default_num_cmd_retries)
+        # Request stop (sent together with other instances being stopped)
+        self.processes["stop"] = GoogleCloudHelper.submit_instance_request("stop", self.name, self.zone,
+                                                                           num_retries=self.default_num_cmd_retries)
 
         # Wait for instance to stop
         self.wait_process("stop")
 
     def reset(self, force_destroy=False):
+        # Commands can fail on several threads at once when the instance is preempted (e.g. parallel input transfers)
+        # Only one thread resets the instance while new commands wait until the instance is back
+        with self.process_lock:
+            self.__reset(force_destroy)
+
+    def __reset(self, force_destroy=False):
 
         # Resetting takes place just for preemptible instances
         if not self.is_preemptible:
@@ -96,6 +134,7 @@ class PreemptibleInstance(Instance):
         prev_start = self.start_time
 
         # Restart the instance if it is preemptible and is not required to be destroyed
+        keep_workspace = False
         if self.is_preemptible and not force_destroy:
 
             # Restart the instance
@@ -106,10 +145,23 @@ class PreemptibleInstance(Instance):
             logging.debug("(%s) Instance restarted, continue running processes!" % self.name)
 
         else:
+            # Keep the workspace disk so it can be attached to the new instance
+            keep_workspace = self.persistent_workspace and self.workspace_disk_attached
+            if keep_workspace:
+                self.detach_workspace_disk()
+                keep_workspace = self.workspace_disk_exists
+
             # Recreate the instance
             self.destroy()
             self.create()
 
+            # Files written shortly before the instance went down may not have reached the workspace disk
+            # unless the instance was notified of its preemption in time to flush them
+            if keep_workspace and not self.workspace_synced:
+                logging.warning("(%s) Workspace disk wasn't flushed before the instance went down. "
+                                "Rerunning all processes!" % self.name)
+                keep_workspace = False
+
             # Instance recreation complete
             logging.debug("(%s) Instance recreated, rerunning all processes!" % self.name)
 
@@ -119,13 +171,18 @@ class PreemptibleInstance(Instance):
         self.reset_history.append((prev_price, prev_start, self.stop_time))
 
         # Rerun all commands if the instance is not preemptible or was previously destroyed
-        if not self.is_preemptible or force_destroy:
+        # Completed commands only need to be rerun if their output was on the boot disk when the workspace was kept
+        if keep_workspace:
+            self.__rerun_boot_disk_processes()
+
+        elif not self.is_preemptible or force_destroy:
 
             # Rerun all commands
             for proc_name, proc_obj in list(self.processes.items()):
 
                 # Skip processes that do not need to be rerun
-                if proc_name in ["create", "destroy", "start", "stop"]:
+                if proc_name in ["create", "destroy", "start", "stop", "mountWorkspace", "watchPreemption",
+                                 "clearPreemptionMarker"]:
                     continue
 
                 # Skip configure_ssh specific commands if already configured
@@ -153,7 +210,8 @@ class PreemptibleInstance(Instance):
         for proc_name, proc_obj in list(self.processes.items()):
 
             # Skip processes that do not need to be rerun
-            if proc_name in ["create", "destroy", "start", "stop"]:
+            if proc_name in ["create", "destroy", "start", "stop", "mountWorkspace", "watchPreemption",
+                             "clearPreemptionMarker"]:
                 continue
 
             # Skip configure_ssh specific commands if already configured
@@ -218,6 +276,11 @@ class PreemptibleInstance(Instance):
                          quiet_failure=proc_obj.is_quiet())
                 self.wait_process(proc_name)
 
+    def destroy(self, wait=True):
+        self.watching_preemption = False
+        self.__record_exposure()
+        super(PreemptibleInstance, self).destroy(wait=wait)
+
     def get_runtime(self):
         # Compute total runtime across all resets
         # Return 0 if instance hasn't started yet
@@ -273,9 +336,14 @@ class PreemptibleInstance(Instance):
             self.reset(force_destroy=True)
             return
 
+        # Move instance to another zone if its zone ran out of resources
+        if self.handle_capacity_error(proc_name, proc_obj):
+            return
+
         if proc_obj.returncode == 255:
-            logging.warning("(%s) Waiting for 60 seconds to make sure instance wasn't preempted..." % self.name)
-            time.sleep(60)
+            logging.warning("(%s) Waiting for up to %s seconds to make sure instance wasn't preempted..."
+                            % (self.name, self.PREEMPTION_CHECK_TIMEOUT))
+            self.__wait_for_preemption()
 
             # Resolve case when SSH server resets/closes the connection
             if "connection reset by" in proc_obj.err.lower() \
@@ -340,6 +408,8 @@ class PreemptibleInstance(Instance):
         # Reset instance if its been destroyed/disappeared unexpectedly (i.e. preemption)
         if needs_reset and self.is_preemptible:
             logging.warning("(%s) Instance preempted! Resetting..." % self.name)
+            if self.preemption_policy is not None:
+                self.preemption_policy.add_preemption(self.zone, self.get_machine_family())
             self.reset()
 
         # Check if the problem is that we cannot SSH in the instance
@@ -351,12 +421,9 @@ class PreemptibleInstance(Instance):
         elif can_retry and proc_name in ["create", "destroy"]:
             time.sleep(3)
             logging.warning("(%s) Process '%s' failed but we still got %s retries left. Re-running command!" % (self.name, proc_name, proc_obj.get_num_retries()))
-            self.processes[proc_name] = Process(proc_obj.get_command(),
-                                                cmd=proc_obj.get_command(),
-                                                stdout=sp.PIPE,
-                                                stderr=sp.PIPE,
-                                                shell=True,
-                                                num_retries=proc_obj.get_num_retries() - 1)
+            self.processes[proc_name] = GoogleCloudHelper.submit_instance_request(proc_obj.action, self.name, self.zone,
+                                                                                  args=proc_obj.args,
+                                                                                  num_retries=proc_obj.get_num_retries() - 1)
 
         # Retry 'run' command
         elif can_retry:
@@ -373,6 +440,124 @@ class PreemptibleInstance(Instance):
         else:
             self.raise_error(proc_name, proc_obj)
 
+    def __select_instance_kind(self):
+        # Select zone in the instance region and instance kind (preemptible or on-demand) with the lowest expected cost
+        family_runtimes = self.get_family_runtimes()
+        if family_runtimes is None and self.runtime_history is not None and self.module_name is not None \
+                and self.runtime_history.has_runtime(self.module_name):
+            runtime = self.runtime_history.get_runtime(self.module_name)
+        else:
+            runtime = None
+
+        # Current zone comes first so it's kept unless another zone is expected to be cheaper
+        zones = [self.zone]
+        if self.zone_placement is not None:
+            zones.extend([zone for zone in self.zone_placement.get_available_zones(self.region) if zone != self.zone])
+
+        best = None
+        for zone in zones:
+            for is_preemptible in [True, False]:
+                nr_cpus, mem, instance_type = \
+                    GoogleCloudHelper.get_optimal_instance_type(self.nr_cpus,
+                                                                self.mem,
+                                                                zone,
+                                                                is_preemptible,
+                                                                families=self.machine_families,
+                                                                family_runtimes=family_runtimes)
+                price = GoogleCloudHelper.get_instance_price(nr_cpus,
+                                                             mem,
+                                                             self.get_total_disk_space(),
+                                                             instance_type,
+                                                             zone,
+                                                             is_preemptible,
+                                                             self.is_boot_disk_ssd,
+                                                             self.nr_local_ssd)
+                family = GoogleCloudHelper.get_machine_family(instance_type)
+                task_runtime = runtime if family_runtimes is None else family_runtimes.get(family, runtime)
+                cost = self.preemption_policy.get_expected_cost(price, task_runtime, zone, family,
+                                                                is_preemptible=is_preemptible,
+                                                                max_resets=self.max_resets - self.reset_count)
+                logging.debug("(%s) Expected cost in %s on %s %s instance: %s cents" % (
+                    self.name, zone, "preemptible" if is_preemptible else "on-demand", instance_type, cost))
+                if cost is not None and (best is None or cost < best[0]):
+                    best = (cost, zone, is_preemptible)
+
+        if best is None:
+            return
+
+        cost, zone, is_preemptible = best
+        if zone != self.zone:
+            logging.info("(%s) Moving instance to zone %s (expected cost %.2f cents)." % (self.name, zone, cost))
+            self.zone   = zone
+            self.region = GoogleCloudHelper.get_region(zone)
+        if not is_preemptible:
+            logging.info("(%s) Task expected to be cheaper on an on-demand instance (expected cost %.2f cents). "
+                         "Creating standard instance." % (self.name, cost))
+            self.is_preemptible = False
+
+    def __record_exposure(self):
+        # Record how long the current preemptible instance has been running in the preemption history
+        if self.preemption_policy is None or not self.is_preemptible \
+                or self.start_time is None or self.start_time == self.recorded_start_time:
+            return
+        self.recorded_start_time = self.start_time
+        self.preemption_policy.add_exposure(self.zone, self.get_machine_family(),
+                                            (time.time() - self.start_time) / 3600.0)
+
+    def __wait_for_preemption(self):
+        # Wait until the cloud reports the instance was stopped/removed or the timeout is reached
+        # Status comes from the list of instances shared by the whole zone so checking often is cheap
+        wait_start = time.time()
+        while time.time() - wait_start < self.PREEMPTION_CHECK_TIMEOUT and not self.is_locked():
+            self.update_status()
+            if self.get_status() in [Processor.DESTROYING, Processor.OFF]:
+                logging.debug("(%s) Instance reported as stopped after %.1f seconds."
+                              % (self.name, time.time() - wait_start))
+                return
+            time.sleep(self.READY_CHECK_INTERVAL)
+
+    def __watch_preemption(self):
+        # Start a background job on the instance that waits for the preemption notice in the instance metadata
+        # Once the instance is notified (~30 seconds before it's stopped) everything written to the workspace is
+        # flushed to disk and a marker is left in the workspace, so the workspace disk is consistent when re-attached
+        metadata_url = "http://metadata.google.internal/computeMetadata/v1/instance/preempted?wait_for_change=true"
+        marker = os.path.join(self.workspace_mount, self.PREEMPTION_MARKER)
+        cmd = "nohup bash -c 'until [ \"$(curl -s -H \"Metadata-Flavor: Google\" \"{0}\")\" = TRUE ]; " \
+              "do sleep 1; done; sync; touch {1}; sync' </dev/null >/dev/null 2>&1 &".format(metadata_url, marker)
+        self.run("watchPreemption", cmd, quiet_failure=True)
+        try:
+            self.wait_process("watchPreemption")
+            self.watching_preemption = True
+        except RuntimeError:
+            # Instance can still be used without the watcher
+            logging.warning("(%s) Unable to start watching for preemption notices!" % self.name)
+
+    def __clear_preemption_marker(self):
+        # Remove the marker left in the workspace by the preemption watcher of the previous instance
+        # Returns True if the marker was found, i.e. the workspace was flushed after the preemption notice
+        marker = os.path.join(self.workspace_mount, self.PREEMPTION_MARKER)
+        cmd = "if [ -e {0} ]; then sudo rm -f {0}; echo preempted; fi".format(marker)
+        self.run("clearPreemptionMarker", cmd, quiet_failure=True)
+        try:
+            out, _ = self.wait_process("clearPreemptionMarker")
+        except RuntimeError:
+            # Workspace can't be trusted if the marker can't be checked
+            logging.warning("(%s) Unable to check whether the workspace was flushed before preemption!" % self.name)
+            return False
+        return out.strip() == "preempted"
+
+    def __rerun_boot_disk_processes(self):
+        # Workspace disk was re-attached so task inputs and finished commands don't have to be run again
+        # Only completed processes that set up the lost boot disk (mounts) are rerun,
+        # followed by the processes that didn't finish before the instance was preempted
+        for proc_name, proc_obj in list(self.processes.items()):
+            if proc_obj.complete and not proc_obj.has_failed() \
+                    and any(proc_name.startswith(prefix) for prefix in self.BOOT_DISK_PROCESSES):
+                proc_obj.set_to_rerun()
+
+        logging.debug("(%s) Workspace disk re-attached. Rerunning boot disk setup: %s" % (
+            self.name, [proc_name for proc_name, proc_obj in self.processes.items() if proc_obj.needs_rerun()]))
+
     def __remove_wrk_out_dir(self):
 
         logging.debug("(%s) CLEARING OUTPUT for checkpoint cleanup, clearing %s." % (self.name, self.wrk_out_dir))
@@ -383,25 +568,3 @@ class PreemptibleInstance(Instance):
         # Clean the working output directory
         self.run("cleanup_work_output", cmd)
         self.wait_process("cleanup_work_output")
-
-    def __get_gcloud_start_cmd(self):
-        # Create base command
-        args = list()
-        args.append("gcloud compute instances start %s" % self.name)
-
-        # Specify the zone where instance will exist
-        args.append("--zone")
-        args.append(self.zone)
-
-        return " ".join(args)
-
-    def __get_gcloud_stop_cmd(self):
-        # Create base command
-        args = list()
-        args.append("gcloud compute instances stop %s" % self.name)
-
-        # Specify the zone where instance will exist
-        args.append("--zone")
-        args.append(self.zone)
-
-        return " ".join(args)
\ No newline at end of file
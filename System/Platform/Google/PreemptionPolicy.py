@@ -0,0 +1,132 @@
+import os
+import json
+import math
+import logging
+import threading
+from collections import OrderedDict
+
+class PreemptionPolicy(object):
+    # Record of how often preemptible instances were preempted in each zone and machine family across pipeline runs
+    # Used to estimate the expected cost of running a task on a preemptible instance (including the work lost to
+    # preemptions) so a task can be placed on an on-demand instance or in another zone when that's expected to be cheaper
+
+    DEFAULT_HISTORY_FILE = "~/.cloudconductor/preemption_history.json"
+
+    # Preemption rate assumed before any preemptions were observed (1 preemption per 24 preemptible hours)
+    # Observed rates are shrunk towards the zone rate and zone rates towards this rate until enough hours are observed
+    PRIOR_PREEMPTIONS   = 1.0
+    PRIOR_HOURS         = 24.0
+
+    # Preemptible instances are always stopped after 24 hours
+    MAX_PREEMPTIBLE_RUNTIME = 24 * 3600
+
+    # Seconds lost per start of an instance (boot, SSH setup, docker pulls, input transfer)
+    RESTART_OVERHEAD    = 180
+
+    # Runtime (sec) assumed for modules that have never been run before
+    DEFAULT_RUNTIME     = 3600
+
+    def __init__(self, history_file=None):
+
+        # Local file where preemption history is persisted between runs
+        history_file = self.DEFAULT_HISTORY_FILE if history_file is None else history_file
+        self.history_file = os.path.expanduser(history_file)
+
+        # Lock for updating history from multiple threads
+        self.history_lock = threading.Lock()
+
+        # Mapping of zone -> {"hours": preemptible instance hours, "preemptions": nr of preemptions,
+        #                     "families": {machine family -> {"hours": ..., "preemptions": ...}}}
+        self.history = self.__load()
+
+    def get_preemption_rate(self, zone, machine_family=None):
+        # Return expected number of preemptions per hour of a preemptible instance
+        with self.history_lock:
+            zone_record = self.history.get(zone, {})
+            rate = (zone_record.get("preemptions", 0) + self.PRIOR_PREEMPTIONS) \
+                / (zone_record.get("hours", 0.0) + self.PRIOR_HOURS)
+
+            if machine_family is not None:
+                record = zone_record.get("families", {}).get(machine_family, {})
+                rate = (record.get("preemptions", 0) + rate * self.PRIOR_HOURS) \
+                    / (record.get("hours", 0.0) + self.PRIOR_HOURS)
+
+            return rate
+
+    def add_exposure(self, zone, machine_family, hours):
+        # Record hours a preemptible instance ran without being preempted
+        if hours is None or hours <= 0:
+            return
+        with self.history_lock:
+            for record in self.__get_records(zone, machine_family):
+                record["hours"] += hours
+
+    def add_preemption(self, zone, machine_family):
+        # Record that a preemptible instance was preempted
+        with self.history_lock:
+            for record in self.__get_records(zone, machine_family):
+                record["preemptions"] += 1
+
+    def get_expected_cost(self, price, runtime, zone, machine_family=None, is_preemptible=True, max_resets=None):
+        # Return expected cost (cents) of running a task of a given runtime (sec) on an instance with a price per hour
+        # Return None if the task can't be expected to finish on a preemptible instance
+        runtime = self.DEFAULT_RUNTIME if runtime is None else runtime
+        duration = runtime + self.RESTART_OVERHEAD
+
+        # Case: On-demand instance runs the task exactly once
+        if not is_preemptible:
+            return price * duration / 3600.0
+
+        # Task won't finish before the instance is stopped
+        if runtime >= self.MAX_PREEMPTIBLE_RUNTIME:
+            return None
+
+        # Preemptions are assumed to occur at a constant rate and the task to restart from the beginning
+        # Expected time until the task runs uninterrupted for its whole duration is (e^(rate*duration) - 1) / rate
+        rate = self.get_preemption_rate(zone, machine_family) / 3600.0
+        nr_preemptions = math.expm1(rate * duration)
+
+        # Instance is switched to on-demand once it's out of resets
+        if max_resets is not None and nr_preemptions >= max_resets:
+            return None
+
+        return price * (nr_preemptions / rate) / 3600.0
+
+    def save(self):
+        # Write preemption history to disk
+        try:
+            history_dir = os.path.dirname(self.history_file)
+            if history_dir != "" and not os.path.exists(history_dir):
+                os.makedirs(history_dir)
+            with self.history_lock:
+                with open(self.history_file, "w") as fh:
+                    json.dump(self.history, fh, indent=4)
+        except BaseException as e:
+            # Losing history shouldn't cause the pipeline to fail
+            logging.warning("Unable to save preemption history to '%s'!" % self.history_file)
+            if str(e) != "":
+                logging.warning("Received the following message:\n%s" % e)
+
+    def __get_records(self, zone, machine_family):
+        # Return records of the zone and of the machine family within the zone (created if missing)
+        zone_record = self.history.setdefault(zone, OrderedDict([("hours", 0.0), ("preemptions", 0)]))
+        records = [zone_record]
+        if machine_family is not None:
+            families = zone_record.setdefault("families", OrderedDict())
+            records.append(families.setdefault(machine_family, OrderedDict([("hours", 0.0), ("preemptions", 0)])))
+        return records
+
+    def __load(self):
+        # Read preemption history from disk if it exists
+        if not os.path.exists(self.history_file):
+            return OrderedDict()
+
+        try:
+            with open(self.history_file, "r") as fh:
+                return json.load(fh, object_pairs_hook=OrderedDict)
+        except BaseException as e:
+            logging.warning("Unable to read preemption history from '%s'! Preemption rates will be estimated."
+                            % self.history_file)
+            if str(e) != "":
+                logging.warning("Received the following message:\n%s" % e)
+            return OrderedDict()
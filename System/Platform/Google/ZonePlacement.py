@@ -0,0 +1,142 @@
+import time
+import random
+import logging
+import threading
+from collections import OrderedDict
+
+from System.Platform.Google import GoogleCloudHelper
+
+class ZonePlacement(object):
+    # Chooses the zone of each new instance among the zones the platform is allowed to use
+    # Zones that recently failed to create instances because they ran out of resources (stockout) or hit a quota
+    # are avoided for a while and new instances are spread across the remaining zones so large fan-outs
+    # don't exhaust a single zone
+    # Instances are placed in the home region (region of the output bucket) unless they're explicitly placed in
+    # another region near their input, so placement alone never adds cross-region egress
+
+    # Error messages returned by Google Cloud when a zone can't create an instance
+    CAPACITY_ERRORS = ["ZONE_RESOURCE_POOL_EXHAUSTED",
+                       "does not have enough resources available",
+                       "QUOTA_EXCEEDED",
+                       "Quota '"]
+
+    # Seconds a zone is avoided after a capacity error (doubled for each consecutive error)
+    MIN_BACKOFF = 300
+    MAX_BACKOFF = 3600
+
+    def __init__(self, zones, home_region=None):
+
+        # Zones instances can be placed in
+        if len(zones) == 0:
+            logging.error("No active zones available for placing instances!")
+            raise RuntimeError("Cannot place instances without any zones!")
+        self.zones = list(zones)
+
+        # Region instances are placed in by default (region of the first zone unless specified)
+        self.home_region = GoogleCloudHelper.get_region(self.zones[0]) if home_region is None else home_region
+        if self.home_region not in self.get_regions():
+            logging.error("No zones available for placing instances in home region '%s'!" % self.home_region)
+            raise RuntimeError("Cannot place instances without any zones in home region!")
+
+        # Lock for updating placement from multiple threads
+        self.placement_lock = threading.Lock()
+
+        # Zone of each current instance: instance name -> zone
+        self.instance_zones = {}
+
+        # Total number of instance creations sent to each zone
+        self.nr_placed = OrderedDict([(zone, 0) for zone in self.zones])
+
+        # Capacity errors of each zone: zone -> {"errors": total, "consecutive": since last success, "until": time}
+        self.zone_errors = OrderedDict([(zone, {"errors": 0, "consecutive": 0, "until": 0}) for zone in self.zones])
+
+    @staticmethod
+    def is_capacity_error(err):
+        # Return True if an error message indicates that a zone couldn't provide the requested resources
+        return any(msg.lower() in err.lower() for msg in ZonePlacement.CAPACITY_ERRORS)
+
+    def get_zones(self, region=None):
+        # Return zones (within a region if specified)
+        return [zone for zone in self.zones if region is None or GoogleCloudHelper.get_region(zone) == region]
+
+    def get_regions(self):
+        regions = []
+        for zone in self.zones:
+            if GoogleCloudHelper.get_region(zone) not in regions:
+                regions.append(GoogleCloudHelper.get_region(zone))
+        return regions
+
+    def get_home_region(self):
+        return self.home_region
+
+    def get_available_zones(self, region=None):
+        # Return zones (within a region if specified) that aren't currently avoided due to capacity errors
+        zones = self.get_zones(region)
+        with self.placement_lock:
+            now = time.time()
+            return [zone for zone in zones if self.zone_errors[zone]["until"] <= now]
+
+    def select_zone(self, exclude=None, region=None):
+        # Return zone with the fewest instances among the available zones of a region (home region by default)
+        # Return None if no other zone can be used
+        exclude = [] if exclude is None else exclude
+        region  = self.home_region if region is None else region
+        zones   = [zone for zone in self.get_zones(region) if zone not in exclude]
+        with self.placement_lock:
+            if len(zones) == 0:
+                return None
+
+            # Use zone that will be available soonest if every zone is being avoided
+            now = time.time()
+            available = [zone for zone in zones if self.zone_errors[zone]["until"] <= now]
+            if len(available) == 0:
+                return min(zones, key=lambda z: self.zone_errors[z]["until"])
+
+            # Spread instances across zones (ties are broken randomly)
+            counts = {zone: 0 for zone in available}
+            for zone in self.instance_zones.values():
+                if zone in counts:
+                    counts[zone] += 1
+            min_count = min(counts.values())
+            return random.choice([zone for zone in available if counts[zone] == min_count])
+
+    def assign(self, instance_name, zone):
+        # Record the zone an instance is placed in
+        with self.placement_lock:
+            self.instance_zones[instance_name] = zone
+            if zone in self.nr_placed:
+                self.nr_placed[zone] += 1
+
+    def release(self, instance_name):
+        # Forget a destroyed instance
+        with self.placement_lock:
+            self.instance_zones.pop(instance_name, None)
+
+    def record_capacity_error(self, zone):
+        # Avoid zone for a while after it failed to provide resources
+        with self.placement_lock:
+            if zone not in self.zone_errors:
+                return
+            record = self.zone_errors[zone]
+            backoff = min(self.MIN_BACKOFF * 2 ** record["consecutive"], self.MAX_BACKOFF)
+            record["errors"]        += 1
+            record["consecutive"]   += 1
+            record["until"]         = time.time() + backoff
+        logging.warning("Zone '%s' is out of capacity. Avoiding zone for %s seconds." % (zone, backoff))
+
+    def record_success(self, zone):
+        # Zone is able to create instances again
+        with self.placement_lock:
+            if zone in self.zone_errors:
+                self.zone_errors[zone]["consecutive"] = 0
+
+    def get_stats(self):
+        # Return summary of how instances were placed across zones
+        with self.placement_lock:
+            stats = OrderedDict()
+            for zone in self.zones:
+                stats[zone] = OrderedDict()
+                stats[zone]["placed"]           = self.nr_placed[zone]
+                stats[zone]["instances"]        = len([z for z in self.instance_zones.values() if z == zone])
+                stats[zone]["capacity_errors"]  = self.zone_errors[zone]["errors"]
+            return stats
@@ -1,4 +1,7 @@
+from .GoogleAPIClient import GoogleAPIClient, GoogleAPIError, GoogleAPINotFound
 from .GoogleCloudHelper import GoogleCloudHelper, GoogleResourceNotFound
+from .PreemptionPolicy import PreemptionPolicy
+from .ZonePlacement import ZonePlacement
 from .Instance import Instance
 from .PreemptibleInstance import PreemptibleInstance
 from .GooglePlatform import GooglePlatform
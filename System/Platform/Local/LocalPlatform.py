@@ -0,0 +1,123 @@
+import os
+import logging
+import shutil
+import threading
+
+from System.Platform import Platform, ResourceLimiter
+from System.Platform.Local import LocalProcessor
+
+class LocalPlatform(Platform):
+    # Platform that runs every task on the local host, splitting the host's cores between task processors
+
+    CONFIG_SPEC = "System/Platform/Local/LocalPlatform.validate"
+
+    def __init__(self, name, platform_config_file, final_output_dir):
+        # Call super constructor from Platform
+        super(LocalPlatform, self).__init__(name, platform_config_file, final_output_dir)
+
+        # Whether to enforce cpu/memory limits through cgroups in addition to cpu affinity
+        self.use_cgroups    = self.config["use_cgroups"]
+
+        # Whether commands are allowed to run with sudo
+        self.allow_sudo     = self.config["allow_sudo"]
+
+        # Number of times to retry failed commands
+        self.cmd_retries    = self.config["cmd_retries"]
+
+        # Number of processors currently pinned to each host cpu
+        self.core_lock      = threading.Lock()
+        self.core_usage     = [0] * min(os.cpu_count(), self.TOTAL_NR_CPUS)
+
+        # Cpus assigned to each processor
+        self.proc_cores     = {}
+
+    def validate(self):
+        # Check that final output dir is on the local filesystem
+        if ":" in self.final_output_dir:
+            logging.error("Invalid final output directory: %s. Local platform requires a local directory!"
+                          % self.final_output_dir)
+            raise IOError("Invalid final output directory!")
+
+        # Check that resource limits can be enforced on the host
+        if shutil.which("taskset") is None:
+            logging.error("Local platform requires 'taskset' to limit the cpus used by each task!")
+            raise IOError("Unable to find 'taskset' on local host!")
+
+        if self.use_cgroups and shutil.which("systemd-run") is None:
+            logging.error("Local platform configured to use cgroups but 'systemd-run' was not found!")
+            raise IOError("Unable to find 'systemd-run' on local host!")
+
+        # Warn if platform has been given more cpus than the host has
+        if self.TOTAL_NR_CPUS > os.cpu_count():
+            logging.warning("Local platform allows %d cpus but host only has %d! Tasks will share cpus."
+                            % (self.TOTAL_NR_CPUS, os.cpu_count()))
+
+    def init_helper_processor(self, name, nr_cpus, mem, disk_space):
+        # Helper only runs lightweight platform commands so it isn't limited
+        return LocalProcessor(name,
+                              nr_cpus,
+                              mem,
+                              disk_space,
+                              allow_sudo=self.allow_sudo,
+                              cmd_retries=self.cmd_retries)
+
+    def init_task_processor(self, name, nr_cpus, mem, disk_space):
+        # Pin processor to its own set of cpus
+        cores = self.__allocate_cores(name, nr_cpus)
+        limiter = ResourceLimiter(cores, mem, use_cgroups=self.use_cgroups)
+        return LocalProcessor(name,
+                              nr_cpus,
+                              mem,
+                              disk_space,
+                              resource_limiter=limiter,
+                              allow_sudo=self.allow_sudo,
+                              cmd_retries=self.cmd_retries)
+
+    def deallocate_resources(self, proc):
+        # Free-up cpus pinned to processor
+        super(LocalPlatform, self).deallocate_resources(proc)
+        self.__release_cores(proc.get_name())
+
+    def publish_report(self, report=None):
+
+        # Exit as nothing to output
+        if report is None:
+            return
+
+        # Write report to final output directory
+        if not os.path.exists(self.final_output_dir):
+            os.makedirs(self.final_output_dir)
+        report_path = os.path.join(self.final_output_dir, "%s_final_report.json" % self.name)
+        with open(report_path, "w") as report_file:
+            report_file.write(str(report))
+
+    def clean_up(self):
+
+        logging.info("Cleaning up local platform.")
+
+        # Kill any processes still running on processors that haven't been destroyed
+        for proc_name, proc in self.processors.items():
+            try:
+                if proc_name not in self.dealloc_procs:
+                    proc.destroy(wait=True)
+            except RuntimeError:
+                logging.warning("(%s) Could not destroy processor!" % proc_name)
+
+        logging.info("Clean up complete!")
+
+    ####### PRIVATE UTILITY METHODS
+
+    def __allocate_cores(self, proc_name, nr_cpus):
+        # Assign the least used host cpus to a processor
+        with self.core_lock:
+            nr_cpus = min(nr_cpus, len(self.core_usage))
+            cores = sorted(range(len(self.core_usage)), key=lambda core: self.core_usage[core])[0:nr_cpus]
+            for core in cores:
+                self.core_usage[core] += 1
+            self.proc_cores[proc_name] = sorted(cores)
+            return self.proc_cores[proc_name]
+
+    def __release_cores(self, proc_name):
+        with self.core_lock:
+            for core in self.proc_cores.pop(proc_name, []):
+                self.core_usage[core] -= 1
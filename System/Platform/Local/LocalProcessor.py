@@ -0,0 +1,131 @@
+import logging
+import re
+import subprocess as sp
+
+from System.Platform import Process, Processor
+
+class LocalProcessor(Processor):
+    # Processor that runs commands directly on the host (or in docker containers on the host)
+
+    def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
+
+        # Resource limiter restricting commands to the processor's cpus/memory (None = no limits)
+        self.resource_limiter   = kwargs.pop("resource_limiter", None)
+
+        # Whether commands are allowed to run with sudo
+        self.allow_sudo         = kwargs.pop("allow_sudo", False)
+
+        # Call super constructor
+        super(LocalProcessor, self).__init__(name, nr_cpus, mem, disk_space, **kwargs)
+
+    def create(self):
+
+        if self.is_locked():
+            logging.error("(%s) Failed to create processor. Processor locked!" % self.name)
+            raise RuntimeError("Cannot create processor while locked!")
+
+        # Nothing needs to be provisioned on the host
+        self.set_start_time()
+        self.set_status(Processor.AVAILABLE)
+        logging.info("(%s) Process 'create' complete!" % self.name)
+
+    def destroy(self, wait=True):
+
+        logging.info("(%s) Process 'destroy' started!" % self.name)
+
+        # Kill any commands still running on processor
+        for proc_name, proc_obj in self.processes.items():
+            if proc_name != "destroy" and not proc_obj.is_complete() and proc_obj.poll() is None:
+                logging.debug("(%s) Killing process: %s" % (self.name, proc_name))
+                proc_obj.stop()
+
+        # Register a finished 'destroy' process so callers can wait on it like on any other platform
+        self.processes["destroy"] = Process("true",
+                                            cmd="true",
+                                            stdout=sp.PIPE,
+                                            stderr=sp.PIPE,
+                                            shell=True,
+                                            num_retries=0)
+        if wait:
+            self.wait_process("destroy")
+
+    def wait_process(self, proc_name):
+        # Get process from process list
+        proc_obj = self.processes[proc_name]
+
+        # Return immediately if process has already been set to complete
+        if proc_obj.is_complete():
+            return proc_obj.get_output()
+
+        # Wait for process to finish
+        out, err = proc_obj.communicate()
+
+        # Convert to string formats
+        out = out.decode("utf8")
+        err = err.decode("utf8")
+
+        # Set process to complete
+        proc_obj.set_complete()
+
+        # Store process output for later use
+        proc_obj.set_output(out=out, err=err)
+
+        # Case: Process completed with errors
+        if proc_obj.has_failed():
+            # Determine whether to retry or raise errors
+            self.handle_failure(proc_name, proc_obj)
+            # If no errors thrown, try waiting on the process again
+            return self.wait_process(proc_name)
+
+        # Set stop time once processor is destroyed
+        if proc_name == "destroy":
+            self.set_stop_time()
+            self.set_status(Processor.OFF)
+
+        # Case: Process completed
+        if proc_obj.do_log_success():
+            logging.info("(%s) Process '%s' complete!" % (self.name, proc_name))
+
+        return out, err
+
+    def handle_failure(self, proc_name, proc_obj):
+
+        # Retry command if it wasn't cancelled and there are retries left
+        if not self.is_locked() and not proc_obj.is_stopped() and proc_obj.get_num_retries() > 0:
+            logging.warning("(%s) Process '%s' failed but we still got %s retries left. Re-running command!" % (
+                self.name, proc_name, proc_obj.get_num_retries()))
+            self.run(job_name=proc_name,
+                     cmd=proc_obj.get_command(),
+                     num_retries=proc_obj.get_num_retries() - 1,
+                     docker_image=proc_obj.get_docker_image(),
+                     quiet_failure=proc_obj.is_quiet())
+            return
+
+        # Log failure to debug logger if quiet failure
+        stdout_msg, stderr_msg = proc_obj.get_output()
+        if proc_obj.is_quiet():
+            logging.debug("(%s) Process '%s' failed!" % (self.name, proc_name))
+            if stdout_msg != "" or stderr_msg != "":
+                logging.debug("(%s) The following error was received:\n%s\n%s" % (self.name, stdout_msg, stderr_msg))
+
+        # Warn that process has failed due to cancellation
+        elif proc_obj.is_stopped():
+            logging.warning("(%s) Process '%s' failed due to cancellation!" % (self.name, proc_name))
+
+        # Log failure to error logger otherwise
+        else:
+            logging.error("(%s) Process '%s' failed!" % (self.name, proc_name))
+            if stdout_msg != "" or stderr_msg != "":
+                logging.error("(%s) The following error was received:\n%s\n%s" % (self.name, stdout_msg, stderr_msg))
+        raise RuntimeError("Processor %s has failed!" % self.name)
+
+    def adapt_cmd(self, cmd):
+        # Remove sudo if commands aren't allowed to run as root on the host
+        if not self.allow_sudo:
+            cmd = re.sub(r"\bsudo\s+", "", cmd)
+
+        # Restrict command to the cpus/memory allocated to the processor
+        if self.resource_limiter is not None:
+            cmd = self.resource_limiter.limit_cmd(cmd)
+
+        return cmd
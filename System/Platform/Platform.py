@@ -2,8 +2,12 @@ import logging
 import abc
 import uuid
 import threading
+import time
+from collections import OrderedDict
 
 from Config import ConfigParser
+from System.Workers import Thread
+from System.Platform import Processor, ProcessorSlice, ProcessorHost
 
 class TaskPlatformResourceLimitError(Exception):
     pass
@@ -62,10 +66,86 @@ class Platform(object, metaclass=abc.ABCMeta):
         self.mem = 0
         self.disk_space = 0
 
+        # Resources reserved by the scheduler for tasks that haven't acquired a processor yet
+        self.reservations = {}
+
         self.dealloc_procs = []
 
-    def get_processor(self, task_id, nr_cpus, mem, disk_space):
-        # Initialize new processor and register with platform
+        # Pool of idle task processors that can be leased by new tasks instead of creating new processors
+        # Max number of idle processors and number of seconds a processor can stay idle before it's destroyed
+        self.pool_size      = self.config.get("processor_pool_size", 0)
+        self.pool_ttl       = self.config.get("processor_pool_ttl", 300)
+
+        # Idle processors ordered by time they became idle: proc_name -> (processor, runtime, cost) when idle
+        self.idle_procs     = OrderedDict()
+
+        # Resources requested when creating each task processor: proc_name -> (nr_cpus, mem, docker_image)
+        self.proc_shapes    = {}
+
+        # Idle processors claimed by the scheduler for tasks that haven't acquired a processor yet
+        self.leases         = {}
+
+        # Thread destroying processors that have been idle for too long
+        self.pool_reaper    = None
+
+        # Processor pool statistics
+        self.pool_hits          = 0
+        self.pool_misses        = 0
+        self.pool_idle_time     = 0
+        self.pool_idle_cost     = 0
+        self.total_boot_time    = 0
+        self.nr_boots           = 0
+
+        # Small tasks can be packed together onto larger host processors
+        # Tasks needing at most this many cpus are packed (0 = tasks are never packed)
+        self.packing_max_task_cpus  = self.config.get("packing_max_task_cpus", 0)
+        self.host_nr_cpus           = self.config.get("packing_host_nr_cpus", 16)
+        self.host_mem               = self.config.get("packing_host_mem", 64)
+        self.host_disk_space        = self.config.get("packing_host_disk_space", 500)
+        if self.packing_max_task_cpus > 0:
+            self.__check_processor("packing host", self.host_nr_cpus, self.host_mem, self.host_disk_space)
+
+        # Host processors running processor slices: host_name -> ProcessorHost
+        self.hosts          = OrderedDict()
+
+        # Host each packed task has been placed on: task_id -> host_name
+        self.task_hosts     = {}
+
+        # Every processor slice created by the platform: slice_name -> processor slice
+        self.slices         = OrderedDict()
+
+        # Task running on each slice that hasn't been deallocated: slice_name -> task_id
+        self.slice_tasks    = {}
+
+        # Names of every host processor created by the platform
+        self.host_names     = []
+
+        # Task affinity: a task whose output is only used by one child task can hand its processor off to the child
+        # Output stays on the processor and is only uploaded if the child can't run on the processor
+        self.task_affinity  = self.config.get("task_affinity", False)
+
+        # Processors handed off to tasks that haven't claimed them yet: task_id -> (processor, flush)
+        # Calling flush() uploads the output kept on the processor for the task
+        self.handoffs       = {}
+
+        # Flush functions of handed off processors claimed by the scheduler for tasks: task_id -> flush
+        self.handoff_leases = {}
+
+        # Threads uploading output of handed off processors that couldn't be used: task_id -> HandoffFlushWorker
+        self.handoff_flushes = {}
+
+        # Workspaces of previous tasks left on handed off processors: proc_name -> list of workspace dirs
+        self.stale_wrk_dirs = {}
+
+        # Task affinity statistics
+        self.nr_handoffs            = 0
+        self.nr_handoffs_flushed    = 0
+
+        # Runtimes of modules in previous pipeline runs (set by the pipeline)
+        self.runtime_history = None
+
+    def get_processor(self, task_id, nr_cpus, mem, disk_space, module_name=None, docker_image=None):
+        # Lease an idle processor or initialize new processor and register with platform
 
         logging.debug("(%s) Checking platform locked..." % task_id)
         if self.__locked:
@@ -78,6 +158,39 @@ class Platform(object, metaclass=abc.ABCMeta):
         self.__check_processor(task_id, nr_cpus, mem, disk_space)
         logging.debug("(%s) Processor ain't too big!" % task_id)
 
+        # Wait for parent output to be uploaded if the processor handed off to the task couldn't be used
+        with self.platform_lock:
+            flush_worker = self.handoff_flushes.pop(task_id, None)
+        if flush_worker is not None:
+            flush_worker.finalize()
+
+        # Run small tasks on a slice of a shared host processor
+        if self.is_packable(nr_cpus, mem, disk_space):
+            with self.platform_lock:
+                is_placed = task_id in self.task_hosts or self.__place_on_host(task_id, nr_cpus, mem, disk_space)
+                if is_placed:
+                    self.__release_reservation(task_id)
+            if is_placed:
+                return self.__get_processor_slice(task_id, nr_cpus, mem, disk_space, module_name)
+
+        # Lease processor claimed for task (or any matching idle processor) instead of creating a new one
+        with self.platform_lock:
+            processor = self.leases.pop(task_id, None)
+            self.handoff_leases.pop(task_id, None)
+            if processor is None:
+                processor = self.__claim_idle_processor(nr_cpus, mem, disk_space, docker_image)
+            if processor is not None:
+                # Task doesn't need the resources reserved for it as the processor's resources are already in use
+                self.__release_reservation(task_id)
+                self.pool_hits += 1
+            elif self.pool_size > 0:
+                self.pool_misses += 1
+
+        if processor is not None:
+            logging.info("Leasing idle processor '%s' for task '%s'..." % (processor.get_name(), task_id))
+            processor.set_module_name(module_name)
+            return processor
+
         # Ensure unique name for processor
         name        = "proc-%s-%s-%s" % (self.name[:20], task_id[:25], self.generate_unique_id())
         logging.info("Creating processor '%s' for task '%s'..." % (name, task_id))
@@ -85,6 +198,7 @@ class Platform(object, metaclass=abc.ABCMeta):
         # Initialize new processor with enough CPU/mem/disk space to complete task
         logging.debug("(%s) Checking to see if processor is too big for platform..." % task_id)
         processor   = self.init_task_processor(name, nr_cpus, mem, disk_space)
+        processor.set_module_name(module_name)
         proc_name   = processor.get_name()
         logging.debug("(%s) Platform successfully initialized processor for task!" % task_id)
 
@@ -92,7 +206,10 @@ class Platform(object, metaclass=abc.ABCMeta):
         with self.platform_lock:
             logging.debug("(%s) We are starting to put that processor in the spot..." % task_id)
             if proc_name not in self.processors:
+                # Replace any resources reserved for the task with the resources actually used by the processor
+                self.__release_reservation(task_id)
                 self.processors[proc_name]    = processor
+                self.proc_shapes[proc_name]   = (nr_cpus, mem, docker_image)
                 self.cpu += processor.get_nr_cpus()
                 self.mem += processor.get_mem()
                 self.disk_space += processor.get_disk_space()
@@ -137,8 +254,204 @@ class Platform(object, metaclass=abc.ABCMeta):
             disk_overload   = self.disk_space + req_disk_space > self.TOTAL_DISK_SPACE
         return (not cpu_overload) and (not mem_overload) and (not disk_overload) and (not self.__locked)
 
+    def reserve_resources(self, task_id, nr_cpus, mem, disk_space, docker_image=None):
+        # Reserve resources for a task if they are available on the platform
+        # Returns True if resources were reserved, False if the task doesn't currently fit
+
+        # Check to see if task is asking for too many resources
+        self.__check_processor(task_id, nr_cpus, mem, disk_space)
+
+        while True:
+            with self.platform_lock:
+                if self.__locked:
+                    return False
+
+                if task_id in self.reservations or task_id in self.leases:
+                    logging.error("Platform cannot reserve resources twice for task '%s'!" % task_id)
+                    raise RuntimeError("Platform attempted to reserve resources twice for the same task!")
+
+                if task_id in self.task_hosts:
+                    logging.error("Platform cannot reserve resources twice for task '%s'!" % task_id)
+                    raise RuntimeError("Platform attempted to reserve resources twice for the same task!")
+
+                # Claim processor handed off to the task if the task fits on it
+                if task_id in self.handoffs:
+                    processor, flush = self.handoffs[task_id]
+                    if nr_cpus <= processor.get_nr_cpus() and mem <= processor.get_mem() \
+                            and disk_space <= processor.get_disk_space():
+                        self.handoffs.pop(task_id)
+                        self.leases[task_id]            = processor
+                        self.handoff_leases[task_id]    = flush
+                        return True
+
+                    # Otherwise upload the output kept on the processor and free it up
+                    logging.info("Task '%s' doesn't fit on processor '%s' handed off to it! Uploading output kept "
+                                 "on processor." % (task_id, processor.get_name()))
+                    self.__start_handoff_flush(task_id)
+
+                if self.is_packable(nr_cpus, mem, disk_space):
+                    # Place small task on a shared host processor
+                    if self.__place_on_host(task_id, nr_cpus, mem, disk_space):
+                        return True
+
+                else:
+                    # Claim an idle processor for the task if one matches its requirements
+                    processor = self.__claim_idle_processor(nr_cpus, mem, disk_space, docker_image)
+                    if processor is not None:
+                        self.leases[task_id] = processor
+                        return True
+
+                    if self.__has_capacity(nr_cpus, mem, disk_space):
+                        self.reservations[task_id] = (nr_cpus, mem, disk_space)
+                        self.cpu += nr_cpus
+                        self.mem += mem
+                        self.disk_space += disk_space
+                        return True
+
+                # Task doesn't fit so make room by destroying the processor that's been idle the longest
+                processor = self.__pop_retirable_processor()
+                if processor is None:
+                    return False
+
+            self.__retire_processor(processor)
+
+    def release_reservation(self, task_id):
+        # Free-up resources reserved for a task that won't be acquiring a processor
+        with self.platform_lock:
+            self.__release_reservation(task_id)
+
+            # Return unused idle processor claimed for the task to the pool
+            # Processors handed off to the task keep waiting for it as they hold output the task needs
+            processor = self.leases.pop(task_id, None)
+            if processor is not None and task_id in self.handoff_leases:
+                self.handoffs[task_id] = (processor, self.handoff_leases.pop(task_id))
+            elif processor is not None:
+                self.idle_procs[processor.get_name()] = (processor, processor.get_runtime(), processor.compute_cost())
+
+            # Free-up host resources if task was placed on a host but never got a processor slice
+            if task_id in self.task_hosts and task_id not in self.slice_tasks.values():
+                self.__release_host_slot(task_id)
+
+    def release_processor(self, proc):
+        # Return a task processor to the pool of idle processors once its task has finished
+        # Returns False if the processor can't be reused and should be destroyed by the caller
+        proc_name = proc.get_name()
+        if self.pool_size == 0 or proc_name not in self.proc_shapes:
+            return False
+
+        # Destroy processors that have been idle for too long before adding another one
+        self.__expire_idle_processors()
+
+        # Only reuse healthy processors
+        if proc.is_locked() or proc.get_status() != Processor.AVAILABLE:
+            return False
+
+        # Processor is idle from now on
+        idle_runtime    = proc.get_runtime()
+        idle_cost       = proc.compute_cost()
+
+        with self.platform_lock:
+            if self.__locked or len(self.idle_procs) >= self.pool_size:
+                return False
+
+        # Remove workspace of last task (and of tasks that handed off the processor) so it doesn't take up
+        # disk space needed by the next task
+        task_wrk_dir = proc.get_wrk_dir()
+        if self.standardize_dir(task_wrk_dir) == self.standardize_dir(self.wrk_dir):
+            return False
+        with self.platform_lock:
+            wrk_dirs = self.stale_wrk_dirs.pop(proc_name, []) + [task_wrk_dir]
+        try:
+            proc.run(job_name="rm_task_workspace", cmd="sudo rm -rf %s" % " ".join(wrk_dirs))
+            proc.wait_process("rm_task_workspace")
+        except BaseException as e:
+            logging.warning("(%s) Unable to clean task workspace! Processor will not be reused." % proc_name)
+            if str(e) != "":
+                logging.debug("Received the following error:\n%s" % e)
+            return False
+        proc.recycle()
+
+        with self.platform_lock:
+            if self.__locked or len(self.idle_procs) >= self.pool_size:
+                return False
+            self.idle_procs[proc_name] = (proc, idle_runtime, idle_cost)
+            logging.debug("(%s) Processor added to idle processor pool." % proc_name)
+
+            # Start destroying processors that have been idle for too long
+            self.__start_pool_reaper()
+
+        return True
+
+    def hand_off_processor(self, proc, task_id, flush):
+        # Keep a task processor running with the output of its task so it can be used by the task consuming the output
+        # flush() uploads the output if the processor ends up not being used by the task
+        # Returns False if the processor can't be handed off
+        proc_name = proc.get_name()
+        if not self.task_affinity or proc_name not in self.proc_shapes:
+            return False
+
+        # Only hand off healthy processors
+        if proc.is_locked() or proc.get_status() != Processor.AVAILABLE:
+            return False
+
+        with self.platform_lock:
+            if self.__locked or task_id in self.handoffs or task_id in self.leases or task_id in self.reservations:
+                return False
+
+            # Previous task workspace holds the output so it's only removed once processor is released
+            self.stale_wrk_dirs.setdefault(proc_name, []).append(proc.get_wrk_dir())
+            proc.recycle()
+            self.handoffs[task_id] = (proc, flush)
+            self.nr_handoffs += 1
+            logging.info("Processor '%s' handed off to task '%s'." % (proc_name, task_id))
+
+        return True
+
+    def release_handoff_processor(self, proc):
+        # Return processor whose output has been uploaded to the pool or destroy it if it can't be reused
+        if not self.release_processor(proc):
+            self.__retire_processor(proc)
+
+    def has_handoff(self, task_id):
+        # Return True if a processor has been handed off to the task
+        with self.platform_lock:
+            return task_id in self.handoffs
+
+    def wait_for_handoff_flushes(self):
+        # Wait for processors whose handed off output is being uploaded to be freed up
+        # Returns False if no output was being uploaded
+        with self.platform_lock:
+            flush_workers = list(self.handoff_flushes.values())
+        for flush_worker in flush_workers:
+            flush_worker.join()
+        return len(flush_workers) > 0
+
+    def flush_handoffs(self):
+        # Upload the output on every processor that's still waiting for a task and free-up the processors
+        with self.platform_lock:
+            for task_id in list(self.handoffs.keys()):
+                self.__start_handoff_flush(task_id)
+            flush_workers = list(self.handoff_flushes.values())
+            self.handoff_flushes = {}
+
+        for flush_worker in flush_workers:
+            try:
+                flush_worker.finalize()
+            except BaseException:
+                # Errors have already been logged by the worker
+                pass
+
     def deallocate_resources(self, proc):
         # Free-up resources being used by a processor
+
+        # Free-up the host resources used by a processor slice
+        if proc.get_name() in self.slices:
+            with self.platform_lock:
+                task_id = self.slice_tasks.pop(proc.get_name(), None)
+                if task_id is not None:
+                    self.__release_host_slot(task_id)
+            return
+
         if not proc.get_name() in self.processors:
             logging.error("Cannot de-allocate resources for processor '%s%! No processor with that ID found on platform!")
             raise RuntimeError("Attempt to deallocate processor that doesn't exist on platform!")
@@ -148,6 +461,67 @@ class Platform(object, metaclass=abc.ABCMeta):
             self.disk_space -= proc.get_disk_space()
             self.dealloc_procs.append(proc.get_name())
 
+    def record_boot_time(self, boot_time):
+        # Register the time it took to create a task processor
+        with self.platform_lock:
+            self.total_boot_time += boot_time
+            self.nr_boots += 1
+
+    def get_processor_pool_stats(self):
+        # Return summary of how often tasks were able to reuse idle processors
+        with self.platform_lock:
+            idle_time   = self.pool_idle_time
+            idle_cost   = self.pool_idle_cost
+
+            # Include processors that are currently idle
+            for proc, idle_runtime, proc_idle_cost in self.idle_procs.values():
+                idle_time   += proc.get_runtime() - idle_runtime
+                idle_cost   += proc.compute_cost() - proc_idle_cost
+
+            nr_leases       = self.pool_hits + self.pool_misses
+            mean_boot_time  = self.total_boot_time / self.nr_boots if self.nr_boots > 0 else 0
+
+            stats = OrderedDict()
+            stats["pool_size"]              = self.pool_size
+            stats["idle_ttl(sec)"]          = self.pool_ttl
+            stats["hits"]                   = self.pool_hits
+            stats["misses"]                 = self.pool_misses
+            stats["hit_rate"]               = self.pool_hits / nr_leases if nr_leases > 0 else 0
+            stats["mean_boot_time(sec)"]    = mean_boot_time
+            stats["boot_time_saved(sec)"]   = self.pool_hits * mean_boot_time
+            stats["idle_time(sec)"]         = idle_time
+            stats["idle_cost"]              = idle_cost
+            stats["task_affinity"]          = self.task_affinity
+            stats["handoffs"]               = self.nr_handoffs
+            stats["handoffs_flushed"]       = self.nr_handoffs_flushed
+            return stats
+
+    def get_packing_stats(self):
+        # Return summary of how small tasks were packed onto shared host processors
+        with self.platform_lock:
+            host_cost   = sum([self.processors[host_name].compute_cost() for host_name in self.host_names])
+            slice_cost  = sum([proc_slice.compute_cost() for proc_slice in self.slices.values()])
+
+            stats = OrderedDict()
+            stats["packing_max_task_cpus"]  = self.packing_max_task_cpus
+            stats["nr_hosts"]               = len(self.host_names)
+            stats["nr_packed_tasks"]        = len(self.slices)
+            stats["host_cost"]              = host_cost
+            stats["unused_host_cost"]       = max(host_cost - slice_cost, 0)
+            return stats
+
+    def is_packable(self, nr_cpus, mem, disk_space):
+        # Determine whether a task is small enough to run on a slice of a shared host processor
+        return 0 < nr_cpus <= self.packing_max_task_cpus \
+               and mem <= self.host_mem and disk_space <= self.host_disk_space
+
+    def set_runtime_history(self, runtime_history):
+        self.runtime_history = runtime_history
+
+    def get_time(self):
+        # Current time on the clock used by the platform's processors
+        return time.time()
+
     def get_max_nr_cpus(self):
         return self.MAX_NR_CPUS
 
@@ -192,6 +566,177 @@ class Platform(object, metaclass=abc.ABCMeta):
         if err:
             raise InvalidProcessorError("Processor resource requirements exceed platform capacity for single processor!")
 
+    def __release_reservation(self, task_id):
+        # Remove reservation for a task (platform lock must be held by caller)
+        if task_id not in self.reservations:
+            return
+        nr_cpus, mem, disk_space = self.reservations.pop(task_id)
+        self.cpu -= nr_cpus
+        self.mem -= mem
+        self.disk_space -= disk_space
+
+    def __has_capacity(self, nr_cpus, mem, disk_space):
+        # Determine whether platform has enough free resources for a new processor (platform lock must be held by caller)
+        cpu_overload    = self.cpu + nr_cpus > self.TOTAL_NR_CPUS
+        mem_overload    = self.mem + mem > self.TOTAL_MEM
+        disk_overload   = self.disk_space + disk_space > self.TOTAL_DISK_SPACE
+        return not (cpu_overload or mem_overload or disk_overload)
+
+    def __place_on_host(self, task_id, nr_cpus, mem, disk_space):
+        # Assign task to the busiest host processor with room for it (platform lock must be held by caller)
+        # Creates a new host if no host has room. Returns False if a new host doesn't fit on the platform.
+        best_host = None
+        for host in self.hosts.values():
+            if host.can_fit(nr_cpus, mem, disk_space):
+                if best_host is None or len(host.free_cpus) < len(best_host.free_cpus):
+                    best_host = host
+
+        # Initialize new host processor
+        if best_host is None:
+            if not self.__has_capacity(self.host_nr_cpus, self.host_mem, self.host_disk_space):
+                return False
+            name        = "host-%s-%s" % (self.name[:20], self.generate_unique_id())
+            processor   = self.init_host_processor(name, self.host_nr_cpus, self.host_mem, self.host_disk_space)
+            logging.info("Initialized host processor '%s' for packing small tasks." % processor.get_name())
+            self.processors[processor.get_name()] = processor
+            self.cpu += processor.get_nr_cpus()
+            self.mem += processor.get_mem()
+            self.disk_space += processor.get_disk_space()
+            self.host_names.append(processor.get_name())
+            best_host = ProcessorHost(processor)
+            self.hosts[processor.get_name()] = best_host
+
+        best_host.allocate(task_id, nr_cpus, mem, disk_space)
+        self.task_hosts[task_id] = best_host.get_processor().get_name()
+        return True
+
+    def __get_processor_slice(self, task_id, nr_cpus, mem, disk_space, module_name):
+        # Create processor slice for a task that's been placed on a host
+
+        with self.platform_lock:
+            host = self.hosts[self.task_hosts[task_id]]
+            cpus = host.get_cpus(task_id)
+
+        name = "slice-%s-%s-%s" % (self.name[:20], task_id[:25], self.generate_unique_id())
+        logging.info("Creating processor slice '%s' on host '%s' for task '%s'..." %
+                     (name, host.get_processor().get_name(), task_id))
+        processor = self.init_processor_slice(name, nr_cpus, mem, disk_space,
+                                              host=host.get_processor(),
+                                              host_lock=host.create_lock,
+                                              cpus=cpus)
+        processor.set_module_name(module_name)
+
+        with self.platform_lock:
+            self.slices[processor.get_name()]       = processor
+            self.slice_tasks[processor.get_name()]  = task_id
+
+        return processor
+
+    def __release_host_slot(self, task_id):
+        # Free-up host resources assigned to a task (platform lock must be held by caller)
+        host = self.hosts.get(self.task_hosts.pop(task_id), None)
+        if host is None:
+            return
+        host.release(task_id)
+
+        # Start destroying hosts that have been empty for too long
+        if host.is_empty():
+            self.__start_pool_reaper()
+
+    def __start_handoff_flush(self, task_id):
+        # Upload output kept on processor handed off to a task in the background (platform lock must be held by caller)
+        processor, flush = self.handoffs.pop(task_id)
+        flush_worker = HandoffFlushWorker(self, task_id, processor, flush)
+        self.handoff_flushes[task_id] = flush_worker
+        self.nr_handoffs_flushed += 1
+        flush_worker.start()
+
+    def __pop_retirable_processor(self):
+        # Remove and return the idle processor or empty host that's been idle the longest (platform lock must be held by caller)
+        if len(self.idle_procs) > 0:
+            return self.__pop_idle_processor(next(iter(self.idle_procs)))
+        for host_name, host in self.hosts.items():
+            if host.is_empty():
+                return self.hosts.pop(host_name).get_processor()
+        return None
+
+    def __start_pool_reaper(self):
+        # Start thread for destroying processors that have been idle for too long (platform lock must be held by caller)
+        if self.pool_reaper is None:
+            self.pool_reaper = threading.Thread(target=self.__reap_idle_processors, daemon=True)
+            self.pool_reaper.start()
+
+    def __claim_idle_processor(self, nr_cpus, mem, disk_space, docker_image):
+        # Remove and return the idle processor with the smallest disk that matches task requirements (platform lock must be held by caller)
+        # Returns None if no idle processor matches
+        best_proc_name = None
+        for proc_name, (proc, idle_runtime, idle_cost) in self.idle_procs.items():
+
+            # Skip processors that are about to be destroyed
+            if proc.get_runtime() - idle_runtime >= self.pool_ttl:
+                continue
+
+            if self.proc_shapes[proc_name] != (nr_cpus, mem, docker_image) or proc.get_disk_space() < disk_space:
+                continue
+
+            if best_proc_name is None or proc.get_disk_space() < self.idle_procs[best_proc_name][0].get_disk_space():
+                best_proc_name = proc_name
+
+        if best_proc_name is None:
+            return None
+        return self.__pop_idle_processor(best_proc_name)
+
+    def __pop_idle_processor(self, proc_name):
+        # Remove processor from idle pool and record time/cost spent idle (platform lock must be held by caller)
+        proc, idle_runtime, idle_cost = self.idle_procs.pop(proc_name)
+        self.pool_idle_time += proc.get_runtime() - idle_runtime
+        self.pool_idle_cost += proc.compute_cost() - idle_cost
+        return proc
+
+    def __reap_idle_processors(self):
+        # Periodically destroy expired idle processors
+        while not self.__locked:
+            time.sleep(min(self.pool_ttl, 10))
+            self.__expire_idle_processors()
+
+    def __expire_idle_processors(self):
+        # Destroy processors/hosts that have been idle for longer than the pool's ttl
+        with self.platform_lock:
+            expired = [proc_name for proc_name, (proc, idle_runtime, idle_cost) in self.idle_procs.items()
+                       if proc.get_runtime() - idle_runtime >= self.pool_ttl]
+            expired = [self.__pop_idle_processor(proc_name) for proc_name in expired]
+
+            # Destroy hosts that haven't run any slices for too long
+            for host_name, host in list(self.hosts.items()):
+                if host.is_empty() and host.get_processor().get_runtime() - host.idle_runtime >= self.pool_ttl:
+                    expired.append(self.hosts.pop(host_name).get_processor())
+        for proc in expired:
+            self.__retire_processor(proc)
+
+    def __retire_processor(self, proc):
+        # Destroy idle processor and free up its resources
+        logging.info("Destroying idle processor '%s'..." % proc.get_name())
+        try:
+            proc.destroy(wait=False)
+            self.deallocate_resources(proc)
+        except BaseException as e:
+            logging.error("Unable to destroy idle processor '%s'!" % proc.get_name())
+            if str(e) != "":
+                logging.error("Received following error:\n%s" % e)
+            return
+
+        # Wait for processor to be destroyed in the background
+        threading.Thread(target=self.__wait_for_destroy, args=(proc,), daemon=True).start()
+
+    @staticmethod
+    def __wait_for_destroy(proc):
+        try:
+            proc.wait_process("destroy")
+        except BaseException as e:
+            logging.error("Unable to destroy idle processor '%s'!" % proc.get_name())
+            if str(e) != "":
+                logging.error("Received following error:\n%s" % e)
+
     def __check_resources(self):
         err = False
         if self.MAX_NR_CPUS > self.TOTAL_NR_CPUS:
@@ -231,6 +776,14 @@ class Platform(object, metaclass=abc.ABCMeta):
     def init_helper_processor(self, name, nr_cpus, mem, disk_space):
         pass
 
+    def init_host_processor(self, name, nr_cpus, mem, disk_space):
+        # Return a processor object that will be shared by several small tasks
+        return self.init_task_processor(name, nr_cpus, mem, disk_space)
+
+    def init_processor_slice(self, name, nr_cpus, mem, disk_space, **kwargs):
+        # Return a processor object running a task on part of a host processor
+        return ProcessorSlice(name, nr_cpus, mem, disk_space, **kwargs)
+
     @abc.abstractmethod
     def publish_report(self, report):
         pass
@@ -252,3 +805,21 @@ class Platform(object, metaclass=abc.ABCMeta):
     def standardize_dir(dir_path):
         # Makes directory names uniform to include a single '/' at the end
         return dir_path.rstrip("/") + "/"
+
+
+class HandoffFlushWorker(Thread):
+    # Thread uploading the output kept on a handed off processor and then freeing up the processor
+
+    def __init__(self, platform, task_id, processor, flush):
+        err_msg = "Unable to upload output handed off to task '%s' from processor '%s'" % (task_id, processor.get_name())
+        super(HandoffFlushWorker, self).__init__(err_msg)
+
+        self.platform   = platform
+        self.processor  = processor
+        self.flush      = flush
+
+    def work(self):
+        try:
+            self.flush()
+        finally:
+            self.platform.release_handoff_processor(self.processor)
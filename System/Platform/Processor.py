@@ -16,6 +16,9 @@ class Processor(object, metaclass=abc.ABCMeta):
 
     STATUSES    = ["OFF", "CREATING", "DESTROYING", "AVAILABLE"]
 
+    # Processes that set up the processor itself rather than run commands for a task
+    LIFECYCLE_PROCESSES = ["create", "start", "stop", "configureSSH", "restartSSH", "mountWorkspace", "watchPreemption"]
+
     def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
         self.name       = name
         self.nr_cpus    = nr_cpus
@@ -26,6 +29,10 @@ class Processor(object, metaclass=abc.ABCMeta):
         self.start_time = None
         self.stop_time  = None
 
+        # Time processor creation was requested and time it ran its first task command (for measuring boot latency)
+        self.create_time    = None
+        self.first_cmd_time = None
+
         # Get name of directory where logs will be written
         self.log_dir    = kwargs.pop("log_dir", None)
 
@@ -36,12 +43,22 @@ class Processor(object, metaclass=abc.ABCMeta):
         # Per hour price of processor
         self.price      = kwargs.pop("price",   0)
 
+        # Name of the module whose task is being executed by the processor (if any)
+        self.module_name    = None
+
+        # Size (GB) of the task's input stored in each storage location: location -> GB
+        self.input_locations = {}
+
         # Default number of times to retry commands if none specified at command runtime
         self.default_num_cmd_retries = kwargs.pop("cmd_retries", 3)
 
         # Ordered dictionary of processing being run by processor
         self.processes  = OrderedDict()
 
+        # Lock serializing changes to the processes as commands can be run and fail on several threads at once
+        # (e.g. parallel input transfers). Re-entrant as failure handling re-runs commands.
+        self.process_lock   = threading.RLock()
+
         # Setting the instance status
         self.status_lock    = threading.Lock()
         self.status         = Processor.OFF
@@ -67,6 +84,39 @@ class Processor(object, metaclass=abc.ABCMeta):
         if num_retries is None:
             num_retries = self.default_num_cmd_retries
 
+        # Generate command that will actually be run on the platform
+        original_cmd, cmd = self.generate_cmd(job_name, cmd, docker_image=docker_image)
+
+        # Run command using subprocess popen and add Popen object to self.processes
+        logging.info("(%s) Process '%s' started!" % (self.name, job_name))
+        logging.debug("(%s) Process '%s' has the following command:\n    %s" % (self.name, job_name, original_cmd))
+
+        # Generating process arguments
+        kwargs = dict()
+
+        # Process specific arguments
+        kwargs["cmd"] = original_cmd
+
+        # Popen specific arguments
+        kwargs["shell"] = True
+        kwargs["stdout"] = sp.PIPE
+        kwargs["stderr"] = sp.PIPE
+        kwargs["num_retries"] = num_retries
+        kwargs["docker_image"] = docker_image
+        kwargs["quiet_failure"] = quiet_failure
+        kwargs["close_fds"] = True
+
+        # Add process to list of processes
+        with self.process_lock:
+            self.processes[job_name] = Process(cmd, **kwargs)
+
+    def generate_cmd(self, job_name, cmd, docker_image=None):
+        # Return the command with logging pipes filled in (original command) and the command adapted to run on the processor
+
+        # Record when the processor runs its first command after being created
+        if self.create_time is not None and self.first_cmd_time is None and job_name not in self.LIFECYCLE_PROCESSES:
+            self.first_cmd_time = time.time()
+
         # Checking if logging is required
         if "!LOG" in cmd:
 
@@ -97,31 +147,13 @@ class Processor(object, metaclass=abc.ABCMeta):
         # Make any modifications to the command to allow it to be run on a specific platform
         cmd = self.adapt_cmd(cmd)
 
-        # Run command using subprocess popen and add Popen object to self.processes
-        logging.info("(%s) Process '%s' started!" % (self.name, job_name))
-        logging.debug("(%s) Process '%s' has the following command:\n    %s" % (self.name, job_name, original_cmd))
-
-        # Generating process arguments
-        kwargs = dict()
-
-        # Process specific arguments
-        kwargs["cmd"] = original_cmd
-
-        # Popen specific arguments
-        kwargs["shell"] = True
-        kwargs["stdout"] = sp.PIPE
-        kwargs["stderr"] = sp.PIPE
-        kwargs["num_retries"] = num_retries
-        kwargs["docker_image"] = docker_image
-        kwargs["quiet_failure"] = quiet_failure
-        kwargs["close_fds"] = True
-
-        # Add process to list of processes
-        self.processes[job_name] = Process(cmd, **kwargs)
+        return original_cmd, cmd
 
     def wait(self):
         # Returns when all currently running processes have completed
-        for proc_name, proc_obj in self.processes.items():
+        with self.process_lock:
+            proc_names = list(self.processes.keys())
+        for proc_name in proc_names:
             self.wait_process(proc_name)
 
     def lock(self):
@@ -144,6 +176,15 @@ class Processor(object, metaclass=abc.ABCMeta):
         #        logging.debug("Killing process: %s" % proc_name)
         #        proc_obj.stop()
 
+    def recycle(self):
+        # Forget the processes and checkpoints of the last task so processor can be reused by another task
+        with self.process_lock:
+            for proc_name in list(self.processes.keys()):
+                if proc_name not in self.LIFECYCLE_PROCESSES:
+                    self.processes.pop(proc_name)
+        self.checkpoints    = []
+        self.module_name    = None
+
     ############ Getters and Setters
     def set_status(self, new_status):
         # Updates instance status with threading.lock() to prevent race conditions
@@ -191,6 +232,15 @@ class Processor(object, metaclass=abc.ABCMeta):
     def get_name(self):
         return self.name
 
+    def get_wrk_dir(self):
+        return self.wrk_dir
+
+    def set_module_name(self, module_name):
+        self.module_name = module_name
+
+    def get_module_name(self):
+        return self.module_name
+
     def get_runtime(self):
 
         count = 0
@@ -224,6 +274,29 @@ class Processor(object, metaclass=abc.ABCMeta):
     def get_start_time(self):
         return self.start_time
 
+    def get_machine_family(self):
+        # Family of machines the processor runs on (None if platform doesn't offer different machine families)
+        return None
+
+    def set_input_locations(self, input_locations):
+        # Set where the input of the processor's next task is stored (used to place new processors near their input)
+        self.input_locations = dict(input_locations)
+
+    def get_input_egress(self, input_locations):
+        # Return (GB, cost) of transferring input from its storage locations to the processor
+        # Return None if the platform doesn't charge for transferring data between locations
+        return None
+
+    def set_create_time(self):
+        self.create_time    = time.time()
+        self.first_cmd_time = None
+
+    def get_boot_latency(self):
+        # Return seconds from requesting processor creation until it ran its first command (None if not known yet)
+        if self.create_time is None or self.first_cmd_time is None:
+            return None
+        return self.first_cmd_time - self.create_time
+
     def get_nr_cpus(self):
         return self.nr_cpus
 
@@ -0,0 +1,169 @@
+import logging
+import threading
+
+from System.Platform import Processor, ResourceLimiter
+
+class ProcessorHost(object):
+    # Keeps track of the cpus/mem/disk space of a shared host processor that are used by processor slices
+
+    def __init__(self, processor):
+
+        # Processor shared by the slices
+        self.processor = processor
+
+        # Host cpus, memory (GB), and disk space (GB) not used by any slice
+        self.free_cpus          = list(range(processor.get_nr_cpus()))
+        self.free_mem           = processor.get_mem()
+        self.free_disk_space    = processor.get_disk_space()
+
+        # Resources used by each slice: owner -> (cpus, mem, disk_space)
+        self.slots = {}
+
+        # Lock so only the first slice on the host creates the host processor
+        self.create_lock = threading.Lock()
+
+        # Host runtime when its last slice was released (None if host is running slices)
+        self.idle_runtime = None
+
+    def get_processor(self):
+        return self.processor
+
+    def can_fit(self, nr_cpus, mem, disk_space):
+        return nr_cpus <= len(self.free_cpus) and mem <= self.free_mem and disk_space <= self.free_disk_space
+
+    def allocate(self, owner, nr_cpus, mem, disk_space):
+        # Assign host resources to a slice and return the ids of the cpus assigned to the slice
+        cpus = self.free_cpus[0:nr_cpus]
+        self.free_cpus          = self.free_cpus[nr_cpus:]
+        self.free_mem           -= mem
+        self.free_disk_space    -= disk_space
+        self.slots[owner]       = (cpus, mem, disk_space)
+        self.idle_runtime       = None
+        return cpus
+
+    def release(self, owner):
+        # Free-up host resources used by a slice
+        if owner not in self.slots:
+            return
+        cpus, mem, disk_space = self.slots.pop(owner)
+        self.free_cpus          = sorted(self.free_cpus + cpus)
+        self.free_mem           += mem
+        self.free_disk_space    += disk_space
+
+        # Host is idle once it's running no more slices
+        if self.is_empty():
+            self.idle_runtime = self.processor.get_runtime()
+
+    def get_cpus(self, owner):
+        return self.slots[owner][0]
+
+    def is_empty(self):
+        return len(self.slots) == 0
+
+
+class ProcessorSlice(Processor):
+    # Processor running a single small task on a share of the cpus/mem of a larger host processor
+    # Commands are limited to the slice's cpus/mem and run through the host processor
+
+    def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
+
+        # Host processor and the ids of the host cpus the slice is allowed to use
+        self.host       = kwargs.pop("host")
+        self.host_lock  = kwargs.pop("host_lock")
+        cpus            = kwargs.pop("cpus")
+
+        # Call super constructor
+        super(ProcessorSlice, self).__init__(name, nr_cpus, mem, disk_space, **kwargs)
+
+        # Restricts slice commands to the slice's cpus/mem on the host
+        self.resource_limiter = ResourceLimiter(cpus, mem)
+
+    def create(self):
+
+        if self.is_locked():
+            logging.error("(%s) Failed to create processor. Processor locked!" % self.name)
+            raise RuntimeError("Cannot create processor while locked!")
+
+        # Create host if no other slice has created it yet
+        with self.host_lock:
+            if self.host.get_status() != Processor.AVAILABLE:
+                logging.info("(%s) Creating host processor '%s'..." % (self.name, self.host.get_name()))
+                self.host.create()
+
+        self.set_start_time()
+        self.set_status(Processor.AVAILABLE)
+        logging.info("(%s) Process 'create' complete!" % self.name)
+
+    def destroy(self, wait=True):
+
+        logging.info("(%s) Process 'destroy' started!" % self.name)
+
+        # Kill any of the slice's commands still running on the host
+        for job_name, host_job_name in self.processes.items():
+            host_proc = self.host.processes.get(host_job_name, None)
+            if host_proc is not None and not host_proc.is_complete() and host_proc.poll() is None:
+                logging.debug("(%s) Killing process: %s" % (self.name, job_name))
+                host_proc.stop()
+
+        # Remove slice workspace from host so its disk space can be used by other slices
+        self.processes["destroy"] = None
+        if self.host.get_status() == Processor.AVAILABLE and not self.host.is_locked():
+            self.processes["destroy"] = "destroy@%s" % self.name
+            self.host.run(job_name=self.processes["destroy"], cmd="sudo rm -rf %s" % self.wrk_dir, quiet_failure=True)
+
+        if wait:
+            self.wait_process("destroy")
+
+    def run(self, job_name, cmd, num_retries=None, docker_image=None, quiet_failure=False):
+
+        # Throw error if attempting to run command on stopped processor
+        if self.is_locked():
+            logging.error("(%s) Attempt to run process'%s' on locked processor!" % (self.name, job_name))
+            raise RuntimeError("Attempt to run command on locked processor!")
+
+        # Fill-in log files/docker workspace of the slice and limit command to the slice's cpus/mem
+        original_cmd, cmd = self.generate_cmd(job_name, cmd, docker_image=docker_image)
+
+        # Run command on host under a name that's unique across slices
+        self.processes[job_name] = "%s@%s" % (job_name, self.name)
+        self.host.run(job_name=self.processes[job_name],
+                      cmd=cmd,
+                      num_retries=num_retries,
+                      quiet_failure=quiet_failure)
+
+    def wait_process(self, proc_name):
+
+        # Case: Slice workspace removed
+        if proc_name == "destroy":
+            try:
+                if self.processes["destroy"] is not None:
+                    self.host.wait_process(self.processes["destroy"])
+            except BaseException as e:
+                logging.warning("(%s) Unable to remove workspace from host processor!" % self.name)
+                if str(e) != "":
+                    logging.debug("Received the following error:\n%s" % e)
+            if self.get_status() != Processor.OFF:
+                self.set_stop_time()
+            self.set_status(Processor.OFF)
+            return "", ""
+
+        return self.host.wait_process(self.processes[proc_name])
+
+    def adapt_cmd(self, cmd):
+        # Restrict command to the slice's cpus/mem on the host
+        return self.resource_limiter.limit_cmd(cmd)
+
+    def get_machine_family(self):
+        return self.host.get_machine_family()
+
+    def get_input_egress(self, input_locations):
+        return self.host.get_input_egress(input_locations)
+
+    def add_checkpoint(self, clear_output=True):
+        # Host replays all unfinished slice commands if it needs to be recreated so checkpoints aren't used
+        pass
+
+    def compute_cost(self):
+        # Slice pays for the share of the host's cpus it uses
+        host_nr_cpus = max(self.host.get_nr_cpus(), 1)
+        return self.host.price * self.get_runtime() * self.nr_cpus / host_nr_cpus / 3600
@@ -0,0 +1,50 @@
+import logging
+
+class ResourceLimiter(object):
+    # Class for restricting commands to a subset of the host's cpus and memory
+    # CPU limits are applied with CPU affinity (taskset) and memory limits with cgroups (systemd-run)
+    # Docker commands are limited through the equivalent 'docker run' options
+
+    def __init__(self, cpus, mem, use_cgroups=False):
+
+        # List of ids of the cpu cores commands are allowed to run on
+        self.cpus = cpus
+
+        # Max memory (GB) commands are allowed to use
+        self.mem = mem
+
+        # Whether to enforce limits through a transient cgroup (requires systemd)
+        self.use_cgroups = use_cgroups
+
+    def get_cpus(self):
+        return self.cpus
+
+    def get_mem(self):
+        return self.mem
+
+    def limit_cmd(self, cmd):
+        # Wrap a command so it can only use the allowed cpus and memory
+
+        # Limit docker containers through docker itself as containers aren't children of the calling process
+        if "docker run " in cmd:
+            return self.__limit_docker_cmd(cmd)
+
+        cpu_list = self.__get_cpu_list()
+        cmd = cmd.replace("'", "'\"'\"'")
+
+        if self.use_cgroups:
+            # Run command in transient cgroup limiting both cpus and memory
+            return "systemd-run --user --scope --quiet -p AllowedCPUs={0} -p MemoryMax={1}G " \
+                   "taskset -c {0} /bin/bash -c '{2}'".format(cpu_list, int(self.mem), cmd)
+
+        # Otherwise only pin command to allowed cpus
+        return "taskset -c {0} /bin/bash -c '{1}'".format(cpu_list, cmd)
+
+    def __limit_docker_cmd(self, cmd):
+        # Add resource limiting options to 'docker run' command
+        options = "--cpuset-cpus={0} --memory={1}g".format(self.__get_cpu_list(), int(self.mem))
+        logging.debug("Limiting docker container resources: %s" % options)
+        return cmd.replace("docker run ", "docker run %s " % options, 1)
+
+    def __get_cpu_list(self):
+        return ",".join([str(cpu) for cpu in self.cpus])
@@ -0,0 +1,191 @@
+import os
+import json
+import logging
+import random
+import threading
+from collections import OrderedDict
+
+from System.Platform import Platform
+from System.Platform.Simulated import VirtualClock, SimulatedProcessor, SimulatedProcessorSlice
+
+class SimulatedPlatform(Platform):
+    # Platform that simulates processors on a virtual clock instead of running any commands
+    # Used for measuring scheduler performance (makespan, utilization, cost) without paying for cloud resources
+
+    CONFIG_SPEC = "System/Platform/Simulated/SimulatedPlatform.validate"
+
+    # Number of parameters required by each type of distribution
+    DISTRIBUTION_PARAMS = {
+        "fixed"         : 1,    # value
+        "uniform"       : 2,    # low, high
+        "normal"        : 2,    # mean, standard deviation
+        "lognormal"     : 2,    # mu, sigma
+        "exponential"   : 1     # mean
+    }
+
+    def __init__(self, name, platform_config_file, final_output_dir):
+        # Call super constructor from Platform
+        super(SimulatedPlatform, self).__init__(name, platform_config_file, final_output_dir)
+
+        # Virtual clock shared by all simulated processors
+        self.clock = VirtualClock(settle_time=self.config["clock_settle_time"])
+
+        # Random number generator used for sampling runtimes
+        self.random         = random.Random(self.config["random_seed"])
+        self.random_lock    = threading.Lock()
+
+        # Per hour prices of resources
+        self.cpu_price      = self.config["cpu_price"]
+        self.mem_price      = self.config["mem_price"]
+        self.disk_price     = self.config["disk_price"]
+
+    def validate(self):
+        # Check that final output dir is a local directory where the report can be written
+        if ":" in self.final_output_dir:
+            logging.error("Invalid final output directory: %s. Simulated platform requires a local directory!"
+                          % self.final_output_dir)
+            raise IOError("Invalid final output directory!")
+
+        # Check that all distributions have the right number of parameters
+        err = False
+        for dist_section in ["runtime", "boot_time", "staging_time"]:
+            for module_name, dist in self.config[dist_section].items():
+                nr_params = self.DISTRIBUTION_PARAMS[dist["distribution"]]
+                if len(dist["params"]) != nr_params:
+                    logging.error("Simulated platform config error! The '%s' distribution of '%s' for '%s' requires "
+                                  "%d parameter(s)!" % (dist["distribution"], dist_section, module_name, nr_params))
+                    err = True
+        if err:
+            raise IOError("Invalid distribution declared in simulated platform config!")
+
+    def init_helper_processor(self, name, nr_cpus, mem, disk_space):
+        return SimulatedProcessor(name,
+                                  nr_cpus,
+                                  mem,
+                                  disk_space,
+                                  platform=self,
+                                  price=self.__get_price(nr_cpus, mem, disk_space))
+
+    def init_task_processor(self, name, nr_cpus, mem, disk_space):
+        return SimulatedProcessor(name,
+                                  nr_cpus,
+                                  mem,
+                                  disk_space,
+                                  platform=self,
+                                  price=self.__get_price(nr_cpus, mem, disk_space))
+
+    def init_processor_slice(self, name, nr_cpus, mem, disk_space, **kwargs):
+        return SimulatedProcessorSlice(name,
+                                       nr_cpus,
+                                       mem,
+                                       disk_space,
+                                       platform=self,
+                                       **kwargs)
+
+    def publish_report(self, report=None):
+
+        # Exit as nothing to output
+        if report is None:
+            return
+
+        # Add simulation results to report
+        report_data = report.to_dict()
+        report_data["simulation"] = self.get_simulation_summary()
+
+        # Log simulation results
+        summary = "\n".join(["\t%s: %s" % (key, val) for key, val in report_data["simulation"].items()])
+        logging.info("Simulation results:\n%s" % summary)
+
+        # Write report to final output dir
+        if not os.path.exists(self.final_output_dir):
+            os.makedirs(self.final_output_dir)
+        report_path = os.path.join(self.final_output_dir, "%s_final_report.json" % self.name)
+        with open(report_path, "w") as report_file:
+            json.dump(report_data, report_file, indent=4)
+
+    def clean_up(self):
+        # Destroy any processors that haven't been destroyed
+        for proc_name, proc in self.processors.items():
+            if proc_name not in self.dealloc_procs:
+                proc.destroy(wait=False)
+
+    def get_time(self):
+        # Simulated processors run on the virtual clock
+        return self.clock.time()
+
+    def get_simulation_summary(self):
+        # Summarize makespan, utilization and cost of the simulated run
+        makespan        = self.clock.time()
+        cpu_hours       = 0
+        busy_cpu_hours  = 0
+        cost            = 0
+        nr_preemptions  = 0
+        for proc in self.processors.values():
+            cpu_hours       += proc.get_nr_cpus() * proc.get_runtime() / 3600.0
+            busy_cpu_hours  += proc.get_nr_cpus() * proc.get_busy_time() / 3600.0
+            cost            += proc.compute_cost()
+            nr_preemptions  += proc.get_nr_preemptions()
+
+        # Work done on slices of shared host processors (host cpu hours/cost are already counted above)
+        for proc_slice in self.slices.values():
+            busy_cpu_hours  += proc_slice.get_nr_cpus() * proc_slice.get_busy_time() / 3600.0
+            nr_preemptions  += proc_slice.get_nr_preemptions()
+
+        summary = OrderedDict()
+        summary["makespan(sec)"]            = makespan
+        summary["nr_processors"]            = len(self.processors)
+        summary["cpu_hours"]                = cpu_hours
+        summary["busy_cpu_hours"]           = busy_cpu_hours
+        summary["cpu_utilization"]          = busy_cpu_hours / cpu_hours if cpu_hours > 0 else 0
+        summary["platform_cpu_utilization"] = busy_cpu_hours / (self.TOTAL_NR_CPUS * makespan / 3600.0) if makespan > 0 else 0
+        summary["cost"]                     = cost
+        summary["nr_preemptions"]           = nr_preemptions
+        return summary
+
+    def sample_runtime(self, module_name):
+        # Virtual seconds needed to run one module command
+        return self.__sample("runtime", module_name)
+
+    def sample_boot_time(self, module_name):
+        # Virtual seconds needed to create a processor
+        return self.__sample("boot_time", module_name)
+
+    def sample_staging_time(self, module_name):
+        # Virtual seconds needed to run a platform command (file transfers, mkdir, etc.)
+        return self.__sample("staging_time", module_name)
+
+    def sample_time_to_preemption(self, module_name):
+        # Virtual seconds until processor is preempted (None if processor can't be preempted)
+        rates = self.config["preemption_rate"]
+        rate = rates[module_name] if module_name in rates else rates["default"]
+        if rate <= 0:
+            return None
+        with self.random_lock:
+            # Rate is expressed as expected preemptions per processor-hour
+            return self.random.expovariate(rate / 3600.0)
+
+    ####### PRIVATE UTILITY METHODS
+
+    def __sample(self, dist_section, module_name):
+        # Draw a sample from the distribution declared for a module (or the default distribution)
+        dists = self.config[dist_section]
+        dist = dists[module_name] if module_name in dists else dists["default"]
+        dist_type, params = dist["distribution"], dist["params"]
+
+        with self.random_lock:
+            if dist_type == "fixed":
+                value = params[0]
+            elif dist_type == "uniform":
+                value = self.random.uniform(params[0], params[1])
+            elif dist_type == "normal":
+                value = self.random.gauss(params[0], params[1])
+            elif dist_type == "lognormal":
+                value = self.random.lognormvariate(params[0], params[1])
+            else:
+                value = self.random.expovariate(1.0 / params[0]) if params[0] > 0 else 0
+
+        return max(value, 0)
+
+    def __get_price(self, nr_cpus, mem, disk_space):
+        # Per hour price of a processor
+        return nr_cpus * self.cpu_price + mem * self.mem_price + disk_space * self.disk_price
@@ -0,0 +1,221 @@
+import logging
+
+from System.Platform import Processor
+
+class SimulatedProcess(object):
+    # Stand-in for a subprocess. Records a command without executing it.
+    def __init__(self, cmd, num_retries=0, docker_image=None, quiet_failure=False):
+        self.command        = cmd
+        self.num_retries    = num_retries
+        self.docker_image   = docker_image
+        self.quiet          = quiet_failure
+        self.complete       = False
+        self.stopped        = False
+        self.out            = ""
+        self.err            = ""
+
+    def is_complete(self):
+        return self.complete
+
+    def set_complete(self):
+        self.complete = True
+
+    def has_failed(self):
+        return False
+
+    def get_command(self):
+        return self.command
+
+    def get_num_retries(self):
+        return self.num_retries
+
+    def get_docker_image(self):
+        return self.docker_image
+
+    def get_output(self):
+        return self.out, self.err
+
+    def is_quiet(self):
+        return self.quiet
+
+    def stop(self):
+        self.stopped = True
+
+    def is_stopped(self):
+        return self.stopped
+
+
+class SimulatedProcessor(Processor):
+
+    # Job name prefixes of platform commands used for staging files and setting up workspaces
+    # Every other command is treated as a module command and takes a simulated module runtime
+    SYSTEM_JOB_PREFIXES = ["load_input_", "save_output_", "get_size_", "mkdir_", "grant_", "docker_pull_",
+                           "pull_", "return_logs", "mv_", "rm_", "check_exists_",
+                           "mount_", "unmount_"]
+
+    def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
+
+        # Simulated platform providing the virtual clock and runtime distributions
+        self.platform   = kwargs.pop("platform")
+        self.clock      = self.platform.clock
+
+        # Call super constructor
+        super(SimulatedProcessor, self).__init__(name, nr_cpus, mem, disk_space, **kwargs)
+
+        # Virtual seconds spent doing useful work (module commands that weren't preempted)
+        self.busy_time = 0
+
+        # Number of times processor was preempted
+        self.nr_preemptions = 0
+
+    def create(self):
+
+        if self.is_locked():
+            logging.error("(%s) Failed to create processor. Processor locked!" % self.name)
+            raise RuntimeError("Cannot create processor while locked!")
+
+        # Wait for processor to boot
+        logging.info("(%s) Process 'create' started!" % self.name)
+        self.processes["create"] = SimulatedProcess("create")
+        self.clock.sleep(self.platform.sample_boot_time(self.module_name))
+        self.processes["create"].set_complete()
+
+        self.set_start_time()
+        self.set_status(Processor.AVAILABLE)
+
+    def destroy(self, wait=True):
+        logging.info("(%s) Process 'destroy' started!" % self.name)
+        self.processes["destroy"] = SimulatedProcess("destroy")
+        self.processes["destroy"].set_complete()
+
+        # Only register stop time the first time processor is destroyed
+        if self.get_status() != Processor.OFF:
+            self.set_stop_time()
+        self.set_status(Processor.OFF)
+
+    def run(self, job_name, cmd, num_retries=None, docker_image=None, quiet_failure=False):
+
+        # Throw error if attempting to run command on stopped processor
+        if self.is_locked():
+            logging.error("(%s) Attempt to run process'%s' on locked processor!" % (self.name, job_name))
+            raise RuntimeError("Attempt to run command on locked processor!")
+
+        if num_retries is None:
+            num_retries = self.default_num_cmd_retries
+
+        # Record command without running it
+        logging.info("(%s) Process '%s' started!" % (self.name, job_name))
+        logging.debug("(%s) Process '%s' has the following command:\n    %s" % (self.name, job_name, cmd))
+        self.processes[job_name] = SimulatedProcess(cmd,
+                                                    num_retries=num_retries,
+                                                    docker_image=docker_image,
+                                                    quiet_failure=quiet_failure)
+
+    def wait_process(self, proc_name):
+        # Get process from process list
+        proc_obj = self.processes[proc_name]
+
+        # Return immediately if process has already been set to complete
+        if proc_obj.is_complete():
+            return proc_obj.get_output()
+
+        # Let virtual time pass while the command 'runs'
+        if self.__is_module_cmd(proc_name):
+            self.__simulate_module_cmd(proc_name)
+        else:
+            self.clock.sleep(self.platform.sample_staging_time(self.module_name))
+
+        # Fail process if processor was stopped while process was running
+        if self.is_locked() and proc_name != "destroy":
+            proc_obj.stop()
+            logging.warning("(%s) Process '%s' failed due to cancellation!" % (self.name, proc_name))
+            raise RuntimeError("Instance %s has failed!" % self.name)
+
+        proc_obj.set_complete()
+        logging.info("(%s) Process '%s' complete!" % (self.name, proc_name))
+        return proc_obj.get_output()
+
+    def adapt_cmd(self, cmd):
+        # Commands are never executed so they don't need to be adapted
+        return cmd
+
+    def set_start_time(self):
+        self.start_time = self.clock.time()
+
+    def set_stop_time(self):
+        self.stop_time = self.clock.time()
+
+    def get_runtime(self):
+        # Return 0 if processor hasn't started yet
+        if self.start_time is None:
+            return 0
+
+        # Processor is still running
+        if self.stop_time is None or self.stop_time < self.start_time:
+            return self.clock.time() - self.start_time
+
+        return self.stop_time - self.start_time
+
+    def get_busy_time(self):
+        return self.busy_time
+
+    def get_nr_preemptions(self):
+        return self.nr_preemptions
+
+    def __is_module_cmd(self, proc_name):
+        for prefix in self.SYSTEM_JOB_PREFIXES:
+            if proc_name.startswith(prefix):
+                return False
+        return True
+
+    def __simulate_module_cmd(self, proc_name):
+        # Run command until it completes without being preempted
+        while not self.is_locked():
+
+            runtime = self.platform.sample_runtime(self.module_name)
+            time_to_preemption = self.platform.sample_time_to_preemption(self.module_name)
+
+            # Command finishes before processor is preempted
+            if time_to_preemption is None or time_to_preemption >= runtime:
+                self.clock.sleep(runtime)
+                self.busy_time += runtime
+                return
+
+            # Processor is preempted so work is lost and command is restarted after processor reboots
+            self.clock.sleep(time_to_preemption)
+            self.nr_preemptions += 1
+            logging.warning("(%s) Processor preempted while running process '%s'! Restarting process." % (self.name, proc_name))
+            self.clock.sleep(self.platform.sample_boot_time(self.module_name))
+
+
+class SimulatedProcessorSlice(SimulatedProcessor):
+    # Simulated processor running a task on a share of the cpus/mem of a simulated host processor
+
+    def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
+
+        # Host processor shared by the slices
+        self.host       = kwargs.pop("host")
+        self.host_lock  = kwargs.pop("host_lock")
+        kwargs.pop("cpus")
+
+        # Call super constructor
+        super(SimulatedProcessorSlice, self).__init__(name, nr_cpus, mem, disk_space, **kwargs)
+
+    def create(self):
+
+        if self.is_locked():
+            logging.error("(%s) Failed to create processor. Processor locked!" % self.name)
+            raise RuntimeError("Cannot create processor while locked!")
+
+        # Wait for host to boot if no other slice has created it yet
+        with self.host_lock:
+            if self.host.get_status() != Processor.AVAILABLE:
+                self.host.create()
+
+        self.set_start_time()
+        self.set_status(Processor.AVAILABLE)
+
+    def compute_cost(self):
+        # Slice pays for the share of the host's cpus it uses
+        host_nr_cpus = max(self.host.get_nr_cpus(), 1)
+        return self.host.price * self.get_runtime() * self.nr_cpus / host_nr_cpus / 3600
@@ -0,0 +1,68 @@
+import heapq
+import itertools
+import threading
+import time
+
+class VirtualClock(object):
+    # Simulated clock shared by all simulated processors
+    # Threads block in sleep() until the virtual time they asked for is reached.
+    # Virtual time only advances once the system has been quiet (no thread has started or finished a sleep)
+    # for 'settle_time' real seconds, so all threads get a chance to react to the previous event first.
+
+    def __init__(self, settle_time=0.05):
+
+        # Current virtual time (seconds since start of simulation)
+        self.now = 0.0
+
+        # Real seconds of inactivity needed before the clock advances to the next wake-up time
+        self.settle_time = settle_time
+
+        # Heap of (wake-up time, sequence nr) for all sleeping threads
+        self.sleepers = []
+        self.seq = itertools.count()
+
+        # Real time of the last sleep/wake-up event
+        self.last_activity = time.time()
+
+        # Condition used to block sleeping threads and the clock driver
+        self.cond = threading.Condition()
+
+        # Start thread that advances virtual time
+        self.driver = threading.Thread(target=self.__drive)
+        self.driver.daemon = True
+        self.driver.start()
+
+    def time(self):
+        with self.cond:
+            return self.now
+
+    def sleep(self, seconds):
+        # Block current thread for a given number of virtual seconds
+        with self.cond:
+            wake_time = self.now + max(seconds, 0)
+            heapq.heappush(self.sleepers, (wake_time, next(self.seq)))
+            self.last_activity = time.time()
+            self.cond.notify_all()
+
+            while self.now < wake_time:
+                self.cond.wait()
+
+            self.last_activity = time.time()
+
+    def __drive(self):
+        # Advance virtual time to the next wake-up time whenever the system is quiet
+        with self.cond:
+            while True:
+                self.cond.wait(self.settle_time)
+
+                # Nothing to do if nobody is waiting or the last event was too recent
+                if len(self.sleepers) == 0 or time.time() - self.last_activity < self.settle_time:
+                    continue
+
+                # Jump to earliest wake-up time and remove every sleeper due by then
+                self.now = max(self.now, self.sleepers[0][0])
+                while len(self.sleepers) > 0 and self.sleepers[0][0] <= self.now:
+                    heapq.heappop(self.sleepers)
+
+                self.last_activity = time.time()
+                self.cond.notify_all()
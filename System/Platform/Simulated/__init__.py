@@ -0,0 +1,3 @@
+from .VirtualClock import VirtualClock
+from .SimulatedProcessor import SimulatedProcessor, SimulatedProcess, SimulatedProcessorSlice
+from .SimulatedPlatform import SimulatedPlatform
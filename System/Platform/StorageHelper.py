@@ -1,4 +1,8 @@
+import os
+import base64
+import hashlib
 import logging
+from collections import OrderedDict
 
 from System.Platform import Platform
 
@@ -8,9 +12,22 @@ class InvalidStorageTypeError(Exception):
 class StorageHelper(object):
     # Class designed to facilitate remote file manipulations for a processor
 
-    def __init__(self, proc):
+    # Default directory on the processor where manifests of batch transfers are written
+    # Processors running tasks keep manifests in the task workspace instead, as /tmp doesn't survive a restart
+    MANIFEST_DIR = "/tmp"
+
+    # Maximum size (bytes) of a manifest file written by a single command
+    MANIFEST_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, proc, manifest_dir=None):
         self.proc = proc
 
+        # Directory on the processor where manifests of batch transfers are written
+        self.manifest_dir = self.MANIFEST_DIR if manifest_dir is None else manifest_dir
+
+        # Location of each storage container (e.g. bucket) already looked up: container -> location
+        self.locations = {}
+
     def mv(self, src_path, dest_path, job_name=None, log=True, wait=False, **kwargs):
         # Transfer file or dir from src_path to dest_path
         # Log the transfer unless otherwise specified
@@ -28,6 +45,85 @@ class StorageHelper(object):
             self.proc.wait_process(job_name)
         return job_name
 
+    def mv_batch(self, transfers, job_name=None, log=True, wait=False, **kwargs):
+        # Transfer a list of (src_path, dest_path) pairs with a single command on the processor
+        # Files going to the same destination are transferred together from a manifest of src paths
+        # written to the processor, so the command size doesn't grow with the number of files
+        dest_srcs = OrderedDict()
+        for src_path, dest_path in transfers:
+            cmd_generator = StorageHelper.__get_storage_cmd_generator(src_path, dest_path)
+            if (cmd_generator, dest_path) not in dest_srcs:
+                dest_srcs[(cmd_generator, dest_path)] = []
+            dest_srcs[(cmd_generator, dest_path)].append(src_path)
+
+        job_name = "mv_batch_%s" % Platform.generate_unique_id() if job_name is None else job_name
+
+        # Chain transfers to each destination so the first failure fails the whole batch
+        cmds = []
+        for i, ((cmd_generator, dest_path), src_paths) in enumerate(dest_srcs.items()):
+            # Local copies rely on the shell to expand wildcard paths (e.g. prefix files) so they can't be read from a manifest
+            if cmd_generator is LocalStorageCmdGenerator:
+                cmds.extend([cmd_generator.mv(src_path, dest_path) for src_path in src_paths if "*" in src_path])
+                src_paths = [src_path for src_path in src_paths if "*" not in src_path]
+
+            # Single file is transferred directly
+            if len(src_paths) == 0:
+                continue
+            elif len(src_paths) == 1:
+                cmds.append(cmd_generator.mv(src_paths[0], dest_path))
+                continue
+
+            manifest_prefix = os.path.join(self.manifest_dir, "%s_%s_%d.manifest" % (job_name, Platform.generate_unique_id(), i))
+            manifest_cmd, manifest_files = self.__write_manifest(src_paths, manifest_prefix, job_name)
+
+            # Manifests written by earlier commands must all still be there, as reading from a pipe
+            # would otherwise transfer only the files listed in the remaining manifests without failing
+            check_cmd = " && ".join(["[ -s %s ]" % manifest_file for manifest_file in manifest_files])
+            cmds.append("%s && %s && %s && sudo rm -f %s" % (manifest_cmd,
+                                                             check_cmd,
+                                                             cmd_generator.mv_batch(manifest_files, dest_path),
+                                                             " ".join(manifest_files)))
+        cmd = "( %s )" % " && ".join(["( %s )" % cmd for cmd in cmds])
+
+        # Optionally add logging
+        cmd = "%s !LOG3!" % cmd if log else cmd
+
+        # Run command and return job name
+        self.proc.run(job_name, cmd, **kwargs)
+        if wait:
+            self.proc.wait_process(job_name)
+        return job_name
+
+    def __write_manifest(self, src_paths, manifest_prefix, job_name):
+        # Write src paths (one per line) to manifest files on the processor
+        # Paths are split across files of at most MANIFEST_CHUNK_SIZE bytes so no single command gets too large
+        # Every file except the last is written by a separate command
+        # Returns the command writing the last file and the list of all manifest files
+        chunks = [[]]
+        chunk_size = 0
+        for src_path in src_paths:
+            if chunk_size + len(src_path) + 1 > self.MANIFEST_CHUNK_SIZE and len(chunks[-1]) > 0:
+                chunks.append([])
+                chunk_size = 0
+            chunks[-1].append(src_path)
+            chunk_size += len(src_path) + 1
+
+        # Paths are base64 encoded so they reach the processor unchanged (e.g. spaces or wildcards)
+        manifest_files = []
+        write_cmd = None
+        for i, chunk in enumerate(chunks):
+            manifest_file = "%s.%d" % (manifest_prefix, i)
+            manifest_files.append(manifest_file)
+            encoded = base64.b64encode(("%s\n" % "\n".join(chunk)).encode("utf8")).decode("utf8")
+            write_cmd = "sudo mkdir -p %s && echo %s | base64 -d | sudo tee %s > /dev/null" % (
+                os.path.dirname(manifest_file), encoded, manifest_file)
+            if i < len(chunks) - 1:
+                chunk_job_name = "%s_manifest_%d" % (job_name, i)
+                self.proc.run(chunk_job_name, write_cmd)
+                self.proc.wait_process(chunk_job_name)
+
+        return write_cmd, manifest_files
+
     def mkdir(self, dir_path, job_name=None, log=False, wait=False, **kwargs):
         # Makes a directory if it doesn't already exists
         cmd_generator = StorageHelper.__get_storage_cmd_generator(dir_path)
@@ -44,6 +140,31 @@ class StorageHelper(object):
             self.proc.wait_process(job_name)
         return job_name
 
+    def mount(self, path, mount_dir, job_name=None, wait=False, **kwargs):
+        # Mount remote storage location as a read-only directory on the processor
+        cmd_generator = StorageHelper.__get_storage_cmd_generator(path)
+        cmd = cmd_generator.mount(path, mount_dir)
+
+        job_name = "mount_%s" % Platform.generate_unique_id() if job_name is None else job_name
+
+        # Run command and return job name
+        self.proc.run(job_name, cmd, **kwargs)
+        if wait:
+            self.proc.wait_process(job_name)
+        return job_name
+
+    def unmount(self, mount_dir, job_name=None, wait=False, **kwargs):
+        # Unmount a directory mounted with mount()
+        cmd = LocalStorageCmdGenerator.unmount(mount_dir)
+
+        job_name = "unmount_%s" % Platform.generate_unique_id() if job_name is None else job_name
+
+        # Run command and return job name
+        self.proc.run(job_name, cmd, **kwargs)
+        if wait:
+            self.proc.wait_process(job_name)
+        return job_name
+
     def path_exists(self, path, job_name=None, **kwargs):
         # Return true if file exists, false otherwise
         cmd_generator = StorageHelper.__get_storage_cmd_generator(path)
@@ -51,7 +172,7 @@ class StorageHelper(object):
 
         # Run command and return job name
         job_name = "check_exists_%s" % Platform.generate_unique_id() if job_name is None else job_name
-        self.proc.run(job_name, cmd, quiet_failure=False, **kwargs)
+        self.proc.run(job_name, cmd, quiet_failure=kwargs.pop("quiet_failure", False), **kwargs)
 
         # Wait for cmd to finish and get output
         try:
@@ -89,6 +210,82 @@ class StorageHelper(object):
                 logging.error("Received the following msg:\n%s" % e)
             raise
 
+    def get_location(self, path, job_name=None, **kwargs):
+        # Return location of the storage container (e.g. bucket) holding a path
+        # Return None for local paths or if the location can't be determined
+        cmd_generator = StorageHelper.__get_storage_cmd_generator(path)
+        container = "/".join(path.split("/")[0:3])
+        if container in self.locations:
+            return self.locations[container]
+
+        cmd = cmd_generator.location(path)
+        if cmd is None:
+            return None
+
+        # Run command and return job name
+        job_name = "get_location_%s" % Platform.generate_unique_id() if job_name is None else job_name
+        self.proc.run(job_name, cmd, quiet_failure=True, **kwargs)
+
+        # Wait for cmd to finish and get output
+        try:
+            out, err = self.proc.wait_process(job_name)
+            location = out.strip().split()[-1].upper() if out.strip() != "" else None
+
+        except BaseException as e:
+            # Location is only used for placing processors so missing permissions to read it aren't fatal
+            logging.warning("Unable to determine storage location of %s!" % path)
+            if str(e) != "":
+                logging.debug("Received the following msg:\n%s" % e)
+            location = None
+
+        self.locations[container] = location
+        return location
+
+    def get_checksum(self, path, job_name=None, **kwargs):
+        # Return checksum of the contents of a file, a set of files sharing a prefix, or a directory
+        cmd_generator = StorageHelper.__get_storage_cmd_generator(path)
+        cmd = cmd_generator.checksum(path)
+
+        # Run command and return job name
+        job_name = "checksum_%s" % Platform.generate_unique_id() if job_name is None else job_name
+        self.proc.run(job_name, cmd, **kwargs)
+
+        # Wait for cmd to finish and get output
+        try:
+            # Output lists a checksum for each file so combine them into a single checksum
+            out, err = self.proc.wait_process(job_name)
+            return hashlib.sha256(out.encode("utf8")).hexdigest()
+
+        except BaseException as e:
+            logging.error("Unable to get checksum: %s" % path)
+            if str(e) != "":
+                logging.error("Received the following msg:\n%s" % e)
+            raise
+
+    def read_file(self, path, job_name=None, **kwargs):
+        # Return contents of a text file
+        cmd_generator = StorageHelper.__get_storage_cmd_generator(path)
+        cmd = cmd_generator.cat(path)
+
+        # Run command and wait for output
+        job_name = "read_%s" % Platform.generate_unique_id() if job_name is None else job_name
+        self.proc.run(job_name, cmd, **kwargs)
+        out, err = self.proc.wait_process(job_name)
+        return out
+
+    def write_file(self, path, contents, job_name=None, **kwargs):
+        # Write contents to a text file
+        # Contents are base64 encoded so they can be passed through the shell as they are
+        cmd_generator = StorageHelper.__get_storage_cmd_generator(path)
+        encoded = base64.b64encode(contents.encode("utf8")).decode("utf8")
+        cmd = "echo %s | base64 -d | %s" % (encoded, cmd_generator.write_stdin(path))
+
+        # Run command and wait for it to finish
+        job_name = "write_%s" % Platform.generate_unique_id() if job_name is None else job_name
+        self.proc.run(job_name, cmd, **kwargs)
+        self.proc.wait_process(job_name)
+        return job_name
+
     def rm(self, path, job_name=None, log=True, wait=False, **kwargs):
         # Delete file from file system
         # Log the transfer unless otherwise specified
@@ -159,8 +356,16 @@ class LocalStorageCmdGenerator(StorageCmdGenerator):
 
     @staticmethod
     def mv(src_path, dest_dir):
-        # Move a file from one directory to another
-        return "sudo mv %s %s" % (src_path, dest_dir)
+        # Transfer a file from one directory to another
+        # Files are cloned (copy-on-write) where the filesystem supports it and copied otherwise.
+        # Hardlinks aren't used as permission changes and in-place edits of the copy would alter the source file.
+        return "sudo cp -rf --reflink=auto %s %s" % (src_path, dest_dir)
+
+    @staticmethod
+    def mv_batch(manifest_files, dest_dir):
+        # Transfer the files listed in manifests (one path per line) to the same directory
+        # xargs splits the paths across as few copies as the argument size limit allows
+        return "cat %s | xargs -d '\\n' sudo cp -rf --reflink=auto -t %s" % (" ".join(manifest_files), dest_dir)
 
     @staticmethod
     def mkdir(dir_path):
@@ -172,10 +377,34 @@ class LocalStorageCmdGenerator(StorageCmdGenerator):
         # Return cmd for getting file size in bytes
         return "sudo du -sh --apparent-size --bytes %s" % path
 
+    @staticmethod
+    def unmount(mount_dir):
+        # Lazy unmount so directory is released even if a process still has files open
+        return "sudo umount -l %s" % mount_dir
+
     @staticmethod
     def ls(path):
         return "sudo ls %s" % path
 
+    @staticmethod
+    def location(path):
+        # Local files aren't stored in a cloud location
+        return None
+
+    @staticmethod
+    def checksum(path):
+        # Return cmd for getting the md5 checksum of every file under the path
+        return "sudo find %s -type f -exec md5sum {} + | sort -k 2" % path
+
+    @staticmethod
+    def cat(path):
+        return "sudo cat %s" % path
+
+    @staticmethod
+    def write_stdin(path):
+        # Return cmd for writing stdin to a file
+        return "sudo tee %s > /dev/null" % path
+
     @staticmethod
     def rm(path):
         # Dear god do not give sudo privileges to this command
@@ -192,6 +421,19 @@ class GoogleStorageCmdGenerator(StorageCmdGenerator):
         options_fast = '-m -o "GSUtil:sliced_object_download_max_components=200"'
         return "sudo gsutil %s cp -r %s %s" % (options_fast, src_path, dest_dir)
 
+    @staticmethod
+    def mv_batch(manifest_files, dest_dir):
+        # Transfer the files listed in manifests (one path per line) to the same directory
+        # with a single gsutil process reading the src paths from stdin
+        options_fast = '-m -o "GSUtil:sliced_object_download_max_components=200"'
+        return "cat %s | sudo gsutil %s cp -r -I %s" % (" ".join(manifest_files), options_fast, dest_dir)
+
+    @staticmethod
+    def mount(path, mount_dir):
+        # Mount the bucket read-only with gcsfuse so objects can be read without downloading them first
+        bucket = path.split("/")[2]
+        return "sudo mkdir -p %s && sudo gcsfuse --implicit-dirs -o ro -o allow_other %s %s" % (mount_dir, bucket, mount_dir)
+
     @staticmethod
     def mkdir(dir_path):
         # Makes a directory if it doesn't already exists
@@ -206,6 +448,26 @@ class GoogleStorageCmdGenerator(StorageCmdGenerator):
     def ls(path):
         return "gsutil ls %s" % path
 
+    @staticmethod
+    def location(path):
+        # Return cmd for getting the location of the bucket holding a path
+        bucket = "/".join(path.split("/")[0:3])
+        return 'gsutil ls -L -b %s | grep "Location constraint"' % bucket
+
+    @staticmethod
+    def checksum(path):
+        # Return cmd for getting the crc32c checksum stored with every object under the path (objects aren't downloaded)
+        return 'gsutil ls -L -r %s | grep -E "^gs://|Hash \\(crc32c\\)"' % path
+
+    @staticmethod
+    def cat(path):
+        return "gsutil cat %s" % path
+
+    @staticmethod
+    def write_stdin(path):
+        # Return cmd for writing stdin to an object
+        return "gsutil cp - %s" % path
+
     @staticmethod
     def rm(path):
         return "gsutil rm -r %s" % path
@@ -1,6 +1,7 @@
 from .Process import Process
 from .Processor import Processor
+from .ResourceLimiter import ResourceLimiter
+from .ProcessorSlice import ProcessorSlice, ProcessorHost
 from .Platform import Platform
 from .StorageHelper import StorageHelper
 from .DockerHelper import DockerHelper
-
@@ -45,11 +45,12 @@ class InputValidator(Validator):
             for input_file in inputs[input_file_src]:
                 input_desc = self.__get_input_desc(input_file, input_source=input_file_src)
 
-                logging.info("Input: %s.\nvalidated: %s\nvalidation_failed: %s\nmissing: %s\nsize: %sGB\n\n" % (input_desc,
+                logging.info("Input: %s.\nvalidated: %s\nvalidation_failed: %s\nmissing: %s\nsize: %sGB\nlocation: %s\n\n" % (input_desc,
                                                                                              input_file.is_flagged("validated"),
                                                                                              input_file.is_flagged("validation_failed"),
                                                                                              input_file.is_flagged("missing"),
-                                                                                             input_file.get_size()))
+                                                                                             input_file.get_size(),
+                                                                                             input_file.get_location() if isinstance(input_file, GAPFile) else None))
 
                 # Only report on files that were actually validated
                 # Some may not have been validated if thread pool closed due to terminal error
@@ -168,6 +169,10 @@ class InputWorker(PoolWorker):
             file_size = self.storage_helper.get_file_size(input_obj.get_transferrable_path(), job_name=job_name)
             input_obj.set_size(file_size)
 
+            # Get/set location of the storage holding the file so processors can be placed near their input
+            job_name = "get_location_%s" % input_obj.get_file_id()
+            input_obj.set_location(self.storage_helper.get_location(input_obj.get_transferrable_path(), job_name=job_name))
+
     def validate_docker_image(self, docker_obj):
         # Check whether Docker image exists
         image_name = docker_obj.get_image_name()
@@ -181,3 +186,8 @@ class InputWorker(PoolWorker):
             job_name = "get_size_%s" % docker_obj.get_ID()
             image_size = self.docker_helper.get_image_size(image_name, job_name=job_name)
             docker_obj.set_size(image_size)
+
+            # Get/set id of image content so task cache can tell when the image behind a tag changes
+            job_name = "get_digest_%s" % docker_obj.get_ID()
+            image_digest = self.docker_helper.get_image_digest(image_name, job_name=job_name)
+            docker_obj.set_digest(image_digest)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+# Measures the time spent splitting a scatter/gather graph over samples and then over intervals of each sample
+# The graph is run twice: first re-validating the entire graph after every split (full_validation=True),
+# then only validating the subgraph altered by each split
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from collections import deque
+
+BENCH_DIR   = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR    = os.path.dirname(BENCH_DIR)
+
+# Config specs are resolved relative to the repository root and modules are imported as done by CloudConductor
+os.chdir(REPO_DIR)
+sys.path.insert(0, REPO_DIR)
+for module_dir in ["Modules/Tools/", "Modules/Splitters/", "Modules/Mergers/"]:
+    sys.path.insert(1, os.path.join(REPO_DIR, module_dir))
+
+from System.Graph import Graph
+
+# Sample scatter wrapping an interval scatter, each closed by its own merger
+GRAPH_CONFIG = """
+[split_samples]
+module      = SampleSplitter
+
+[bqsr]
+module      = Utils
+submodule   = BGZipVCF
+input_from  = split_samples
+
+[split_intervals]
+module      = IntervalSplitter
+input_from  = bqsr
+
+[hc]
+module      = Utils
+submodule   = BGZipVCF
+input_from  = split_intervals
+
+[merge_intervals]
+module      = VCFMergers
+submodule   = VCFMerger
+input_from  = hc
+
+[merge_samples]
+module      = VCFMergers
+submodule   = VCFMerger
+input_from  = merge_intervals
+"""
+
+def configure_argparser(argparser_obj):
+
+    argparser_obj.add_argument("-s", "--samples",
+                               action="store",
+                               type=int,
+                               dest="nr_samples",
+                               default=100,
+                               help="Number of splits created by the sample splitter.")
+
+    argparser_obj.add_argument("-i", "--intervals",
+                               action="store",
+                               type=int,
+                               dest="nr_intervals",
+                               default=50,
+                               help="Number of splits created by each interval splitter.")
+
+def run_graph(graph_file, full_validation, nr_samples, nr_intervals):
+    # Complete every task in the order the scheduler would and return the total time spent in split_graph
+    graph = Graph(graph_file, full_validation=full_validation)
+    ready = deque([task_id for task_id in graph.get_tasks() if graph.parents_complete(task_id)])
+
+    split_time = 0
+    while len(ready) > 0:
+        task_id = ready.popleft()
+        task = graph.get_tasks(task_id)
+
+        if task.is_splitter_task():
+            # Sample splitter is split by sample, each split of the interval splitter by interval
+            nr_splits = nr_samples if task_id == "split_samples" else nr_intervals
+            for i in range(nr_splits):
+                task.module.make_split("%s_%d" % (task_id, i))
+            start = time.perf_counter()
+            graph.split_graph(task_id)
+            split_time += time.perf_counter() - start
+
+        graph.set_complete(task_id)
+        for child_id in graph.get_children(task_id):
+            child = graph.get_tasks(child_id)
+            if not child.is_complete() and not child.is_deprecated() and graph.parents_complete(child_id):
+                ready.append(child_id)
+
+    if not graph.is_complete():
+        raise RuntimeError("Benchmark graph couldn't be completed!")
+
+    return split_time, len(graph.get_tasks())
+
+def main():
+
+    argparser = argparse.ArgumentParser(prog="graph_split")
+    configure_argparser(argparser)
+    args = argparser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="cc_split_")
+    try:
+        graph_file = os.path.join(work_dir, "Graph.config")
+        with open(graph_file, "w") as fh:
+            fh.write(GRAPH_CONFIG)
+
+        full_time, nr_tasks     = run_graph(graph_file, True, args.nr_samples, args.nr_intervals)
+        subgraph_time, _        = run_graph(graph_file, False, args.nr_samples, args.nr_intervals)
+
+        print("Graph: %d samples x %d intervals (%d tasks after splitting)" % (args.nr_samples, args.nr_intervals, nr_tasks))
+        print("%-24s %14s %14s" % ("", "full", "subgraph"))
+        print("%-24s %14.3f %14.3f" % ("split_time(sec)", full_time, subgraph_time))
+        print("Speedup: %.1fx" % (full_time / subgraph_time))
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
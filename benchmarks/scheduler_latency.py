@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+# Measures the gap between a parent task finishing and its child task launching
+# A synthetic graph of independent task chains is run with no-op task workers and a platform with unlimited resources,
+# once with the old scheduler loop (rescan all unfinished tasks, then sleep) and once with the completion-queue Scheduler
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+
+BENCH_DIR   = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR    = os.path.dirname(BENCH_DIR)
+
+# Config specs are resolved relative to the repository root and modules are imported as done by CloudConductor
+os.chdir(REPO_DIR)
+sys.path.insert(0, REPO_DIR)
+for module_dir in ["Modules/Tools/", "Modules/Splitters/", "Modules/Mergers/"]:
+    sys.path.insert(1, os.path.join(REPO_DIR, module_dir))
+
+from System.Graph import Graph, Scheduler, TaskWorker
+
+# Scheduler module, so the task workers it creates can be replaced by no-op workers
+scheduler_module = sys.modules[Scheduler.__module__]
+
+def configure_argparser(argparser_obj):
+
+    argparser_obj.add_argument("-w", "--width",
+                               action="store",
+                               type=int,
+                               dest="width",
+                               default=100,
+                               help="Number of independent task chains.")
+
+    argparser_obj.add_argument("-d", "--depth",
+                               action="store",
+                               type=int,
+                               dest="depth",
+                               default=100,
+                               help="Number of tasks in each chain.")
+
+    argparser_obj.add_argument("--poll_interval",
+                               action="store",
+                               type=float,
+                               dest="poll_interval",
+                               default=5.0,
+                               help="Seconds the old scheduler loop sleeps between passes over the graph.")
+
+class NoopTaskWorker(threading.Thread):
+    # Task worker that finishes right away and records when it started and finished
+
+    IDLE            = TaskWorker.IDLE
+    COMPLETE        = TaskWorker.COMPLETE
+    FINALIZING      = TaskWorker.FINALIZING
+    FINALIZED       = TaskWorker.FINALIZED
+
+    # Time each task started and finished running
+    start_times     = {}
+    finish_times    = {}
+
+    def __init__(self, task, datastore, platform, completion_queue=None, task_cache=None):
+        super(NoopTaskWorker, self).__init__()
+        self.daemon = True
+        self.task = task
+        self.completion_queue = completion_queue
+        self.status_lock = threading.Lock()
+        self.status = self.IDLE
+
+    def run(self):
+        NoopTaskWorker.start_times[self.task.get_ID()] = time.perf_counter()
+        NoopTaskWorker.finish_times[self.task.get_ID()] = time.perf_counter()
+        self.set_status(self.COMPLETE)
+        if self.completion_queue is not None:
+            self.completion_queue.put(self.task.get_ID())
+
+    def set_status(self, new_status):
+        with self.status_lock:
+            self.status = new_status
+
+    def get_status(self):
+        with self.status_lock:
+            return self.status
+
+    def get_task(self):
+        return self.task
+
+    def get_resource_requirements(self):
+        return 1, 1, 1
+
+    def get_docker_image_name(self):
+        return None
+
+    def finalize(self):
+        self.join()
+
+    def is_cancelled(self):
+        return False
+
+    def is_success(self):
+        return True
+
+    def cancel(self):
+        pass
+
+class UnlimitedPlatform(object):
+    # Platform that can always run another task
+
+    def reserve_resources(self, task_id, nr_cpus, mem, disk_space, docker_image=None):
+        return True
+
+    def has_handoff(self, task_id):
+        return False
+
+    def wait_for_handoff_flushes(self):
+        return False
+
+    def flush_handoffs(self):
+        pass
+
+    def lock(self):
+        pass
+
+class PollingScheduler(object):
+    # Scheduler loop used before the completion queue: rescan all unfinished tasks, then sleep
+
+    def __init__(self, task_graph, poll_interval):
+        self.task_graph     = task_graph
+        self.poll_interval  = poll_interval
+        self.task_workers   = {}
+
+    def run(self):
+        while not self.task_graph.is_complete():
+            for task in self.task_graph.get_unfinished_tasks():
+                task_id = task.get_ID()
+                task_worker = None if task_id not in self.task_workers else self.task_workers[task_id]
+
+                # Finalize completed tasks
+                if task_worker is not None and task_worker.get_status() == NoopTaskWorker.COMPLETE:
+                    task_worker.set_status(NoopTaskWorker.FINALIZED)
+                    task_worker.finalize()
+                    self.task_graph.set_complete(task_id)
+                    continue
+
+                # Start running tasks that are ready to run but aren't currently
+                if task_worker is None and self.task_graph.parents_complete(task_id) and not task.is_deprecated():
+                    self.task_workers[task_id] = NoopTaskWorker(task, None, None)
+                    self.task_workers[task_id].start()
+
+            time.sleep(self.poll_interval)
+
+def make_graph(work_dir, width, depth):
+    # Write and load graph config made of 'width' independent chains of 'depth' tasks
+    graph_file = os.path.join(work_dir, "Graph.config")
+    with open(graph_file, "w") as fh:
+        for chain in range(width):
+            for level in range(depth):
+                fh.write("[t%d_%d]\nmodule = Utils\nsubmodule = BGZipVCF\n" % (chain, level))
+                if level > 0:
+                    fh.write("input_from = t%d_%d\n" % (chain, level - 1))
+    return Graph(graph_file)
+
+def measure(graph, scheduler):
+    # Run graph and return the total runtime and the launch gap of every task that has a parent
+    NoopTaskWorker.start_times = {}
+    NoopTaskWorker.finish_times = {}
+
+    start = time.perf_counter()
+    scheduler.run()
+    runtime = time.perf_counter() - start
+
+    gaps = []
+    for task_id in graph.get_tasks():
+        parents = graph.get_parents(task_id)
+        if len(parents) > 0:
+            parent_finish = max([NoopTaskWorker.finish_times[parent_id] for parent_id in parents])
+            gaps.append(NoopTaskWorker.start_times[task_id] - parent_finish)
+    return runtime, sorted(gaps)
+
+def main():
+
+    argparser = argparse.ArgumentParser(prog="scheduler_latency")
+    configure_argparser(argparser)
+    args = argparser.parse_args()
+
+    # Scheduler logs every launched task
+    logging.basicConfig(level=logging.WARNING)
+
+    work_dir = tempfile.mkdtemp(prefix="cc_latency_")
+    try:
+        results = {}
+
+        graph = make_graph(work_dir, args.width, args.depth)
+        results["polling"] = measure(graph, PollingScheduler(graph, args.poll_interval))
+
+        graph = make_graph(work_dir, args.width, args.depth)
+        scheduler_module.TaskWorker = NoopTaskWorker
+        results["completion_queue"] = measure(graph, Scheduler(graph, None, UnlimitedPlatform()))
+
+        print("Graph: %d chains x %d tasks" % (args.width, args.depth))
+        print("%-24s %14s %14s" % ("", "polling", "completion_queue"))
+        print("%-24s %14.3f %14.3f" % ("runtime(sec)", results["polling"][0], results["completion_queue"][0]))
+        for name, quantile in [("gap_median(ms)", 0.5), ("gap_p99(ms)", 0.99)]:
+            row = [gaps[int(quantile * (len(gaps) - 1))] * 1000 for runtime, gaps in results.values()]
+            print("%-24s %14.3f %14.3f" % (name, row[0], row[1]))
+        row = [gaps[-1] * 1000 for runtime, gaps in results.values()]
+        print("%-24s %14.3f %14.3f" % ("gap_max(ms)", row[0], row[1]))
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
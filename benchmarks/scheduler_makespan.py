@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Measures the makespan of a wide GATK scatter graph on the simulated platform
+# The graph is run twice: first without any runtime history (all tasks are estimated equally),
+# then with the runtime history recorded by the first run, so the scheduler can prioritize the critical path
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess as sp
+
+BENCH_DIR       = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR        = os.path.dirname(BENCH_DIR)
+CONFIG_DIR      = os.path.join(BENCH_DIR, "gatk_scatter")
+PIPELINE_NAME   = "gatk_scatter"
+
+def configure_argparser(argparser_obj):
+
+    argparser_obj.add_argument("-s", "--samples",
+                               action="store",
+                               type=int,
+                               dest="nr_samples",
+                               default=8,
+                               help="Number of samples in the simulated sample set.")
+
+    argparser_obj.add_argument("--keep",
+                               action="store_true",
+                               dest="keep",
+                               help="Keep the working directory with the logs and reports of both runs.")
+
+def write_sample_set(work_dir, nr_samples):
+    # Sample paths are never accessed on the simulated platform
+    samples = []
+    for i in range(nr_samples):
+        name = "S%d" % i
+        samples.append({"name": name,
+                        "paths": {"bam": "gs://benchmark/%s.bam" % name,
+                                  "bam_idx": "gs://benchmark/%s.bam.bai" % name}})
+
+    sample_set = {"gatk_version": "4.1",
+                  "interval_list": "gs://benchmark/ref/exome.interval_list",
+                  "samples": samples}
+
+    sample_set_path = os.path.join(work_dir, "SampleSet.json")
+    with open(sample_set_path, "w") as sample_set_file:
+        json.dump(sample_set, sample_set_file, indent=4)
+    return sample_set_path
+
+def write_platform_config(work_dir):
+    # Record the runtime history inside the working directory so the user's history is left untouched
+    with open(os.path.join(CONFIG_DIR, "SimulatedPlatform.config")) as plat_file:
+        plat_config = plat_file.read()
+
+    history_path = os.path.join(work_dir, "runtime_history.json")
+    plat_config = "runtime_history_file        = %s\n%s" % (history_path, plat_config)
+
+    plat_config_path = os.path.join(work_dir, "SimulatedPlatform.config")
+    with open(plat_config_path, "w") as plat_file:
+        plat_file.write(plat_config)
+    return plat_config_path
+
+def run_pipeline(work_dir, run_name, sample_set_path, plat_config_path):
+    output_dir  = os.path.join(work_dir, run_name)
+    log_path    = os.path.join(work_dir, "%s.log" % run_name)
+
+    cmd = [sys.executable, os.path.join(REPO_DIR, "CloudConductor"),
+           "-i", sample_set_path,
+           "-n", PIPELINE_NAME,
+           "-g", os.path.join(CONFIG_DIR, "Graph.config"),
+           "-k", os.path.join(CONFIG_DIR, "ResourceKit.config"),
+           "-p", plat_config_path,
+           "--plat_name", "simulated",
+           "-o", output_dir]
+
+    # Run inside the working directory, as CloudConductor writes temporary files into the current directory
+    with open(log_path, "w") as log_file:
+        ret_code = sp.call(cmd, cwd=work_dir, stdout=log_file, stderr=sp.STDOUT)
+
+    if ret_code != 0:
+        raise RuntimeError("Simulated run '%s' failed with exit code %d! See log: %s" % (run_name, ret_code, log_path))
+
+    report_path = os.path.join(output_dir, "%s_final_report.json" % PIPELINE_NAME)
+    with open(report_path) as report_file:
+        return json.load(report_file)["simulation"]
+
+def main():
+
+    argparser = argparse.ArgumentParser(prog="scheduler_makespan")
+    configure_argparser(argparser)
+    args = argparser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="cc_makespan_")
+    try:
+        sample_set_path     = write_sample_set(work_dir, args.nr_samples)
+        plat_config_path    = write_platform_config(work_dir)
+
+        # The first run has no runtime history, the second one uses the history recorded by the first
+        no_history  = run_pipeline(work_dir, "no_history", sample_set_path, plat_config_path)
+        history     = run_pipeline(work_dir, "history", sample_set_path, plat_config_path)
+
+        print("%-28s %14s %14s" % ("", "no_history", "history"))
+        for key in ["makespan(sec)", "nr_processors", "busy_cpu_hours", "platform_cpu_utilization", "cost"]:
+            print("%-28s %14.2f %14.2f" % (key, no_history[key], history[key]))
+
+        reduction = 1 - history["makespan(sec)"] / float(no_history["makespan(sec)"])
+        print("Makespan reduction: %.1f%%" % (reduction * 100))
+
+    finally:
+        if args.keep:
+            print("Working directory: %s" % work_dir)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
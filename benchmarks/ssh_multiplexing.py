@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# Measures the per-command overhead of running commands on an instance over SSH
+# The same sequence of short commands is run twice through Instance.run/wait_process:
+# first opening a new SSH connection for every command, then multiplexing them over one master connection
+#
+# Needs a reachable sshd accepting the given key, e.g. a local container:
+#   docker run -d -p 2222:2222 -e USER_NAME=bench -e PUBLIC_KEY="$(cat ~/.ssh/id_rsa.pub)" \
+#       lscr.io/linuxserver/openssh-server
+#   benchmarks/ssh_multiplexing.py --port 2222 --user bench --key ~/.ssh/id_rsa
+
+import os
+import sys
+import time
+import argparse
+
+BENCH_DIR   = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR    = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from System.Platform.Google import Instance
+
+def configure_argparser(argparser_obj):
+
+    argparser_obj.add_argument("--host",
+                               action="store",
+                               dest="host",
+                               default="127.0.0.1",
+                               help="Address of the sshd.")
+
+    argparser_obj.add_argument("--port",
+                               action="store",
+                               type=int,
+                               dest="port",
+                               default=22,
+                               help="Port of the sshd.")
+
+    argparser_obj.add_argument("--user",
+                               action="store",
+                               dest="user",
+                               default=None,
+                               help="User to log in as (default: current user).")
+
+    argparser_obj.add_argument("--key",
+                               action="store",
+                               dest="key",
+                               default=Instance.SSH_KEY_FILE,
+                               help="Private key used to log in.")
+
+    argparser_obj.add_argument("-n", "--nr_cmds",
+                               action="store",
+                               type=int,
+                               dest="nr_cmds",
+                               default=50,
+                               help="Number of commands run sequentially.")
+
+class BenchmarkInstance(Instance):
+    # Instance that isn't backed by a Google instance, so failed commands are reported instead of checked with the API
+
+    def handle_failure(self, proc_name, proc_obj):
+        raise RuntimeError("Command '%s' failed:\n%s" % (proc_name, proc_obj.err))
+
+def run_cmds(host, nr_cmds, multiplex):
+    # Run commands one after the other and return the time taken by each command
+    Instance.SSH_MULTIPLEX = multiplex
+    instance = BenchmarkInstance("ssh-bench-%s" % ("mux" if multiplex else "plain"), nr_cpus=1, mem=1, disk_space=10,
+                                 zone="us-east1-b", service_acct=None, disk_image=None, cmd_retries=0)
+    instance.external_IP = host
+
+    durations = []
+    try:
+        for i in range(nr_cmds):
+            job_name = "cmd_%d" % i
+            start = time.perf_counter()
+            instance.run(job_name, "true")
+            instance.wait_process(job_name)
+            durations.append(time.perf_counter() - start)
+    finally:
+        # Close the master connection so it doesn't outlive the benchmark
+        instance._Instance__close_ssh_master()
+    return durations
+
+def main():
+
+    argparser = argparse.ArgumentParser(prog="ssh_multiplexing")
+    configure_argparser(argparser)
+    args = argparser.parse_args()
+
+    # Instances log in as the current user
+    if args.user is not None:
+        os.environ["LOGNAME"] = args.user
+
+    Instance.SSH_KEY_FILE = args.key
+    Instance.SSH_PORT = args.port
+
+    results = {}
+    for multiplex in [False, True]:
+        results[multiplex] = run_cmds(args.host, args.nr_cmds, multiplex)
+
+    print("%d commands on %s:%d" % (args.nr_cmds, args.host, args.port))
+    print("%-24s %14s %14s" % ("", "new_connection", "multiplexed"))
+    print("%-24s %14.3f %14.3f" % ("total(sec)", sum(results[False]), sum(results[True])))
+
+    # First multiplexed command also opens the master connection so it's reported separately
+    print("%-24s %14.3f %14.3f" % ("first_cmd(ms)", results[False][0] * 1000, results[True][0] * 1000))
+    for name, quantile in [("cmd_median(ms)", 0.5), ("cmd_p99(ms)", 0.99)]:
+        row = []
+        for durations in [results[False], results[True]]:
+            durations = sorted(durations[1:])
+            row.append(durations[int(quantile * (len(durations) - 1))] * 1000)
+        print("%-24s %14.3f %14.3f" % (name, row[0], row[1]))
+
+if __name__ == "__main__":
+    main()
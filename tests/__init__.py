@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Tests are run from the repository root so config specs (e.g. 'System/Graph/Graph.validate') can be found
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Module import locations configured by the CloudConductor executable
+for module_dir in ["Modules/Tools/", "Modules/Splitters/", "Modules/Mergers/"]:
+    if os.path.join(REPO_DIR, module_dir) not in sys.path:
+        sys.path.insert(1, os.path.join(REPO_DIR, module_dir))
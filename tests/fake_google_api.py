@@ -0,0 +1,193 @@
+import json
+import time
+import fnmatch
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+class FakeGoogleAPI(object):
+    # Local HTTP server answering the Compute, Storage and Pub/Sub REST calls made by GoogleAPIClient
+    # Point the client at it with GoogleAPIClient.configure(project=..., api_root=fake_api.get_url())
+
+    ACCESS_TOKEN = "fake-token"
+
+    # Number of items returned per page of a list request
+    PAGE_SIZE = 3
+
+    def __init__(self, project="fake-project"):
+        self.project = project
+
+        # Compute resources: zone -> {instance name -> instance}, image name -> image, disk name -> disk
+        self.instances  = {}
+        self.images     = {}
+        self.disks      = {}
+
+        # Storage objects: bucket -> list of object names
+        self.objects    = {}
+
+        # Pub/Sub topics and the messages published to each topic
+        self.topics     = {}
+
+        # Every request received as (method, path)
+        self.requests   = []
+
+        # Seconds to wait before answering requests to a path (used to cause client timeouts)
+        self.delays     = {}
+
+        self.lock = threading.Lock()
+        self.server = None
+
+    def start(self):
+        # Start server on a free local port
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.__make_handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_url(self):
+        return "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def get_requests(self, method=None, path=None):
+        with self.lock:
+            return [(m, p) for m, p in self.requests if (method is None or m == method) and (path is None or p == path)]
+
+    def handle(self, method, path, params, body):
+        # Return (status code, response) of a request
+        with self.lock:
+            self.requests.append((method, path))
+        time.sleep(self.delays.get(path, 0))
+
+        parts = path.strip("/").split("/")
+        api, parts = parts[0], parts[2:]
+        if parts[0:2] == ["projects", self.project] or api == "storage":
+            handler = getattr(self, "_handle_%s" % api, None)
+            if handler is not None:
+                return handler(method, parts if api == "storage" else parts[2:], params, body)
+        return 404, {"error": {"code": 404, "message": "Not found"}}
+
+    def _handle_compute(self, method, parts, params, body):
+        # zones/<zone>/instances[/<name>], zones/<zone>/disks[/<name>], global/images/<name>
+        if parts[0] == "global" and parts[1] == "images" and method == "GET":
+            return self.__get(self.images, parts[2])
+
+        if parts[0] == "zones" and parts[2] == "instances":
+            instances = self.instances.get(parts[1], {})
+            if len(parts) == 3 and method == "GET":
+                return self.__list(list(instances.values()), params)
+            if len(parts) == 4 and method == "GET":
+                return self.__get(instances, parts[3])
+
+        if parts[0] == "zones" and parts[2] == "disks":
+            if len(parts) == 3 and method == "POST":
+                if body["name"] in self.disks:
+                    return 409, {"error": {"code": 409, "message": "The resource '%s' already exists" % body["name"]}}
+                self.disks[body["name"]] = body
+                return 200, {"name": "op-insert-%s" % body["name"], "status": "DONE"}
+            if len(parts) == 4 and method == "DELETE":
+                if self.disks.pop(parts[3], None) is None:
+                    return 404, {"error": {"code": 404, "message": "Not found"}}
+                return 200, {"name": "op-delete-%s" % parts[3], "status": "DONE"}
+
+        return 404, {"error": {"code": 404, "message": "Not found"}}
+
+    def _handle_storage(self, method, parts, params, body):
+        # b/<bucket>/o with 'prefix'/'delimiter' or 'matchGlob' (only '*' and '**' wildcards)
+        if method != "GET" or len(parts) != 3 or parts[0] != "b" or parts[2] != "o":
+            return 404, {"error": {"code": 404, "message": "Not found"}}
+        if parts[1] not in self.objects:
+            return 404, {"error": {"code": 404, "message": "Bucket not found"}}
+
+        objects = self.objects[parts[1]]
+        if "matchGlob" in params:
+            pattern = params["matchGlob"].replace("**", "*")
+            return 200, {"items": [{"name": name} for name in objects if fnmatch.fnmatch(name, pattern)]}
+
+        prefix = params.get("prefix", "")
+        items, prefixes = [], []
+        for name in objects:
+            if not name.startswith(prefix):
+                continue
+            rest = name[len(prefix):]
+            if "delimiter" in params and "/" in rest:
+                sub_dir = prefix + rest.split("/")[0] + "/"
+                if sub_dir not in prefixes:
+                    prefixes.append(sub_dir)
+            else:
+                items.append({"name": name})
+        response = {"items": items}
+        if len(prefixes) > 0:
+            response["prefixes"] = prefixes
+        return 200, response
+
+    def _handle_pubsub(self, method, parts, params, body):
+        # topics/<topic> and topics/<topic>:publish
+        if parts[0] != "topics":
+            return 404, {"error": {"code": 404, "message": "Not found"}}
+        topic, _, action = parts[1].partition(":")
+        if topic not in self.topics:
+            return 404, {"error": {"code": 404, "message": "Topic not found"}}
+        if method == "GET" and action == "":
+            return 200, {"name": "projects/%s/topics/%s" % (self.project, topic)}
+        if method == "POST" and action == "publish":
+            self.topics[topic].extend(body["messages"])
+            return 200, {"messageIds": [str(i) for i in range(len(body["messages"]))]}
+        return 404, {"error": {"code": 404, "message": "Not found"}}
+
+    def __get(self, resources, name):
+        if name not in resources:
+            return 404, {"error": {"code": 404, "message": "The resource '%s' was not found" % name}}
+        return 200, resources[name]
+
+    def __list(self, items, params):
+        # Return page of items starting at the page token
+        start = int(params.get("pageToken", 0))
+        response = {"items": items[start:start + self.PAGE_SIZE]}
+        if start + self.PAGE_SIZE < len(items):
+            response["nextPageToken"] = str(start + self.PAGE_SIZE)
+        return 200, response
+
+    def __make_handler(self):
+        fake_api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.__respond("GET")
+
+            def do_POST(self):
+                self.__respond("POST")
+
+            def do_DELETE(self):
+                self.__respond("DELETE")
+
+            def __respond(self, method):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length)) if length > 0 else None
+                url = urlparse(self.path)
+                params = {key: value[0] for key, value in parse_qs(url.query).items()}
+
+                if self.headers.get("Authorization") != "Bearer %s" % FakeGoogleAPI.ACCESS_TOKEN:
+                    status, response = 401, {"error": {"code": 401, "message": "Invalid credentials"}}
+                else:
+                    status, response = fake_api.handle(method, url.path, params, body)
+
+                data = json.dumps(response).encode("utf8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client gave up waiting for the response
+                    pass
+
+        return Handler
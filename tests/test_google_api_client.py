@@ -0,0 +1,139 @@
+import sys
+import time
+import zlib
+import base64
+import threading
+import unittest
+import unittest.mock
+
+from tests.fake_google_api import FakeGoogleAPI
+from System.Platform.Google import GoogleAPIClient, GoogleCloudHelper, GoogleResourceNotFound
+
+# Module of the client (used to skip the sleeps between retries)
+client_module = sys.modules[GoogleAPIClient.__module__]
+
+class NoSleep(object):
+    # Stand-in for the time module used by the client so retries happen immediately
+    time = staticmethod(time.time)
+
+    @staticmethod
+    def sleep(seconds):
+        pass
+
+class GoogleAPIClientTest(unittest.TestCase):
+
+    ZONE = "us-east1-b"
+
+    def setUp(self):
+        self.fake_api = FakeGoogleAPI().start()
+        self.fake_api.instances[self.ZONE] = {"ins-%d" % i: {"name": "ins-%d" % i, "status": "RUNNING"} for i in range(5)}
+        self.fake_api.images["img"] = {"name": "img", "diskSizeGb": "20"}
+        self.fake_api.objects["bkt"] = ["out/a.txt", "out/b_dummy.txt", "out/sub/c_dummy.txt", "out/sub/d.txt", "other.txt"]
+        self.fake_api.topics["reports"] = []
+
+        GoogleAPIClient.configure(project=self.fake_api.project, api_root=self.fake_api.get_url())
+        self.__set_token(FakeGoogleAPI.ACCESS_TOKEN)
+        client_module.time = NoSleep
+
+        # Instance lists are cached across calls
+        GoogleCloudHelper.instance_lists = {}
+
+    def tearDown(self):
+        client_module.time = time
+        GoogleAPIClient.configure()
+        GoogleAPIClient.api_roots = dict(GoogleAPIClient.DEFAULT_API_ROOTS)
+        self.fake_api.stop()
+
+    def test_describe(self):
+        self.assertEqual(GoogleCloudHelper.describe("ins-1", self.ZONE)["name"], "ins-1")
+        with self.assertRaises(GoogleResourceNotFound):
+            GoogleCloudHelper.describe("missing", self.ZONE)
+
+    def test_list_pages(self):
+        # Instance list is spread across two pages
+        self.assertEqual(GoogleCloudHelper.get_instance_info("ins-4", self.ZONE)["status"], "RUNNING")
+        self.assertEqual(len(self.fake_api.get_requests("GET")), 2)
+        with self.assertRaises(GoogleResourceNotFound):
+            GoogleCloudHelper.get_instance_info("missing", self.ZONE)
+
+    def test_disk_image_info(self):
+        self.assertEqual(GoogleCloudHelper.get_disk_image_info("img")["diskSizeGb"], "20")
+
+    def test_ls(self):
+        self.assertEqual(GoogleCloudHelper.ls("gs://bkt/out/**dummy.txt"),
+                         ["gs://bkt/out/b_dummy.txt", "gs://bkt/out/sub/c_dummy.txt"])
+        self.assertEqual(GoogleCloudHelper.ls("gs://bkt/out"),
+                         ["gs://bkt/out/a.txt", "gs://bkt/out/b_dummy.txt", "gs://bkt/out/sub/"])
+        self.assertEqual(GoogleCloudHelper.ls("gs://bkt/out/a.txt"), ["gs://bkt/out/a.txt"])
+        self.assertEqual(GoogleCloudHelper.ls("gs://bkt/missing"), [])
+
+    def test_publish(self):
+        self.assertTrue(GoogleCloudHelper.pubsub_topic_exists("reports"))
+        self.assertFalse(GoogleCloudHelper.pubsub_topic_exists("missing"))
+
+        GoogleCloudHelper.send_pubsub_message("reports", message="gs://bkt/out/report.json", encode=True, compress=True)
+        data = self.fake_api.topics["reports"][0]["data"]
+        self.assertEqual(zlib.decompress(base64.b64decode(base64.b64decode(data))), b"gs://bkt/out/report.json")
+
+    def test_expired_token_is_refreshed(self):
+        # Client requests a new token after a 401 response
+        self.__set_token("expired-token")
+        with unittest.mock.patch.object(GoogleAPIClient, "_GoogleAPIClient__run_gcloud",
+                                        return_value=FakeGoogleAPI.ACCESS_TOKEN):
+            self.assertEqual(GoogleCloudHelper.describe("ins-1", self.ZONE)["name"], "ins-1")
+
+    def test_token_refreshed_without_client_lock(self):
+        # Other threads can use the client while a new access token is obtained
+        lock_held = []
+
+        def run_gcloud(cmd, err_msg):
+            lock_held.append(GoogleAPIClient.client_lock.locked())
+            return FakeGoogleAPI.ACCESS_TOKEN
+
+        self.__set_token(None)
+        with unittest.mock.patch.object(GoogleAPIClient, "_GoogleAPIClient__run_gcloud", side_effect=run_gcloud):
+            threads = [threading.Thread(target=GoogleCloudHelper.describe, args=("ins-1", self.ZONE)) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # Token is obtained once and never while the client lock is held
+        self.assertEqual(lock_held, [False])
+        self.assertEqual(len(self.fake_api.get_requests("GET")), 5)
+
+    def test_read_timeout_retries(self):
+        # Requests that timed out after reaching the server are only re-sent if they're safe to repeat
+        disk_path = "/compute/v1/projects/%s/zones/%s/disks" % (self.fake_api.project, self.ZONE)
+        ins_path = "/compute/v1/projects/%s/zones/%s/instances/ins-1" % (self.fake_api.project, self.ZONE)
+        self.fake_api.delays[disk_path] = 1
+        self.fake_api.delays[ins_path] = 1
+
+        with unittest.mock.patch.object(GoogleAPIClient, "REQUEST_TIMEOUT", 0.2):
+            with self.assertRaises(RuntimeError):
+                GoogleCloudHelper.create_disk("disk", self.ZONE, 10)
+            with self.assertRaises(RuntimeError):
+                GoogleCloudHelper.describe("ins-1", self.ZONE)
+
+        # Insert was sent once and created the disk while the describe call was re-sent
+        self.assertEqual(len(self.fake_api.get_requests("POST", disk_path)), 1)
+        self.assertIn("disk", self.fake_api.disks)
+        self.assertEqual(len(self.fake_api.get_requests("GET", ins_path)), 6)
+
+    def test_connect_error_retries(self):
+        # Requests that couldn't connect to the server are re-sent even if they aren't safe to repeat
+        self.fake_api.stop()
+        attempts = []
+        with unittest.mock.patch.object(NoSleep, "sleep", side_effect=attempts.append):
+            with self.assertRaises(RuntimeError):
+                GoogleCloudHelper.create_disk("disk", self.ZONE, 10)
+        self.assertEqual(len(attempts), 5)
+        self.fake_api.start()
+
+    def __set_token(self, access_token):
+        with GoogleAPIClient.client_lock:
+            GoogleAPIClient.access_token = access_token
+            GoogleAPIClient.token_time = time.time()
+
+if __name__ == "__main__":
+    unittest.main()
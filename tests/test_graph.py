@@ -0,0 +1,107 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from tests import REPO_DIR
+from System.Graph import Graph
+
+# Module declaration of each kind of task in the generated graph configs
+TOOL        = "module = Utils\nsubmodule = BGZipVCF\n"
+SPLITTER    = "module = SampleSplitter\n"
+MERGER      = "module = VCFMergers\nsubmodule = VCFMerger\n"
+
+class GraphSplitTest(unittest.TestCase):
+
+    # Number of random graphs checked and the random seed used to generate them
+    NR_RANDOM_GRAPHS    = 200
+    RANDOM_SEED         = 17
+
+    def setUp(self):
+        self.prev_dir = os.getcwd()
+        os.chdir(REPO_DIR)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        os.chdir(self.prev_dir)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_splitter_to_merger(self):
+        # Merger directly downstream of a splitter should only depend on the splitter once
+        for full_validation in [False, True]:
+            graph = self.__make_graph([("split", SPLITTER, []), ("merge", MERGER, ["split"])], full_validation)
+            self.__run_graph(graph)
+            self.assertEqual(graph.get_parents("merge"), ["split"])
+            self.assertTrue(graph.is_complete())
+
+    def test_incremental_validation_matches_full_validation(self):
+        # Splitting random graphs with incremental validation must give the same result as re-validating everything
+        rand = random.Random(self.RANDOM_SEED)
+        nr_split = 0
+        for i in range(self.NR_RANDOM_GRAPHS):
+            tasks = self.__random_tasks(rand)
+            results = []
+            for full_validation in [False, True]:
+                graph = self.__make_graph(tasks, full_validation)
+                try:
+                    self.__run_graph(graph)
+                    error = None
+                except RuntimeError as e:
+                    error = str(e)
+                results.append((error,
+                                dict(graph.adj_list),
+                                dict(graph.incomplete_parents),
+                                [task_id for task_id, task in graph.get_tasks().items() if task.is_complete()]))
+                if error is None:
+                    self.assertTrue(graph.is_complete(), "Graph %d couldn't be completed:\n%s" % (i, tasks))
+            self.assertEqual(results[0], results[1], "Validation modes disagree for graph %d:\n%s" % (i, tasks))
+            if results[0][0] is None and len(results[0][1]) > len(tasks):
+                nr_split += 1
+
+        # Make sure the random graphs actually exercise splitting
+        self.assertGreater(nr_split, self.NR_RANDOM_GRAPHS // 2)
+
+    def __random_tasks(self, rand):
+        # Return random DAG as list of (task_id, module declaration, parent task ids)
+        tasks = [("t0", SPLITTER, [])]
+        for i in range(1, rand.randint(2, 10)):
+            module = rand.choice([TOOL, TOOL, SPLITTER, MERGER, MERGER])
+            parents = rand.sample([task[0] for task in tasks], rand.randint(1, min(3, len(tasks))))
+            tasks.append(("t%d" % i, module, parents))
+        return tasks
+
+    def __make_graph(self, tasks, full_validation):
+        graph_file = os.path.join(self.tmp_dir, "graph.config")
+        with open(graph_file, "w") as fh:
+            for task_id, module, parents in tasks:
+                fh.write("[%s]\n%s" % (task_id, module))
+                if len(parents) > 0:
+                    fh.write("input_from = %s\n" % ", ".join(parents))
+        return Graph(graph_file, full_validation=full_validation)
+
+    def __run_graph(self, graph):
+        # Complete tasks in the order the scheduler would, splitting the graph after each splitter
+        while not graph.is_complete():
+            ready = [task_id for task_id, task in graph.get_tasks().items()
+                     if not task.is_complete() and graph.parents_complete(task_id)]
+            if len(ready) == 0:
+                raise RuntimeError("No task can be run!")
+            task_id = ready[0]
+            task = graph.get_tasks(task_id)
+            if task.is_splitter_task():
+                for split_id in ["a", "b", "c"]:
+                    task.module.make_split(split_id, visible_samples=[split_id])
+                graph.split_graph(task_id)
+            graph.set_complete(task_id)
+            self.__check_counts(graph)
+
+    def __check_counts(self, graph):
+        # Number of incomplete parents must match the distinct incomplete parents of each task
+        for task_id in graph.get_tasks():
+            incomplete = set(parent for parent in graph.get_parents(task_id)
+                             if not graph.get_tasks(parent).is_complete())
+            self.assertEqual(graph.incomplete_parents[task_id], len(incomplete), "Wrong count for '%s'" % task_id)
+
+if __name__ == "__main__":
+    unittest.main()
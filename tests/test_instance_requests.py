@@ -0,0 +1,132 @@
+import re
+import sys
+import time
+import unittest
+
+from tests.fake_google_api import FakeGoogleAPI
+from System.Platform.Google import GoogleAPIClient, GoogleCloudHelper, ZonePlacement
+
+# Module of the helper (used to capture the gcloud commands it runs)
+helper_module = sys.modules[GoogleCloudHelper.__module__]
+
+class FakeGcloud(object):
+    # Stand-in for the subprocess module creating instances in the fake API until the zone runs out of capacity
+
+    STOCKOUT_ERR = b"ERROR: (gcloud.compute.instances.bulk.create) Could not fetch resource:\n" \
+                   b" - The zone 'projects/fake-project/zones/us-east1-b' does not have enough resources " \
+                   b"available to fulfill the request. '(resource type:compute)'.\n"
+
+    PIPE = helper_module.sp.PIPE
+
+    def __init__(self, fake_api, zone, capacity, all_or_nothing=True):
+        self.fake_api       = fake_api
+        self.zone           = zone
+        self.capacity       = capacity
+
+        # Bulk creation without a minimum count creates nothing if every instance can't be created
+        self.all_or_nothing = all_or_nothing
+
+        # Names of the instances requested by each create command
+        self.create_cmds    = []
+
+    def Popen(self, cmd, **kwargs):
+        bulk_names = re.search(r"--predefined-names=(\S+)", cmd)
+        if bulk_names is not None:
+            names = bulk_names.group(1).split(",")
+        else:
+            names = [re.search(r"instances create (\S+)", cmd).group(1)]
+        self.create_cmds.append(names)
+
+        instances = self.fake_api.instances.setdefault(self.zone, {})
+        nr_free = self.capacity - len(instances)
+        if len(names) > nr_free and (self.all_or_nothing and "--min-count" not in cmd or nr_free == 0):
+            return FakeProcess(b"", self.STOCKOUT_ERR, 1)
+
+        for name in names[:nr_free]:
+            instances[name] = {"name": name, "status": "RUNNING"}
+        return FakeProcess(b"", self.STOCKOUT_ERR if len(names) > nr_free else b"", int(len(names) > nr_free))
+
+class FakeProcess(object):
+
+    def __init__(self, out, err, returncode):
+        self.out        = out
+        self.err        = err
+        self.returncode = returncode
+
+    def communicate(self):
+        return self.out, self.err
+
+class BulkCreateTest(unittest.TestCase):
+
+    ZONE = "us-east1-b"
+
+    def setUp(self):
+        self.fake_api = FakeGoogleAPI().start()
+        GoogleAPIClient.configure(project=self.fake_api.project, api_root=self.fake_api.get_url())
+        with GoogleAPIClient.client_lock:
+            GoogleAPIClient.access_token = FakeGoogleAPI.ACCESS_TOKEN
+            GoogleAPIClient.token_time = time.time()
+
+        self.prev_batch_window = GoogleCloudHelper.CONTROL_PLANE_BATCH_WINDOW
+        GoogleCloudHelper.CONTROL_PLANE_BATCH_WINDOW = 0.2
+        GoogleCloudHelper.instance_lists = {}
+        GoogleCloudHelper.zone_change_times = {}
+
+    def tearDown(self):
+        helper_module.sp = sys.modules["subprocess"]
+        GoogleCloudHelper.CONTROL_PLANE_BATCH_WINDOW = self.prev_batch_window
+        GoogleAPIClient.configure()
+        GoogleAPIClient.api_roots = dict(GoogleAPIClient.DEFAULT_API_ROOTS)
+        self.fake_api.stop()
+
+    def test_stockout_retries_missing_instances(self):
+        # Zone only fits 3 of 5 instances, so the bulk create fails and nothing is created
+        # Only the 2 instances that couldn't be created must fail
+        gcloud = self.__set_gcloud(capacity=3)
+        requests = self.__create(["ins-%d" % i for i in range(5)])
+
+        self.assertEqual(gcloud.create_cmds, [["ins-%d" % i for i in range(5)], ["ins-%d" % i for i in range(5)]])
+        self.assertEqual([request.has_failed() for request in requests], [False] * 3 + [True] * 2)
+        self.assertTrue(all(ZonePlacement.is_capacity_error(request.err.decode("utf8")) for request in requests[3:]))
+
+    def test_partial_creation_retries_missing_instances(self):
+        # Instances created by the failed bulk create aren't requested again
+        gcloud = self.__set_gcloud(capacity=4, all_or_nothing=False)
+        self.fake_api.instances[self.ZONE] = {"other": {"name": "other", "status": "RUNNING"}}
+        requests = self.__create(["ins-%d" % i for i in range(5)])
+
+        self.assertEqual(gcloud.create_cmds, [["ins-%d" % i for i in range(5)], ["ins-3", "ins-4"]])
+        self.assertEqual([request.has_failed() for request in requests], [False] * 3 + [True] * 2)
+
+    def test_retry_creates_single_instance(self):
+        # Single remaining instance is retried with a regular create, which succeeds once capacity frees up
+        gcloud = self.__set_gcloud(capacity=2, all_or_nothing=False)
+        orig_popen = gcloud.Popen
+
+        def popen(cmd, **kwargs):
+            proc = orig_popen(cmd, **kwargs)
+            gcloud.capacity += 1
+            return proc
+        gcloud.Popen = popen
+
+        requests = self.__create(["ins-0", "ins-1", "ins-2"])
+        self.assertEqual(gcloud.create_cmds, [["ins-0", "ins-1", "ins-2"], ["ins-2"]])
+        self.assertFalse(any(request.has_failed() for request in requests))
+
+    def __set_gcloud(self, capacity, all_or_nothing=True):
+        gcloud = FakeGcloud(self.fake_api, self.ZONE, capacity, all_or_nothing)
+        helper_module.sp = gcloud
+        return gcloud
+
+    def __create(self, names):
+        # Submit create requests that are sent in a single batch and wait for their outcome
+        requests = [GoogleCloudHelper.submit_instance_request("create", name, self.ZONE, args="--preemptible")
+                    for name in names]
+        for request in requests:
+            out, err = request.communicate()
+            request.set_output(out, err)
+            request.set_complete()
+        return requests
+
+if __name__ == "__main__":
+    unittest.main()
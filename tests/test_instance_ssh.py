@@ -0,0 +1,82 @@
+import os
+import sys
+import stat
+import shutil
+import unittest
+import unittest.mock
+import subprocess as sp
+
+from System.Platform.Google import Instance
+
+# Module of the instance (used to capture the commands it runs through subprocess)
+instance_module = sys.modules[Instance.__module__]
+
+class InstanceSSHTest(unittest.TestCase):
+
+    def setUp(self):
+        self.instance = Instance("ins-ssh-test", nr_cpus=1, mem=1, disk_space=10,
+                                 zone="us-east1-b", service_acct="sa", disk_image="img")
+        self.instance.external_IP = "10.0.0.1"
+
+    def test_close_uses_command_socket(self):
+        # Closing the master connection must address the socket the commands were multiplexed over
+        cmd_options = self.__get_options(self.instance.adapt_cmd("ls").split(" -- ")[0])
+        close_options = self.__get_options(self.__get_close_cmd().replace(" -O exit ", " "))
+
+        self.assertIn("ControlPath=%s/%%C" % Instance.get_ssh_control_dir(), self.__get_close_cmd())
+        self.assertEqual(cmd_options, close_options)
+
+    @unittest.skipIf(shutil.which("ssh") is None, "ssh client isn't installed")
+    def test_close_resolves_to_command_socket(self):
+        # Socket paths expanded by the ssh client must be the same
+        cmd_socket = self.__resolve_control_path(self.instance.adapt_cmd("ls").split(" -- ")[0])
+        close_socket = self.__resolve_control_path(self.__get_close_cmd().replace(" -O exit ", " "))
+
+        self.assertTrue(cmd_socket.startswith(Instance.get_ssh_control_dir()))
+        self.assertEqual(cmd_socket, close_socket)
+
+        # Other instances get their own socket
+        self.instance.external_IP = "10.0.0.2"
+        self.assertNotEqual(self.__resolve_control_path(self.instance.adapt_cmd("ls").split(" -- ")[0]), cmd_socket)
+
+    def test_control_dir_is_private(self):
+        # Other users must not be able to place their own control sockets where commands look for them
+        control_dir = Instance.get_ssh_control_dir()
+        self.assertIn("ControlPath=%s/" % control_dir, self.instance.adapt_cmd("ls"))
+
+        dir_stat = os.lstat(control_dir)
+        self.assertTrue(stat.S_ISDIR(dir_stat.st_mode))
+        self.assertEqual(dir_stat.st_uid, os.getuid())
+        self.assertEqual(stat.S_IMODE(dir_stat.st_mode), 0o700)
+
+    def test_no_multiplexing(self):
+        with unittest.mock.patch.object(Instance, "SSH_MULTIPLEX", False):
+            self.assertNotIn("ControlPath", self.instance.adapt_cmd("ls"))
+            with unittest.mock.patch.object(instance_module.sp, "Popen") as popen:
+                self.instance._Instance__close_ssh_master()
+            popen.assert_not_called()
+
+    def __get_close_cmd(self):
+        # Return command run to close the master connection
+        with unittest.mock.patch.object(instance_module.sp, "Popen") as popen:
+            popen.return_value.communicate.return_value = (b"", b"")
+            self.instance._Instance__close_ssh_master()
+        return popen.call_args[0][0]
+
+    @staticmethod
+    def __get_options(ssh_cmd):
+        # Return options and destination of an ssh command
+        return sorted(ssh_cmd.split()[1:])
+
+    @staticmethod
+    def __resolve_control_path(ssh_cmd):
+        # Return control socket path resolved by 'ssh -G' (prints the configuration without connecting)
+        ssh_cmd = ssh_cmd.replace("ssh ", "ssh -G ", 1)
+        out = sp.run(ssh_cmd, shell=True, stdout=sp.PIPE, stderr=sp.DEVNULL, check=True).stdout.decode("utf8")
+        for line in out.splitlines():
+            if line.startswith("controlpath "):
+                return line.split(" ", 1)[1]
+        raise AssertionError("ssh didn't report a control path for: %s" % ssh_cmd)
+
+if __name__ == "__main__":
+    unittest.main()
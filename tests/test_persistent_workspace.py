@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from System.Platform import Processor
+from System.Platform.Google import PreemptibleInstance
+
+class LocalWorkspaceInstance(PreemptibleInstance):
+    # Preemptible instance with a persistent workspace running its commands on the local host
+    # Replacement instances are "created" instantly and keep the workspace directory
+
+    # Commands that would change the local host are replaced by a no-op
+    NOOP_JOBS = ["mountWorkspace", "watchPreemption"]
+
+    def __init__(self, name, workspace_mount, **kwargs):
+        super(LocalWorkspaceInstance, self).__init__(name, nr_cpus=1, mem=1, disk_space=10, zone="us-east1-b",
+                                                     service_acct="sa", disk_image="img", persistent_workspace=True,
+                                                     workspace_mount=workspace_mount, **kwargs)
+        self.external_IP = "10.0.0.1"
+        self.ssh_connections_increased = True
+        self.workspace_disk_exists = True
+        self.workspace_disk_attached = True
+
+        # Names of the jobs run on the instance
+        self.jobs = []
+
+    def run(self, job_name, cmd, **kwargs):
+        self.jobs.append(job_name)
+        super(LocalWorkspaceInstance, self).run(job_name, "true" if job_name in self.NOOP_JOBS else cmd, **kwargs)
+
+    def adapt_cmd(self, cmd):
+        return cmd.replace("sudo ", "")
+
+    def update_status(self):
+        pass
+
+    def check_ssh(self):
+        return True
+
+    def attach_workspace_disk(self):
+        self.workspace_disk_attached = True
+
+    def detach_workspace_disk(self):
+        self.workspace_disk_attached = False
+
+    def create(self):
+        self.set_status(Processor.AVAILABLE)
+        self.set_create_time()
+        self.wait_until_ready()
+
+    def destroy(self, wait=True):
+        self.watching_preemption = False
+        self.set_stop_time()
+        self.set_status(Processor.OFF)
+
+class PersistentWorkspaceResetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wrk_dir = tempfile.mkdtemp()
+        self.proc = LocalWorkspaceInstance("ins-wrk-test", self.wrk_dir)
+        self.proc.create()
+        for job_name in ["load_input_0", "mount_ref", "run_tool"]:
+            self.proc.run(job_name, "true")
+            self.proc.wait_process(job_name)
+        self.proc.jobs = []
+
+    def tearDown(self):
+        shutil.rmtree(self.wrk_dir)
+
+    def test_flushed_workspace_is_kept(self):
+        # Preemption watcher left its marker, so only the boot disk setup is rerun on the replacement instance
+        open(os.path.join(self.wrk_dir, PreemptibleInstance.PREEMPTION_MARKER), "w").close()
+        self.proc.reset(force_destroy=True)
+
+        self.assertEqual(self.__get_rerun_jobs(), ["mount_ref"])
+        self.assertFalse(os.path.exists(os.path.join(self.wrk_dir, PreemptibleInstance.PREEMPTION_MARKER)))
+
+    def test_unflushed_workspace_is_rerun(self):
+        # Instance went down without its preemption notice, so files on the workspace disk may be incomplete
+        self.proc.reset(force_destroy=True)
+
+        self.assertEqual(self.__get_rerun_jobs(), ["load_input_0", "mount_ref", "run_tool"])
+
+    def __get_rerun_jobs(self):
+        return [job_name for job_name in self.proc.jobs if job_name not in
+                LocalWorkspaceInstance.NOOP_JOBS + ["clearPreemptionMarker"]]
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import time
+import tempfile
+import threading
+import unittest
+
+from System.Datastore import GAPFile
+from System.Datastore.Datastore import TaskWorkspace
+from System.Graph import ModuleExecutor
+from System.Platform import Processor
+from System.Platform.Google import PreemptibleInstance
+
+class LocalPreemptibleInstance(PreemptibleInstance):
+    # Preemptible instance running its commands on the local host
+    # Commands run while the instance is preempted fail like SSH commands to a stopped instance
+
+    def __init__(self, name, marker, preempt_on_job, **kwargs):
+        super(LocalPreemptibleInstance, self).__init__(name, nr_cpus=1, mem=1, disk_space=10,
+                                                       zone="us-east1-b", service_acct="sa", disk_image="img", **kwargs)
+        self.external_IP = "10.0.0.1"
+
+        # Instance is preempted while the marker file exists
+        self.marker = marker
+
+        # Instance is preempted once this job is started
+        self.preempt_on_job = preempt_on_job
+
+        # Number of times each job was run and number of times the instance was restarted
+        self.run_counts = {}
+        self.nr_restarts = 0
+        self.counts_lock = threading.Lock()
+
+    def run(self, job_name, cmd, **kwargs):
+        with self.counts_lock:
+            self.run_counts[job_name] = self.run_counts.get(job_name, 0) + 1
+        if job_name == self.preempt_on_job and self.run_counts[job_name] == 1:
+            open(self.marker, "w").close()
+        super(LocalPreemptibleInstance, self).run(job_name, cmd, **kwargs)
+
+    def adapt_cmd(self, cmd):
+        # Commands take a moment so several transfers are running when the instance is preempted
+        cmd = cmd.replace("sudo ", "")
+        return "sleep 0.2; if [ -e {0} ]; then echo 'ssh: connect to host {1} port 22: Connection refused' >&2; " \
+               "exit 255; fi; {2}".format(self.marker, self.external_IP, cmd)
+
+    def update_status(self):
+        self.set_status(Processor.OFF if os.path.exists(self.marker) else Processor.AVAILABLE)
+
+    def check_ssh(self):
+        return not os.path.exists(self.marker)
+
+    def stop(self):
+        self.set_stop_time()
+
+    def start(self):
+        # Restarting takes long enough for the other running commands to fail as well
+        self.nr_restarts += 1
+        time.sleep(0.5)
+        if os.path.exists(self.marker):
+            os.remove(self.marker)
+        self.set_status(Processor.AVAILABLE)
+
+class PreemptedTransferTest(unittest.TestCase):
+
+    NR_FILES = 40
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_dir = os.path.join(self.tmp_dir, "src")
+        os.makedirs(self.src_dir)
+
+        work_dir = os.path.join(self.tmp_dir, "work")
+        self.workspace = TaskWorkspace(wrk_dir=work_dir,
+                                       tmp_output_dir=os.path.join(self.tmp_dir, "tmp_output"),
+                                       wrk_output=os.path.join(work_dir, "output"),
+                                       final_output_dir=os.path.join(self.tmp_dir, "output"))
+
+        self.proc = LocalPreemptibleInstance("ins-preempt-test",
+                                             marker=os.path.join(self.tmp_dir, "preempted"),
+                                             preempt_on_job="load_input_task_3")
+        self.proc.set_status(Processor.AVAILABLE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_preemption_during_parallel_transfer(self):
+        # Every running transfer fails at once, but the instance is only reset once
+        # and every transfer is re-run at most once
+        inputs = []
+        for i in range(self.NR_FILES):
+            path = os.path.join(self.src_dir, "file_%d.txt" % i)
+            with open(path, "w") as fh:
+                fh.write(str(i))
+            task_input = GAPFile("file_%d" % i, "txt", path)
+            task_input.flag("handoff")
+            inputs.append(task_input)
+
+        executor = ModuleExecutor("task", self.proc, self.workspace, transfer_window=8, transfer_batch_size=4)
+        executor.load_input(inputs)
+
+        self.assertEqual(self.proc.nr_restarts, 1)
+        transfer_counts = [count for job_name, count in self.proc.run_counts.items() if job_name.startswith("load_input_")]
+        self.assertEqual(len(transfer_counts), self.NR_FILES // 4)
+        self.assertTrue(all(count <= 2 for count in transfer_counts), self.proc.run_counts)
+        self.assertGreater(sum(transfer_counts), len(transfer_counts))
+
+        for i in range(self.NR_FILES):
+            with open(os.path.join(self.workspace.get_wrk_dir(), "file_%d.txt" % i)) as fh:
+                self.assertEqual(fh.read(), str(i))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from System.Platform import StorageHelper
+from System.Platform.Local import LocalProcessor
+
+class CountingProcessor(LocalProcessor):
+    # Local processor recording every command run on it
+
+    def __init__(self, *args, **kwargs):
+        super(CountingProcessor, self).__init__(*args, **kwargs)
+        self.cmds = []
+
+    def run(self, job_name, cmd, **kwargs):
+        self.cmds.append(cmd)
+        super(CountingProcessor, self).run(job_name, cmd, **kwargs)
+
+class StorageHelperBatchTest(unittest.TestCase):
+    # Batch transfers between local directories standing in for a bucket and the processor's workspace
+
+    NR_FILES = 500
+
+    def setUp(self):
+        self.tmp_dir    = tempfile.mkdtemp()
+        self.bucket_dir = os.path.join(self.tmp_dir, "bucket")
+        self.wrk_dir    = os.path.join(self.tmp_dir, "wrk")
+        os.makedirs(self.bucket_dir)
+        os.makedirs(self.wrk_dir)
+
+        self.proc = CountingProcessor("test-proc", nr_cpus=1, mem=1, disk_space=1, log_dir=self.tmp_dir)
+        self.proc.create()
+        self.storage_helper = StorageHelper(self.proc)
+
+    def tearDown(self):
+        self.proc.destroy()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_single_command_for_many_files(self):
+        # Names include spaces, wildcards and shell characters which must not be expanded
+        names = ["sample_%d.bam" % i for i in range(self.NR_FILES)] + ["with space.txt", "star[1]*.txt", "$HOME;ls.txt"]
+        transfers = [(self.__make_file(name), self.wrk_dir) for name in names]
+
+        self.storage_helper.mv_batch(transfers, job_name="load_input", wait=True)
+
+        self.assertEqual(len(self.proc.cmds), 1)
+        self.assertEqual(sorted(os.listdir(self.wrk_dir)), sorted(names))
+        for name in names:
+            with open(os.path.join(self.wrk_dir, name)) as fh:
+                self.assertEqual(fh.read(), name)
+
+        # Command size doesn't depend on the number of files and manifests are removed
+        self.assertLess(len(self.proc.cmds[0]), StorageHelper.MANIFEST_CHUNK_SIZE * 4 // 3 + 1024)
+        self.assertFalse(any(".manifest" in f for f in os.listdir(StorageHelper.MANIFEST_DIR) if f.startswith("load_input_")))
+
+    def test_manifest_split_into_chunks(self):
+        # Manifests larger than a chunk are written by separate bounded commands
+        names = ["sample_%d.bam" % i for i in range(self.NR_FILES)]
+        transfers = [(self.__make_file(name), self.wrk_dir) for name in names]
+
+        prev_chunk_size = StorageHelper.MANIFEST_CHUNK_SIZE
+        StorageHelper.MANIFEST_CHUNK_SIZE = 4096
+        try:
+            self.storage_helper.mv_batch(transfers, job_name="load_input_chunked", wait=True)
+        finally:
+            StorageHelper.MANIFEST_CHUNK_SIZE = prev_chunk_size
+
+        self.assertGreater(len(self.proc.cmds), 2)
+        self.assertTrue(all(len(cmd) < 4096 * 4 // 3 + 1024 for cmd in self.proc.cmds))
+        self.assertEqual(sorted(os.listdir(self.wrk_dir)), sorted(names))
+
+    def test_multiple_destinations_and_prefix_files(self):
+        # Files are grouped by destination and wildcard (prefix) paths are expanded by the shell
+        other_dir = os.path.join(self.tmp_dir, "other")
+        os.makedirs(other_dir)
+        for name in ["ref.fa", "ref.fa.fai", "ref.fa.dict"]:
+            self.__make_file(name)
+        transfers = [(self.__make_file("a.txt"), self.wrk_dir),
+                     (self.__make_file("b.txt"), other_dir),
+                     (self.__make_file("c.txt"), self.wrk_dir),
+                     (os.path.join(self.bucket_dir, "ref.fa") + "*", self.wrk_dir)]
+
+        self.storage_helper.mv_batch(transfers, wait=True)
+
+        self.assertEqual(len(self.proc.cmds), 1)
+        self.assertEqual(sorted(os.listdir(self.wrk_dir)), ["a.txt", "c.txt", "ref.fa", "ref.fa.dict", "ref.fa.fai"])
+        self.assertEqual(os.listdir(other_dir), ["b.txt"])
+
+    def test_failed_transfer_fails_batch(self):
+        transfers = [(self.__make_file("a.txt"), self.wrk_dir),
+                     (os.path.join(self.bucket_dir, "missing.txt"), self.wrk_dir)]
+        with self.assertRaises(RuntimeError):
+            self.storage_helper.mv_batch(transfers, wait=True, num_retries=0)
+
+    def test_missing_manifest_fails_batch(self):
+        # Manifest chunk written by an earlier command is lost (e.g. the processor was restarted)
+        # Transfer must fail instead of only transferring the files listed in the remaining chunks
+        manifest_dir = os.path.join(self.tmp_dir, "manifests")
+        storage_helper = StorageHelper(self.proc, manifest_dir=manifest_dir)
+        transfers = [(self.__make_file("sample_%d.bam" % i), self.wrk_dir) for i in range(self.NR_FILES)]
+
+        wait_process = self.proc.wait_process
+        def lose_first_chunk(job_name):
+            out = wait_process(job_name)
+            if job_name.endswith("_manifest_0"):
+                for manifest_file in os.listdir(manifest_dir):
+                    os.remove(os.path.join(manifest_dir, manifest_file))
+            return out
+        self.proc.wait_process = lose_first_chunk
+
+        prev_chunk_size = StorageHelper.MANIFEST_CHUNK_SIZE
+        StorageHelper.MANIFEST_CHUNK_SIZE = 4096
+        try:
+            with self.assertRaises(RuntimeError):
+                storage_helper.mv_batch(transfers, job_name="load_input_lost", wait=True, num_retries=0)
+        finally:
+            StorageHelper.MANIFEST_CHUNK_SIZE = prev_chunk_size
+        self.assertEqual(os.listdir(self.wrk_dir), [])
+
+    def test_transferred_files_are_independent_copies(self):
+        # Changing the permissions or content of transferred files must leave the source files untouched
+        src_paths = [self.__make_file("a.txt"), self.__make_file("b.txt")]
+        os.chmod(src_paths[0], 0o644)
+        self.storage_helper.mv(src_paths[0], self.wrk_dir, wait=True)
+        self.storage_helper.mv_batch([(src_paths[1], self.wrk_dir)], wait=True)
+
+        for src_path in src_paths:
+            dest_path = os.path.join(self.wrk_dir, os.path.basename(src_path))
+            self.assertNotEqual(os.stat(dest_path).st_ino, os.stat(src_path).st_ino)
+            os.chmod(dest_path, 0o777)
+            with open(dest_path, "w") as fh:
+                fh.write("modified")
+            self.assertNotEqual(os.stat(src_path).st_mode & 0o777, 0o777)
+            with open(src_path) as fh:
+                self.assertEqual(fh.read(), os.path.basename(src_path))
+
+    def __make_file(self, name):
+        path = os.path.join(self.bucket_dir, name)
+        with open(path, "w") as fh:
+            fh.write(name)
+        return path
+
+if __name__ == "__main__":
+    unittest.main()